@@ -0,0 +1,690 @@
+#
+#
+#   Benchmark
+#   Time stages of the compiler against the sample programs in the data directory
+#
+#   Usage: python benchmark.py scanner|input|classification [directory] [repeat]
+#          python benchmark.py symbols [globals] [repeat]
+#          python benchmark.py incremental [functions] [repeat]
+#          python benchmark.py cache [directory] [repeat]
+#          python benchmark.py vm [size] [repeat]
+#          python benchmark.py bytecode [functions] [repeat]
+#          python benchmark.py optimizer [size] [repeat]
+#          python benchmark.py arrays [size] [repeat]
+#
+#
+
+from __future__ import print_function
+
+import glob
+import io
+import os
+import re
+import sys
+import tempfile
+import timeit
+from lib import util
+from lib import lexical_analyzer
+from lib.bytecode import Bytecode
+from lib.cache import CompileCache
+from lib.driver import compile_files, compile_tree
+from lib.incremental import IncrementalCompiler
+from lib.lexical_analyzer import LexicalAnalyzer
+from lib.optimizer import Optimizer
+from lib.symbol_table import Symbol, SymbolTable
+from lib.virtual_machine import VirtualMachine
+from lib.tokens import IDENTIFIER
+from lib.prettytable import PrettyTable
+
+__author__ = 'Nicholas Pickering'
+
+
+#   Load Sources
+#   Read sample programs into memory, so disk access is not timed
+#
+#   directory - data directory to load, or every data directory if None
+def load_sources(directory=None):
+    pattern = "data/" + (directory if directory else "*") + "/*.txt"
+
+    sources = []
+    for filename in sorted(glob.glob(pattern)):
+        file = open(filename, "r")
+        sources.append([filename, file.read()])
+        file.close()
+
+    return sources
+
+
+#   Time Scanner
+#   Best time, in milliseconds, to tokenize a source with the given scanner
+def time_scanner(source, scanner, repeat):
+    def scan():
+        LexicalAnalyzer(scanner).process_file(io.StringIO(source))
+
+    return min(timeit.repeat(scan, number=1, repeat=repeat)) * 1000
+
+
+#   Benchmark Scanner
+#   Compare each scanner backend to the character scanner, checking they all emit the same tokens
+def benchmark_scanner(directory=None, repeat=5):
+    sources = load_sources(directory)
+    scanners = LexicalAnalyzer.scanners
+
+    # a large generated input, made from every sample glued together
+    sources.append(["(all samples x 50)", "\n".join(source for filename, source in sources) * 50])
+
+    columns = ["file", "tokens"]
+    for scanner in scanners:
+        columns.append(scanner + " ms")
+    for scanner in scanners[1:]:
+        columns.append(scanner + " speedup")
+
+    table = PrettyTable(columns)
+    table.align["file"] = "l"
+
+    for filename, source in sources:
+        tokens = LexicalAnalyzer("character").process_file(io.StringIO(source))
+        for scanner in scanners[1:]:
+            if LexicalAnalyzer(scanner).process_file(io.StringIO(source)) != tokens:
+                util.error("Scanners character and " + scanner + " disagree on " + filename)
+
+        times = [time_scanner(source, scanner, repeat) for scanner in scanners]
+
+        table.add_row([filename, len(tokens)] + ["%.3f" % time for time in times] +
+                      ["%.2fx" % (times[0] / time) for time in times[1:]])
+
+    print(table)
+
+
+#   Time Input
+#   Best time, in milliseconds, to stream the tokens of a file read the given way
+def time_input(filename, input_mode, repeat):
+    def scan():
+        lexical_analyzer = LexicalAnalyzer("regex")
+
+        if input_mode == "mmap":
+            tokens = lexical_analyzer.iter_mapped_tokens(filename)
+        else:
+            file = open(filename, "r")
+            tokens = lexical_analyzer.iter_tokens(file)
+
+        for token in tokens:
+            pass
+
+    return min(timeit.repeat(scan, number=1, repeat=repeat)) * 1000
+
+
+#   Benchmark Input
+#   Compare streaming tokens from a text file to streaming them from a memory map, both with the regex scanner
+def benchmark_input(directory=None, repeat=5):
+    filenames = sorted(glob.glob("data/" + (directory if directory else "*") + "/*.txt"))
+
+    # a large generated input, made from every sample glued together
+    sources = [source for filename, source in load_sources(directory)]
+    large_file, large_filename = tempfile.mkstemp(suffix=".txt")
+    os.write(large_file, ("\n".join(sources) * 500).encode("ascii"))
+    os.close(large_file)
+    filenames.append(large_filename)
+
+    table = PrettyTable(["file", "bytes", "text ms", "mmap ms", "speedup"])
+    table.align["file"] = "l"
+
+    try:
+        for filename in filenames:
+            text_time = time_input(filename, "text", repeat)
+            mmap_time = time_input(filename, "mmap", repeat)
+            label = "(all samples x 500)" if filename == large_filename else filename
+
+            table.add_row([label, os.path.getsize(filename), "%.3f" % text_time, "%.3f" % mmap_time,
+                           "%.2fx" % (text_time / mmap_time)])
+    finally:
+        os.remove(large_filename)
+
+    print(table)
+
+
+#   Benchmark Classification
+#   Time the lookups the scanners classify characters and words with, against the list scans they replaced
+def benchmark_classification(directory=None, repeat=5):
+    sources = [source for filename, source in load_sources(directory)]
+    chars = list("".join(sources))
+    words = TOKEN_WORDS.findall(" ".join(sources))
+
+    keywords = LexicalAnalyzer.keywords
+    operators = LexicalAnalyzer.operators + LexicalAnalyzer.extendable_operators
+    keyword_kinds = lexical_analyzer.KEYWORD_KINDS
+    start_types = lexical_analyzer.START_TOKEN_TYPES
+
+    steps = [
+        ["keyword list", words, lambda: [word in keywords for word in words]],
+        ["keyword kinds", words, lambda: [keyword_kinds.get(word, IDENTIFIER) for word in words]],
+        ["operator list", chars, lambda: [char in operators for char in chars]],
+        ["start token types", chars, lambda: [start_types.get(char) for char in chars]],
+    ]
+
+    table = PrettyTable(["step", "lookups", "ms", "ns per lookup"])
+    table.align["step"] = "l"
+
+    for name, items, step in steps:
+        time = min(timeit.repeat(step, number=1, repeat=repeat))
+        table.add_row([name, len(items), "%.3f" % (time * 1000), "%.1f" % (time * 1e9 / max(len(items), 1))])
+
+    print(table)
+
+
+#   Declare Symbol
+#   Add an int variable to a symbol table
+def declare_symbol(table, identifier, scope):
+    symbol = Symbol()
+    symbol.create(identifier, "int", None, scope, False)
+    table.add_symbol(symbol)
+
+
+#   Nest Blocks
+#   Parse-like workload over a symbol table: functions whose bodies nest blocks deeply, declaring and looking up
+#   symbols in each block and tearing each scope down on the way out
+def nest_blocks(table, functions, depth):
+    for function in range(functions):
+        for scope in range(1, depth + 1):
+            for index in range(4):
+                declare_symbol(table, "v" + str(index), scope)
+
+            table.var_exists("g" + str(function), scope)
+            table.var_exists("v0", scope)
+
+        for scope in range(depth, 0, -1):
+            table.destroy_scope(scope)
+
+
+#   Benchmark Symbols
+#   Time nested blocks against a symbol table, as the number of globals and the depth of the blocks grow
+#
+#   globals_count - largest number of globals, doubled up to from a thousand
+def benchmark_symbols(globals_count=None, repeat=5):
+    globals_count = int(globals_count) if globals_count else 16000
+    functions = 100
+
+    table = PrettyTable(["globals", "block depth", "scopes popped", "ms", "us per scope"])
+
+    sizes = [1000]
+    while sizes[-1] * 2 <= globals_count:
+        sizes.append(sizes[-1] * 2)
+
+    for size in sizes:
+        symbol_table = SymbolTable()
+        for index in range(size):
+            declare_symbol(symbol_table, "g" + str(index), 0)
+
+        for depth in [10, 100]:
+            time = min(timeit.repeat(lambda: nest_blocks(symbol_table, functions, depth), number=1, repeat=repeat))
+            scopes = functions * depth
+            table.add_row([size, depth, scopes, "%.3f" % (time * 1000), "%.2f" % (time * 1e6 / scopes)])
+
+    print(table)
+
+
+#   Letters
+#   Spell a number in letters, C- identifiers having no digits
+def letters(number):
+    spelled = ""
+    while True:
+        spelled = chr(ord("a") + number % 26) + spelled
+        number //= 26
+        if number == 0:
+            return spelled
+
+
+#   Generate Program
+#   A large C- program of small functions, with the constant of one function changed to stand in for an edit
+def generate_program(functions, edited=None, constant=2):
+    parts = ["int total;\n\n"]
+    for function in range(functions):
+        parts.append(
+            "int f" + letters(function) + "(int a[], int n)\n"
+            "{\n"
+            "    int i; int s;\n"
+            "    i = 0; s = 0;\n"
+            "    while (i < n) {\n"
+            "        s = s + a[i] * " + str(constant + 1 if function == edited else constant) + ";\n"
+            "        i = i + 1;\n"
+            "    }\n"
+            "    return s;\n"
+            "}\n\n")
+
+    parts.append("void main(void)\n{\n    int x[10];\n    total = fa(x, 10);\n}\n")
+
+    return "".join(parts)
+
+
+#   Benchmark Incremental
+#   Time recompiling a large program after a one line edit, incrementally and from scratch
+#
+#   functions - number of functions in the program
+def benchmark_incremental(functions=None, repeat=5):
+    functions = int(functions) if functions else 2000
+    original = generate_program(functions)
+    edits = [
+        ["constant in the middle", generate_program(functions, functions // 2)],
+        ["statement added", original.replace("    return s;\n", "    total = s;\n    return s;\n", 1)],
+        ["global added", "int extra;\n" + original],
+    ]
+
+    table = PrettyTable(["edit", "lines", "from scratch ms", "incremental ms", "speedup"])
+    table.align["edit"] = "l"
+
+    stdout = sys.stdout
+    for name, edited in edits:
+        def from_scratch():
+            analyzer = LexicalAnalyzer("regex")
+            return compile_tree(analyzer.process_file(io.StringIO(edited)), analyzer)
+
+        # time each recompile from a compiler which has just compiled the original
+        compilers = []
+        for index in range(repeat):
+            compiler = IncrementalCompiler("regex")
+            sys.stdout = io.StringIO()
+            compiler.compile(original)
+            sys.stdout = stdout
+            compilers.append(compiler)
+
+        sys.stdout = io.StringIO()
+        try:
+            scratch_time = min(timeit.repeat(from_scratch, number=1, repeat=repeat))
+            incremental_times = [timeit.timeit(lambda: compiler.compile(edited), number=1) for compiler in compilers]
+            if compilers[0].compile(edited) != from_scratch():
+                util.error("Incremental and from scratch compiles disagree after: " + name)
+        finally:
+            sys.stdout = stdout
+
+        incremental_time = min(incremental_times)
+        table.add_row([name, edited.count("\n"), "%.1f" % (scratch_time * 1000), "%.1f" % (incremental_time * 1000),
+                       "%.0fx" % (scratch_time / incremental_time)])
+
+    print(table)
+
+
+#   Benchmark Cache
+#   Time compiling the sample programs with an empty compile cache, then again with every program cached
+def benchmark_cache(directory=None, repeat=5):
+    filenames = sorted(glob.glob("data/" + (directory if directory else "*") + "/*.txt"))
+
+    table = PrettyTable(["frontend", "files", "uncached ms", "cold ms", "warm ms", "speedup"])
+
+    for frontend in ["parser", "tree"]:
+        def uncached():
+            return compile_files(filenames, 1, "regex", "text", frontend)
+
+        cold_times = []
+        warm_times = []
+        for index in range(repeat):
+            cache_directory = tempfile.mkdtemp()
+            try:
+                cache = CompileCache(cache_directory)
+                cold_times.append(timeit.timeit(lambda: compile_files(filenames, 1, "regex", "text", frontend, cache),
+                                                number=1))
+                warm_times.append(timeit.timeit(lambda: compile_files(filenames, 1, "regex", "text", frontend, cache),
+                                                number=1))
+
+                outputs = [(compile_result.result, compile_result.diagnostics, compile_result.quadruples)
+                           for compile_result in compile_files(filenames, 1, "regex", "text", frontend, cache)]
+                if outputs != [(compile_result.result, compile_result.diagnostics, compile_result.quadruples)
+                               for compile_result in uncached()]:
+                    util.error("Cached and uncached compiles disagree for the " + frontend + " frontend")
+            finally:
+                for name in os.listdir(cache_directory):
+                    os.remove(os.path.join(cache_directory, name))
+                os.rmdir(cache_directory)
+
+        uncached_time = min(timeit.repeat(uncached, number=1, repeat=repeat))
+        warm_time = min(warm_times)
+        table.add_row([frontend, len(filenames), "%.1f" % (uncached_time * 1000), "%.1f" % (min(cold_times) * 1000),
+                       "%.1f" % (warm_time * 1000), "%.1fx" % (uncached_time / warm_time)])
+
+    print(table)
+
+
+# C- programs run by the vm benchmark, each taking a size
+VM_PROGRAMS = [
+    ["selection sort", """
+int a[%(size)d];
+
+void sort(int a[], int low, int high)
+{
+    int i; int j; int k; int t;
+    i = low;
+    while (i < high - 1) {
+        k = i;
+        j = i + 1;
+        while (j < high) {
+            if (a[j] < a[k]) k = j;
+            j = j + 1;
+        }
+        t = a[k]; a[k] = a[i]; a[i] = t;
+        i = i + 1;
+    }
+}
+
+void main(void)
+{
+    int i; int seed;
+    i = 0; seed = 7;
+    while (i < %(size)d) {
+        seed = seed * 1103 + 12345;
+        seed = seed - seed / 65536 * 65536;
+        a[i] = seed;
+        i = i + 1;
+    }
+    sort(a, 0, %(size)d);
+    output(a[0]);
+}
+"""],
+    ["recursive gcd", """
+int gcd(int u, int v)
+{
+    if (v == 0) return u;
+    else return gcd(v, u - u / v * v);
+}
+
+void main(void)
+{
+    int i; int total;
+    i = 1; total = 0;
+    while (i < %(size)d * 10) {
+        total = total + gcd(i * 7919, 104729);
+        i = i + 1;
+    }
+    output(total);
+}
+"""],
+    ["helper calls", """
+int square(int x)
+{
+    return x * x;
+}
+
+int clamp(int x, int high)
+{
+    if (x > high) return high;
+    return x;
+}
+
+void main(void)
+{
+    int i; int total;
+    i = 0; total = 0;
+    while (i < %(size)d * 10) {
+        total = total + clamp(square(i - i / 100 * 100), 5000);
+        i = i + 1;
+    }
+    output(total);
+}
+"""],
+    ["nested loops", """
+void main(void)
+{
+    int i; int j; int total;
+    i = 0; total = 0;
+    while (i < %(size)d) {
+        j = 0;
+        while (j < %(size)d) {
+            total = total + i * j - (i + j) / 3;
+            j = j + 1;
+        }
+        i = i + 1;
+    }
+    output(total);
+}
+"""],
+]
+
+
+# array heavy C- programs for the quadruple interpreter, their sizes filled in by compile_vm_program:
+# size - side of a square matrix, cells - cells of the matrix, length - length of a list to sort
+ARRAY_PROGRAMS = [
+    ["bubble sort", """
+int a[%(length)d];
+
+void main(void)
+{
+    int i; int j; int t; int seed;
+    i = 0; seed = 11;
+    while (i < %(length)d) {
+        seed = seed * 1103 + 12345;
+        seed = seed - seed / 65536 * 65536;
+        a[i] = seed;
+        i = i + 1;
+    }
+    i = 0;
+    while (i < %(length)d - 1) {
+        j = 0;
+        while (j < %(length)d - 1 - i) {
+            if (a[j] > a[j + 1]) {
+                t = a[j]; a[j] = a[j + 1]; a[j + 1] = t;
+            }
+            j = j + 1;
+        }
+        i = i + 1;
+    }
+    output(a[0]); output(a[%(length)d - 1]);
+}
+"""],
+    ["matrix multiply", """
+int a[%(cells)d]; int b[%(cells)d]; int c[%(cells)d];
+
+void main(void)
+{
+    int i; int j; int k; int n; int sum;
+    n = %(size)d;
+    i = 0;
+    while (i < n * n) {
+        a[i] = i - i / 7 * 7;
+        b[i] = i - i / 5 * 5;
+        i = i + 1;
+    }
+    i = 0;
+    while (i < n) {
+        j = 0;
+        while (j < n) {
+            sum = 0;
+            k = 0;
+            while (k < n) {
+                sum = sum + a[i * n + k] * b[k * n + j];
+                k = k + 1;
+            }
+            c[i * n + j] = sum;
+            j = j + 1;
+        }
+        i = i + 1;
+    }
+    output(c[0]); output(c[n * n - 1]);
+}
+"""],
+    ["prefix sums", """
+int a[%(cells)d]; int s[%(cells)d];
+
+void main(void)
+{
+    int i; int round; int total;
+    i = 0;
+    while (i < %(cells)d) {
+        a[i] = i - i / 3 * 3;
+        i = i + 1;
+    }
+    round = 0; total = 0;
+    while (round < 4) {
+        s[0] = a[0];
+        i = 1;
+        while (i < %(cells)d) {
+            s[i] = s[i - 1] + a[i];
+            i = i + 1;
+        }
+        i = 1;
+        while (i < %(cells)d - 1) {
+            a[i] = (s[i + 1] - s[i - 1]) / 2;
+            i = i + 1;
+        }
+        total = total + s[%(cells)d - 1];
+        round = round + 1;
+    }
+    output(total);
+}
+"""],
+]
+
+
+#   Compile VM Program
+#   The quadruples of one of the VM_PROGRAMS or ARRAY_PROGRAMS
+def compile_vm_program(name, source, size):
+    analyzer = LexicalAnalyzer("regex")
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        source = source % {"size": size, "cells": size * size, "length": size * 4}
+        result, quadruples = compile_tree(analyzer.process_file(io.StringIO(source)), analyzer)
+    finally:
+        sys.stdout = stdout
+
+    if result != "ACCEPT":
+        util.error("The " + name + " program was rejected", True)
+
+    return quadruples
+
+
+#   Benchmark VM
+#   Time the VirtualMachine decoding and running some C- programs, with the instructions it runs per second
+#
+#   size - size of the problem each program solves
+def benchmark_vm(size=None, repeat=5):
+    size = int(size) if size else 300
+
+    table = PrettyTable(["program", "quadruples", "instructions run", "decode ms", "run ms", "M instructions/s"])
+    table.align["program"] = "l"
+
+    for name, source in VM_PROGRAMS:
+        quadruples = compile_vm_program(name, source, size)
+
+        decode_time = min(timeit.repeat(lambda: VirtualMachine(quadruples), number=1, repeat=repeat))
+
+        machine = VirtualMachine(quadruples, output=lambda value: None)
+        run_time = min(timeit.repeat(machine.run, number=1, repeat=repeat))
+
+        table.add_row([name, len(quadruples), machine.steps, "%.2f" % (decode_time * 1000),
+                       "%.1f" % (run_time * 1000), "%.2f" % (machine.steps / run_time / 1e6)])
+
+    print(table)
+
+
+#   Benchmark Optimizer
+#   Run the VM_PROGRAMS at each optimization level, checking they print the same at every level
+def benchmark_optimizer(size=None, repeat=5):
+    compare_levels(VM_PROGRAMS, int(size) if size else 300, repeat)
+
+
+#   Benchmark Arrays
+#   Run the ARRAY_PROGRAMS at each optimization level, checking they print the same at every level
+def benchmark_arrays(size=None, repeat=5):
+    compare_levels(ARRAY_PROGRAMS, int(size) if size else 20, repeat)
+
+
+#   Compare Levels
+#   Print a table of the quadruples, instructions run, stack used and times of programs at each optimization level
+def compare_levels(programs, size, repeat):
+    table = PrettyTable(["program", "level", "quadruples", "instructions run", "stack words", "optimize ms",
+                         "run ms"])
+    table.align["program"] = "l"
+
+    for name, source in programs:
+        quadruples = compile_vm_program(name, source, size)
+        expected = None
+
+        for level in [0, 1, 2]:
+            optimize_time = min(timeit.repeat(lambda: Optimizer(level).optimize(quadruples), number=1, repeat=repeat))
+            optimized = Optimizer(level).optimize(quadruples)
+
+            printed = []
+            machine = VirtualMachine(optimized, output=printed.append)
+            machine.run()
+            if expected is None:
+                expected = printed
+            elif printed != expected:
+                util.error("The " + name + " program prints differently at level " + str(level))
+
+            machine.output = lambda value: None
+            run_time = min(timeit.repeat(machine.run, number=1, repeat=repeat))
+
+            table.add_row([name, level, len(optimized), machine.steps, machine.stack_peak,
+                           "%.2f" % (optimize_time * 1000),
+                           "%.1f" % (run_time * 1000)])
+
+    print(table)
+
+
+#   Quadruple Memory
+#   Bytes taken by quadruples in list form, counting each list, string and int once
+def quadruple_memory(quadruples):
+    seen = set()
+    size = sys.getsizeof(quadruples)
+
+    for quadruple in quadruples:
+        size += sys.getsizeof(quadruple)
+        for item in quadruple:
+            if id(item) not in seen:
+                seen.add(id(item))
+                size += sys.getsizeof(item)
+
+    return size
+
+
+#   Benchmark Bytecode
+#   Compare the memory of the quadruples of a large program in list form and as Bytecode, with the time to convert
+#
+#   functions - number of functions in the program
+def benchmark_bytecode(functions=None, repeat=5):
+    functions = int(functions) if functions else 2000
+
+    analyzer = LexicalAnalyzer("regex")
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        result, quadruples = compile_tree(analyzer.process_file(io.StringIO(generate_program(functions))), analyzer)
+    finally:
+        sys.stdout = stdout
+
+    bytecode = Bytecode.from_quadruples(quadruples)
+    if bytecode.quadruples() != quadruples:
+        util.error("Bytecode does not decode to the quadruples it encoded")
+
+    encode_time = min(timeit.repeat(lambda: Bytecode.from_quadruples(quadruples), number=1, repeat=repeat))
+    decode_time = min(timeit.repeat(bytecode.quadruples, number=1, repeat=repeat))
+
+    table = PrettyTable(["form", "quadruples", "bytes", "bytes per quadruple"])
+    for form, size in [["lists", quadruple_memory(quadruples)], ["bytecode", bytecode.size()]]:
+        table.add_row([form, len(quadruples), size, "%.1f" % (size / float(len(quadruples)))])
+
+    print(table)
+    print("encode %.1f ms, decode %.1f ms" % (encode_time * 1000, decode_time * 1000))
+
+
+TOKEN_WORDS = re.compile(r"[A-Za-z]+")
+
+benchmarks = {
+    "scanner": benchmark_scanner,
+    "input": benchmark_input,
+    "classification": benchmark_classification,
+    "symbols": benchmark_symbols,
+    "incremental": benchmark_incremental,
+    "cache": benchmark_cache,
+    "vm": benchmark_vm,
+    "bytecode": benchmark_bytecode,
+    "optimizer": benchmark_optimizer,
+    "arrays": benchmark_arrays,
+}
+
+if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+    util.error("Specify a benchmark: " + ", ".join(sorted(benchmarks)), True)
+
+arguments = sys.argv[2:]
+if len(arguments) > 1:
+    arguments[1] = int(arguments[1])
+
+benchmarks[sys.argv[1]](*arguments)
@@ -0,0 +1,151 @@
+#
+#
+#   Bytecode
+#   This module contains a compact encoding of quadruples, in array columns rather than a list per quadruple
+#
+#   Each quadruple is an opcode number and three operand words. An operand word holds a tag in its low bits and a
+#   number above them:
+#       EMPTY       the empty operand ""
+#       TEMP        the temp _tN, as N
+#       NAME        a variable or function, as its index in the name table
+#       CONSTANT    a number literal, as its index in the constant pool
+#       INTEGER     a Python int, such as a branch target or a count of parameters, as itself
+#
+#   The quadruple index is the position of the quadruple, counting from 1, so it is not stored. Decoding gives back
+#   exactly the quadruples which were encoded.
+#
+#
+from array import array
+
+# opcodes of the quadruples, numbered by their place in the list
+# An opcode which is not listed is added to the opcode table of the bytecode holding it.
+OPCODES = [
+    "func", "end", "param", "alloc", "block",
+    "add", "sub", "mult", "div", "comp",
+    "BR", "BRGT", "BRGEQ", "BRLT", "BRLEQ", "BREQ", "BRNEQ",
+    "disp", "assign", "arg", "call", "return",
+]
+
+# operand tags
+EMPTY, TEMP, NAME, CONSTANT, INTEGER = range(5)
+TAG_BITS = 3
+TAG_MASK = (1 << TAG_BITS) - 1
+
+# typecode of the operand columns
+OPERAND_TYPECODE = "i"
+
+
+class Bytecode(object):
+
+    def __init__(self):
+        self.opcodes = array("B")
+        self.operands1 = array(OPERAND_TYPECODE)
+        self.operands2 = array(OPERAND_TYPECODE)
+        self.results = array(OPERAND_TYPECODE)
+
+        self.opcode_names = list(OPCODES)  # opcode number -> opcode
+        self.opcode_numbers = dict((opcode, number) for number, opcode in enumerate(OPCODES))
+        self.names = []  # name table
+        self.name_indices = {}
+        self.constants = []  # constant pool, the literals as written
+        self.constant_indices = {}
+
+    # Encode a list of quadruples
+    @classmethod
+    def from_quadruples(cls, quadruples):
+        bytecode = cls()
+        for index, opcode, operand1, operand2, result in quadruples:
+            if index != len(bytecode) + 1:
+                raise ValueError("quadruple " + str(index) + " is out of order")
+            bytecode.append(opcode, operand1, operand2, result)
+
+        return bytecode
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    # the quadruple at a position, counting from 0, in list form
+    def __getitem__(self, position):
+        return [position + 1, self.opcode_names[self.opcodes[position]], self.decode(self.operands1[position]),
+                self.decode(self.operands2[position]), self.decode(self.results[position])]
+
+    def append(self, opcode, operand1, operand2, result):
+        number = self.opcode_numbers.get(opcode)
+        if number is None:
+            number = self.opcode_numbers[opcode] = len(self.opcode_names)
+            self.opcode_names.append(opcode)
+
+        self.opcodes.append(number)
+        self.operands1.append(self.encode(operand1))
+        self.operands2.append(self.encode(operand2))
+        self.results.append(self.encode(result))
+
+    # Decode every quadruple, in list form
+    def quadruples(self):
+        return [self[position] for position in range(len(self))]
+
+    # The bytecode as a tuple of bytes, ints and lists of strings, which marshal can store
+    def state(self):
+        return (self.opcodes.tobytes(), self.operands1.tobytes(), self.operands2.tobytes(), self.results.tobytes(),
+                self.opcode_names, self.names, self.constants)
+
+    # Bytecode from a tuple made by state
+    @classmethod
+    def from_state(cls, state):
+        bytecode = cls()
+        opcodes, operands1, operands2, results, bytecode.opcode_names, bytecode.names, bytecode.constants = state
+
+        bytecode.opcodes.frombytes(opcodes)
+        bytecode.operands1.frombytes(operands1)
+        bytecode.operands2.frombytes(operands2)
+        bytecode.results.frombytes(results)
+
+        bytecode.opcode_numbers = dict((opcode, number) for number, opcode in enumerate(bytecode.opcode_names))
+        bytecode.name_indices = dict((name, index) for index, name in enumerate(bytecode.names))
+        bytecode.constant_indices = dict((constant, index) for index, constant in enumerate(bytecode.constants))
+
+        return bytecode
+
+    # bytes taken by the columns and tables, not counting the strings the tables share with the quadruples
+    def size(self):
+        columns = [self.opcodes, self.operands1, self.operands2, self.results]
+
+        return sum(column.itemsize * len(column) for column in columns) + \
+            8 * (len(self.names) + len(self.constants) + len(self.opcode_names))
+
+    # the operand word of an operand
+    def encode(self, operand):
+        if isinstance(operand, int):
+            return operand << TAG_BITS | INTEGER
+        if operand == "":
+            return EMPTY
+        if operand.startswith("_t") and operand[2:].isdigit() and str(int(operand[2:])) == operand[2:]:
+            return int(operand[2:]) << TAG_BITS | TEMP
+
+        if operand[0].isdigit() or operand[0] == "-":
+            indices, table, tag = self.constant_indices, self.constants, CONSTANT
+        else:
+            indices, table, tag = self.name_indices, self.names, NAME
+
+        index = indices.get(operand)
+        if index is None:
+            index = indices[operand] = len(table)
+            table.append(operand)
+
+        return index << TAG_BITS | tag
+
+    # the operand of an operand word
+    def decode(self, word):
+        tag = word & TAG_MASK
+        value = word >> TAG_BITS
+
+        if tag == TEMP:
+            return "_t" + str(value)
+        elif tag == NAME:
+            return self.names[value]
+        elif tag == CONSTANT:
+            return self.constants[value]
+        elif tag == INTEGER:
+            return value
+
+        return ""
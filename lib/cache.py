@@ -0,0 +1,192 @@
+#
+#
+#   Compile Cache
+#   This module keeps the results of compiling C- files on disk, so unchanged files need not be compiled again
+#
+#   An entry is keyed by a hash of the bytes of the file, the options it was compiled with and a fingerprint of the
+#   compiler itself, so changing any of them is a miss. Entries are marshalled and compressed, and written whole so
+#   worker processes can share a directory. Once the directory grows past its size limit, the entries used least
+#   recently are removed. The quadruples are kept as Bytecode, see lib/bytecode.py.
+#
+#
+import glob
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import zlib
+from lib.bytecode import Bytecode
+
+# version of the entry format, part of every key
+CACHE_FORMAT = 2
+
+# first bytes of every entry
+MAGIC = b"CMC2"
+
+ENTRY_SUFFIX = ".entry"
+
+# bytes of entries kept by default
+DEFAULT_CACHE_SIZE = 64 << 20
+
+# fingerprint of the compiler, worked out once per process
+fingerprint = None
+
+
+#   Compiler Fingerprint
+#   Hash of the source of the compiler and the Python running it, which changes whenever compiled output may
+def compiler_fingerprint():
+    global fingerprint
+
+    if fingerprint is None:
+        digest = hashlib.sha256()
+        digest.update(("%d %s" % (CACHE_FORMAT, sys.version)).encode("utf-8"))
+
+        for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+            file = open(path, "rb")
+            digest.update(os.path.basename(path).encode("utf-8"))
+            digest.update(file.read())
+            file.close()
+
+        fingerprint = digest.hexdigest()
+
+    return fingerprint
+
+
+#   Cache Entry
+#   What compiling a file produced
+#   The token stream is stored only so an entry can be inspected, a hit is rebuilt from the result, diagnostics and
+#   quadruples alone.
+class CacheEntry(object):
+
+    __slots__ = ("result", "diagnostics", "quadruples", "token_values", "token_kinds")
+
+    # token_values, token_kinds - the token stream, as a list of values and a byte string of kinds
+    def __init__(self, result, diagnostics, quadruples, token_values, token_kinds):
+        self.result = result
+        self.diagnostics = diagnostics
+        self.quadruples = quadruples
+        self.token_values = token_values
+        self.token_kinds = token_kinds
+
+
+#   Serialize
+#   Compact bytes of a CacheEntry
+def serialize(entry):
+    # quadruples which do not encode, such as those of a parse which failed part way, are kept as they are
+    try:
+        quadruples = Bytecode.from_quadruples(entry.quadruples or []).state()
+    except (ValueError, TypeError, AttributeError, OverflowError):
+        quadruples = entry.quadruples
+
+    payload = [entry.result, entry.diagnostics, quadruples, entry.token_values, entry.token_kinds]
+
+    return MAGIC + zlib.compress(marshal.dumps(payload))
+
+
+#   Deserialize
+#   The CacheEntry in bytes written by serialize, or None if they are not one
+def deserialize(data):
+    if not data.startswith(MAGIC):
+        return None
+
+    try:
+        result, diagnostics, quadruples, token_values, token_kinds = marshal.loads(zlib.decompress(data[len(MAGIC):]))
+        if isinstance(quadruples, tuple):
+            quadruples = Bytecode.from_state(quadruples).quadruples()
+    except (ValueError, TypeError, EOFError, IndexError, zlib.error):
+        return None
+
+    return CacheEntry(result, diagnostics, quadruples, token_values, token_kinds)
+
+
+class CompileCache(object):
+
+    # directory - where entries are kept, created if need be
+    # limit - bytes of entries to keep
+    def __init__(self, directory, limit=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.limit = limit
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    # Key of the entry for a source compiled with the given options
+    #
+    # source - bytes of the file
+    # options - strings the output depends on, such as the scanner
+    def key(self, source, options):
+        digest = hashlib.sha256()
+        digest.update(compiler_fingerprint().encode("utf-8"))
+        digest.update("\0".join(options).encode("utf-8") + b"\0")
+        digest.update(source)
+
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    # The entry stored under a key, or None on a miss
+    def load(self, key):
+        path = self.path(key)
+
+        try:
+            file = open(path, "rb")
+            try:
+                data = file.read()
+            finally:
+                file.close()
+
+            # mark the entry used, for eviction
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+
+        return deserialize(data)
+
+    # Store an entry under a key, replacing the file whole so readers never see part of it
+    def store(self, key, entry):
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(serialize(entry))
+            os.replace(temporary, self.path(key))
+        except (IOError, OSError):
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    # Remove the least recently used entries until the entries fit the size limit, returning how many were removed
+    def evict(self):
+        entries = []
+        total = 0
+
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+
+            path = os.path.join(self.directory, name)
+            try:
+                status = os.stat(path)
+            except OSError:
+                continue
+
+            entries.append((status.st_mtime, status.st_size, path))
+            total += status.st_size
+
+        entries.sort()
+
+        removed = 0
+        for modified, size, path in entries:
+            if total <= self.limit:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+            total -= size
+            removed += 1
+
+        return removed
@@ -0,0 +1,262 @@
+#
+#
+#   Code Generator
+#   This module contains a walk over the abstract syntax tree generating quadruples
+#
+#   The quadruples use the opcodes of the Parser, with every operand taken from the tree:
+#       func name type params / end func name    function, with its number of parameters
+#       param "" "" name / alloc size "" name    parameter, and storage for a parameter or variable
+#       block / end block                        nested compound statement
+#       add, sub, mult, div a b t                t = a op b
+#       comp a b t                               compare a with b, for the branch which follows
+#       BRGT, BRGEQ, BRLT, BRLEQ, BREQ, BRNEQ t "" i    branch to quadruple i when the comparison t holds
+#       BR "" "" i                               branch to quadruple i
+#       disp array offset t                      t is the element of the array, offset bytes in
+#       assign a "" x                            x = a
+#       arg "" "" a / call name args t           pass an argument, then call, leaving the result in t
+#       return "" "" a                           return a, or nothing when a is empty
+#
+#
+from __future__ import print_function
+from array import array
+from lib import util
+from lib.syntax_tree import FunctionDeclaration, CompoundStatement, ExpressionStatement, EmptyStatement, \
+    SelectionStatement, IterationStatement, ReturnStatement, Assignment, BinaryOperation, Variable, Call, Number, \
+    RELATIONAL_OPERATORS
+
+# size of an int or float
+WORD_SIZE = 4
+
+# opcodes of the arithmetic operators
+ARITHMETIC_OPCODES = {
+    "+": "add",
+    "-": "sub",
+    "*": "mult",
+    "/": "div",
+}
+
+# opcodes whose result is the index of the quadruple to branch to
+BRANCH_OPCODES = frozenset(["BR", "BRGT", "BRGEQ", "BRLT", "BRLEQ", "BREQ", "BRNEQ"])
+
+# opcodes of the branches taken when a comparison does not hold, by relational operator
+BRANCH_UNLESS_OPCODES = {
+    "<=": "BRGT",
+    "<": "BRGEQ",
+    ">": "BRLEQ",
+    ">=": "BRLT",
+    "==": "BRNEQ",
+    "!=": "BREQ",
+}
+
+
+class CodeGenerator(object):
+
+    def __init__(self):
+        self.quadruples = []  # generated opcodes
+        self.quadruple_tokens = array("l")  # index of the token of the node each quadruple was generated from
+        self.temps = 0  # number of temporary variables used by the function being generated
+
+        # statement and expression nodes, by class, to the method which generates them
+        self.generators = {
+            CompoundStatement: self.compound_statement,
+            ExpressionStatement: self.expression_statement,
+            EmptyStatement: self.empty_statement,
+            SelectionStatement: self.selection_statement,
+            IterationStatement: self.iteration_statement,
+            ReturnStatement: self.return_statement,
+            Assignment: self.assignment,
+            BinaryOperation: self.binary_operation,
+            Variable: self.variable,
+            Call: self.call,
+            Number: self.number,
+        }
+
+    # Generate the quadruples of a Program, returning them
+    def generate(self, program):
+        for declaration in program.declarations:
+            self.declaration(declaration)
+
+        return self.quadruples
+
+    #
+    #   Declarations
+    #
+
+    # generate a top level declaration
+    def declaration(self, declaration):
+        if isinstance(declaration, FunctionDeclaration):
+            self.function_declaration(declaration)
+        else:
+            self.variable_declaration(declaration)
+
+    def variable_declaration(self, declaration):
+        self.add_quadruple("alloc", self.calculate_size(declaration.type, declaration.size), "",
+                           declaration.identifier, declaration)
+
+    # temporary variables are local to a function, so each function numbers its own from _t0
+    def function_declaration(self, declaration):
+        self.temps = 0
+        self.add_quadruple("func", declaration.identifier, declaration.type, len(declaration.parameters), declaration)
+
+        for parameter in declaration.parameters:
+            self.add_quadruple("param", "", "", parameter.identifier, parameter)
+            self.add_quadruple("alloc", self.calculate_size(parameter.type), "", parameter.identifier, parameter)
+
+        util.run_steps(self.compound_body(declaration.body))
+
+        self.add_quadruple("end", "func", declaration.identifier, "", declaration)
+
+    #
+    #   Statements and Expressions
+    #   These are generators run on an explicit stack, as the TreeParser builds them. Expressions return the
+    #   operand holding their value: a variable, a number or a temporary.
+    #
+
+    # the declarations and statements of a compound statement
+    def compound_body(self, statement):
+        for declaration in statement.declarations:
+            self.variable_declaration(declaration)
+
+        for nested in statement.statements:
+            yield self.visit(nested)
+
+    def compound_statement(self, statement):
+        self.add_quadruple("block", "", "", "", statement)
+        yield self.compound_body(statement)
+        self.add_quadruple("end", "block", "", "", statement)
+
+    def expression_statement(self, statement):
+        yield self.visit(statement.expression)
+
+    def empty_statement(self, statement):
+        return
+        yield  # a generator like the other generators
+
+    def selection_statement(self, statement):
+        branch = yield self.condition(statement.condition)
+        yield self.visit(statement.then_statement)
+
+        if statement.else_statement is not None:
+            jump = self.add_quadruple("BR", "", "", "", statement)
+            self.patch(branch, len(self.quadruples) + 1)
+            yield self.visit(statement.else_statement)
+            self.patch(jump, len(self.quadruples) + 1)
+        else:
+            self.patch(branch, len(self.quadruples) + 1)
+
+    def iteration_statement(self, statement):
+        start = len(self.quadruples) + 1
+        branch = yield self.condition(statement.condition)
+        yield self.visit(statement.body)
+        self.add_quadruple("BR", "", "", start, statement)
+        self.patch(branch, len(self.quadruples) + 1)
+
+    # Generate a condition, returning the branch taken when it does not hold, to be patched with its target
+    def condition(self, expression):
+        if isinstance(expression, BinaryOperation) and expression.operator in RELATIONAL_OPERATORS:
+            operator = expression.operator
+            left = yield self.visit(expression.left)
+            right = yield self.visit(expression.right)
+        else:
+            operator = "!="
+            left = yield self.visit(expression)
+            right = "0"
+
+        comparison = self.new_temp()
+        self.add_quadruple("comp", left, right, comparison, expression)
+
+        return self.add_quadruple(BRANCH_UNLESS_OPCODES[operator], comparison, "", "", expression)
+
+    def return_statement(self, statement):
+        value = ""
+        if statement.expression is not None:
+            value = yield self.visit(statement.expression)
+
+        self.add_quadruple("return", "", "", value, statement)
+
+    def assignment(self, expression):
+        target = yield self.visit(expression.target)
+        value = yield self.visit(expression.value)
+
+        self.add_quadruple("assign", value, "", target, expression)
+
+        return target
+
+    def binary_operation(self, expression):
+        if expression.operator in RELATIONAL_OPERATORS:
+            # a comparison used as a value is 1 when it holds and 0 otherwise
+            result = self.new_temp()
+            self.add_quadruple("assign", "0", "", result, expression)
+            branch = yield self.condition(expression)
+            self.add_quadruple("assign", "1", "", result, expression)
+            self.patch(branch, len(self.quadruples) + 1)
+            return result
+
+        left = yield self.visit(expression.left)
+        right = yield self.visit(expression.right)
+
+        result = self.new_temp()
+        self.add_quadruple(ARITHMETIC_OPCODES[expression.operator], left, right, result, expression)
+
+        return result
+
+    def variable(self, expression):
+        if expression.index is None:
+            return expression.identifier
+
+        index = yield self.visit(expression.index)
+
+        offset = self.new_temp()
+        self.add_quadruple("mult", index, str(WORD_SIZE), offset, expression)
+        element = self.new_temp()
+        self.add_quadruple("disp", expression.identifier, offset, element, expression)
+
+        return element
+
+    def call(self, expression):
+        for argument in expression.arguments:
+            value = yield self.visit(argument)
+            self.add_quadruple("arg", "", "", value, argument)
+
+        result = self.new_temp()
+        self.add_quadruple("call", expression.identifier, len(expression.arguments), result, expression)
+
+        return result
+
+    def number(self, expression):
+        return expression.value
+        yield  # a generator like the other generators
+
+    # the generator for a statement or expression node
+    def visit(self, node):
+        return self.generators[node.__class__](node)
+
+    # generate code, returning the index of the quadruple
+    def add_quadruple(self, opcode, operand1, operand2, result, node):
+        self.quadruples.append([len(self.quadruples)+1, opcode, operand1, operand2, result])
+        self.quadruple_tokens.append(node.token_index)
+
+        return len(self.quadruples)
+
+    # set the target of a branch
+    def patch(self, quadruple_index, target):
+        self.quadruples[quadruple_index-1][4] = target
+
+    # name a new temporary variable
+    def new_temp(self):
+        temp = "_t" + str(self.temps)
+        self.temps += 1
+
+        return temp
+
+    # size of the storage for a variable, array or parameter
+    #
+    # count - number of elements of an array, None for a scalar or a parameter
+    def calculate_size(self, type, count=None):
+        size = 0
+        if type != "void":
+            size = WORD_SIZE
+            if count:
+                size *= count
+
+        return size
@@ -0,0 +1,183 @@
+#
+#
+#   Driver
+#   This module compiles batches of C- files, spreading them across a pool of processes
+#
+#
+from __future__ import print_function
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from lib.cache import CacheEntry
+from lib.lexical_analyzer import LexicalAnalyzer
+from lib.parser import Parser
+from lib.tree_parser import TreeParser
+from lib.semantic_analyzer import SemanticAnalyzer
+from lib.code_generator import CodeGenerator
+
+# front ends which can take a file from tokens to quadruples:
+#   parser - the Parser, checking semantics and generating quadruples as it parses
+#   tree - the TreeParser builds a syntax tree, then semantic analysis and code generation walk it in turn
+FRONTENDS = ["parser", "tree"]
+
+# characters of diagnostics a single compilation may print before it is stopped
+DIAGNOSTICS_LIMIT = 1 << 20
+
+
+#   Diagnostics
+#   Collect what a compilation prints, in place of sys.stdout
+#   A compilation which prints more than the limit is stopped, so a runaway one cannot hold up the batch.
+class Diagnostics(object):
+
+    def __init__(self, limit=DIAGNOSTICS_LIMIT):
+        self.parts = []
+        self.length = 0
+        self.limit = limit
+
+    def write(self, text):
+        self.length += len(text)
+        if self.length > self.limit:
+            raise RuntimeError("Diagnostics limit of " + str(self.limit) + " characters exceeded")
+
+        self.parts.append(text)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+
+#   Compile Result
+#   Outcome of compiling one file, passed back from the worker processes
+class CompileResult(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.result = None  # "ACCEPT" or "REJECT", None if the compilation failed
+        self.quadruples = []
+        self.diagnostics = ""  # everything the compilation printed
+        self.error = None  # traceback of the failure, if the compilation failed
+        self.cached = False  # True if the result came from the compile cache
+
+
+#   Compile File
+#   Lex and parse one C- file, capturing its diagnostics
+#
+#   filename - path to the C- program
+#   scanner - LexicalAnalyzer scanner backend
+#   input_mode - "text" or "mmap", see LexicalAnalyzer.inputs
+#   frontend - one of FRONTENDS
+#   cache - CompileCache to look the file up in and store it to, or None
+def compile_file(filename, scanner="character", input_mode="text", frontend="parser", cache=None):
+    compile_result = CompileResult(filename)
+
+    key = None
+    if cache is not None:
+        try:
+            file = open(filename, "rb")
+            try:
+                key = cache.key(file.read(), [scanner, input_mode, frontend])
+            finally:
+                file.close()
+        except (IOError, OSError):
+            pass  # leave the compilation to report it
+
+        entry = cache.load(key) if key is not None else None
+        if entry is not None:
+            compile_result.result = entry.result
+            compile_result.quadruples = entry.quadruples
+            compile_result.diagnostics = entry.diagnostics
+            compile_result.cached = True
+            return compile_result
+
+    diagnostics = Diagnostics()
+    stdout = sys.stdout
+    sys.stdout = diagnostics
+
+    file = None
+    tokens = None
+
+    try:
+        lexical_analyzer = LexicalAnalyzer(scanner)
+
+        if input_mode == "mmap":
+            tokens = lexical_analyzer.iter_mapped_tokens(filename)
+        else:
+            file = open(filename, "r")
+            tokens = lexical_analyzer.iter_tokens(file)
+
+        if key is not None:
+            # hold on to the token stream, to store it
+            tokens = list(tokens)
+
+        if frontend == "tree":
+            compile_result.result, compile_result.quadruples = compile_tree(tokens, lexical_analyzer)
+        else:
+            parser = Parser.from_iterator(tokens, lexical_analyzer)
+            compile_result.result = parser.parse()
+            compile_result.quadruples = parser.quadruples
+    except Exception:
+        compile_result.error = traceback.format_exc()
+    finally:
+        sys.stdout = stdout
+
+        if file is not None:
+            file.close()
+
+    compile_result.diagnostics = diagnostics.getvalue()
+
+    if key is not None and compile_result.error is None:
+        cache.store(key, CacheEntry(compile_result.result, compile_result.diagnostics, compile_result.quadruples,
+                                    [token.value for token in tokens], bytes(bytearray(token.kind for token in tokens))))
+
+    return compile_result
+
+
+#   Compile Tree
+#   Build the syntax tree of a token stream, then analyze it and generate its quadruples
+#   Returns the ACCEPT/REJECT result and the quadruples, which are empty when the tokens do not parse.
+#
+#   tokens - tokens in source order
+#   lexical_analyzer - analyzer which produced the tokens
+def compile_tree(tokens, lexical_analyzer):
+    program = TreeParser(tokens, lexical_analyzer).parse()
+    if program is None:
+        return "REJECT", []
+
+    accepted = SemanticAnalyzer(lexical_analyzer).analyze(program)
+    quadruples = CodeGenerator().generate(program)
+
+    return "ACCEPT" if accepted else "REJECT", quadruples
+
+
+#   Compile Files
+#   Compile a batch of C- files, returning their results in the order the files were given
+#
+#   filenames - paths to the C- programs
+#   jobs - number of worker processes, None for one per core. A single job compiles in this process
+#   scanner, input_mode, frontend, cache - passed on to compile_file. The cache is trimmed to its size once the
+#   batch is done
+def compile_files(filenames, jobs=None, scanner="character", input_mode="text", frontend="parser", cache=None):
+    filenames = list(filenames)
+    scanners = [scanner] * len(filenames)
+    input_modes = [input_mode] * len(filenames)
+    frontends = [frontend] * len(filenames)
+    caches = [cache] * len(filenames)
+
+    if jobs == 1 or len(filenames) <= 1:
+        compile_results = list(map(compile_file, filenames, scanners, input_modes, frontends, caches))
+    else:
+        # hand files out a few at a time, so thousands of small files do not each pay a round trip
+        workers = jobs or os.cpu_count() or 1
+        chunksize = max(1, len(filenames) // (4 * workers))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            compile_results = list(executor.map(compile_file, filenames, scanners, input_modes, frontends, caches,
+                                                chunksize=chunksize))
+
+    if cache is not None:
+        cache.evict()
+
+    return compile_results
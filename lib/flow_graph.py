@@ -0,0 +1,350 @@
+#
+#
+#   Flow Graph
+#   This module splits the quadruples of a function into basic blocks and works out what is live between them
+#
+#   Quadruples are addressed by their position in the list of the whole program, one less than their index. A
+#   function runs from its func quadruple to its end func quadruple. A basic block is a run of quadruples which
+#   is only entered at its first quadruple and only left at its last. A block dominates another when every path
+#   from the start of the function to the other block passes through it.
+#
+#   The temp a disp leaves is the address of an array element, see lib/virtual_machine.py. Assigning it writes
+#   the element, so it reads the temp rather than writing it.
+#
+#
+from lib.code_generator import BRANCH_OPCODES
+
+# position in a quadruple of each operand the opcode reads, as [index, opcode, operand1, operand2, result]
+READ_OPERANDS = {
+    "add": (2, 3),
+    "sub": (2, 3),
+    "mult": (2, 3),
+    "div": (2, 3),
+    "comp": (2, 3),
+    "assign": (2,),
+    "disp": (2, 3),
+    "arg": (4,),
+    "return": (4,),
+    "BRGT": (2,),
+    "BRGEQ": (2,),
+    "BRLT": (2,),
+    "BRLEQ": (2,),
+    "BREQ": (2,),
+    "BRNEQ": (2,),
+}
+
+# opcodes whose result operand is written
+WRITING_OPCODES = frozenset(["add", "sub", "mult", "div", "comp", "assign", "disp", "call"])
+
+# opcodes which only describe storage or scopes, and run no instruction, along with end block
+DECLARATION_OPCODES = frozenset(["func", "param", "alloc", "block"])
+
+
+#   Is Temp
+#   True if an operand is a temporary variable
+def is_temp(operand):
+    return isinstance(operand, str) and operand.startswith("_t")
+
+
+#   Function Ranges
+#   Positions of the func and end func quadruples of each function
+def function_ranges(quadruples):
+    ranges = []
+    start = None
+
+    for position, quadruple in enumerate(quadruples):
+        if quadruple[1] == "func":
+            start = position
+        elif quadruple[1] == "end" and quadruple[2] == "func" and start is not None:
+            ranges.append((start, position))
+            start = None
+
+    return ranges
+
+
+#   Reference Temps
+#   Temps holding the address of an array element in a function, as left by disp
+def reference_temps(quadruples, start, end):
+    return set(quadruples[position][4] for position in range(start, end + 1) if quadruples[position][1] == "disp")
+
+
+#   Reads
+#   Operands a quadruple reads
+#
+#   references - reference temps of the function, see reference_temps
+def reads(quadruple, references):
+    operands = [quadruple[position] for position in READ_OPERANDS.get(quadruple[1], ())]
+
+    if quadruple[1] != "disp" and quadruple[1] in WRITING_OPCODES and quadruple[4] in references:
+        operands.append(quadruple[4])
+
+    return operands
+
+
+#   Writes
+#   Operand a quadruple writes, or None
+def writes(quadruple, references):
+    if quadruple[1] not in WRITING_OPCODES:
+        return None
+    if quadruple[1] != "disp" and quadruple[4] in references:
+        return None
+
+    return quadruple[4]
+
+
+#   Is Declaration
+#   True if a quadruple only describes storage or scopes
+def is_declaration(quadruple):
+    return quadruple[1] in DECLARATION_OPCODES or (quadruple[1] == "end" and quadruple[2] == "block")
+
+
+#   Branch Target
+#   Position of the quadruple a branch goes to, or None if its target is not a quadruple index
+def branch_target(quadruple):
+    if not isinstance(quadruple[4], int):
+        return None
+
+    return quadruple[4] - 1
+
+
+class BasicBlock(object):
+
+    __slots__ = ("start", "end", "successors", "predecessors", "live_in", "live_out", "dominators")
+
+    # start, end - positions of the first and last quadruples of the block
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.successors = []
+        self.predecessors = []
+        self.live_in = set()  # operands live on entry, once FlowGraph.liveness has run
+        self.live_out = set()  # operands live on exit
+        self.dominators = None  # blocks dominating this one, itself included, once FlowGraph.dominance has run
+
+
+class FlowGraph(object):
+
+    # quadruples - quadruples of the whole program
+    # start, end - positions of the func and end func quadruples of the function
+    def __init__(self, quadruples, start, end):
+        self.quadruples = quadruples
+        self.start = start
+        self.end = end
+        self.references = reference_temps(quadruples, start, end)
+        self.blocks = []  # in order of their quadruples
+        self.block_at = {}  # position of the first quadruple of a block -> block
+
+        self.build()
+
+    def build(self):
+        quadruples = self.quadruples
+
+        leaders = set([self.start])
+        for position in range(self.start, self.end + 1):
+            opcode = quadruples[position][1]
+            if opcode in BRANCH_OPCODES:
+                leaders.add(position + 1)
+                target = branch_target(quadruples[position])
+                if target is not None and self.start < target <= self.end:
+                    leaders.add(target)
+            elif opcode == "return":
+                leaders.add(position + 1)
+
+        leaders = sorted(leader for leader in leaders if leader <= self.end)
+        for number, leader in enumerate(leaders):
+            last = leaders[number + 1] - 1 if number + 1 < len(leaders) else self.end
+            block = BasicBlock(leader, last)
+            self.blocks.append(block)
+            self.block_at[leader] = block
+
+        for block in self.blocks:
+            last = quadruples[block.end]
+            targets = []
+
+            if last[1] in BRANCH_OPCODES:
+                target = branch_target(last)
+                if target in self.block_at:
+                    targets.append(target)
+                if last[1] != "BR":
+                    targets.append(block.end + 1)
+            elif last[1] != "return" and block.end < self.end:
+                targets.append(block.end + 1)
+
+            for target in targets:
+                successor = self.block_at.get(target)
+                if successor is not None and successor not in block.successors:
+                    block.successors.append(successor)
+                    successor.predecessors.append(block)
+
+    # Work out the operands live on entry to and exit from each block
+    #
+    # tracked - function telling whether an operand is followed, temps by default
+    def liveness(self, tracked=is_temp):
+        quadruples = self.quadruples
+        references = self.references
+
+        # operands each block reads before writing, and those it writes
+        gen = {}
+        kill = {}
+        for block in self.blocks:
+            block_gen = set()
+            block_kill = set()
+            for position in range(block.start, block.end + 1):
+                for operand in reads(quadruples[position], references):
+                    if tracked(operand) and operand not in block_kill:
+                        block_gen.add(operand)
+
+                written = writes(quadruples[position], references)
+                if written is not None and tracked(written):
+                    block_kill.add(written)
+
+            gen[block] = block_gen
+            kill[block] = block_kill
+            block.live_in = set(block_gen)
+            block.live_out = set()
+
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(self.blocks):
+                live_out = set()
+                for successor in block.successors:
+                    live_out |= successor.live_in
+
+                live_in = gen[block] | (live_out - kill[block])
+                if live_out != block.live_out or live_in != block.live_in:
+                    block.live_out = live_out
+                    block.live_in = live_in
+                    changed = True
+
+    # Blocks which can be reached from the start of the function
+    def reachable(self):
+        reached = set([self.blocks[0]])
+        pending = [self.blocks[0]]
+        while pending:
+            for successor in pending.pop().successors:
+                if successor not in reached:
+                    reached.add(successor)
+                    pending.append(successor)
+
+        return reached
+
+    # Work out the blocks dominating each block reached, leaving the dominators of other blocks as None
+    def dominance(self):
+        reached = self.reachable()
+        ordered = [block for block in self.blocks if block in reached]
+
+        for block in self.blocks:
+            block.dominators = set(ordered) if block in reached else None
+        self.blocks[0].dominators = set([self.blocks[0]])
+
+        changed = True
+        while changed:
+            changed = False
+            for block in ordered[1:]:
+                dominators = None
+                for predecessor in block.predecessors:
+                    if predecessor.dominators is None:
+                        continue
+                    if dominators is None:
+                        dominators = set(predecessor.dominators)
+                    else:
+                        dominators &= predecessor.dominators
+
+                dominators = (dominators or set()) | set([block])
+                if dominators != block.dominators:
+                    block.dominators = dominators
+                    changed = True
+
+    # The natural loop of each edge to a block which dominates the block it leaves, as (header, blocks of the loop)
+    # Loops sharing a header are taken as one, and they are listed smallest first, so inner loops come before the
+    # loops holding them.
+    def loops(self):
+        self.dominance()
+        bodies = {}
+
+        for block in self.blocks:
+            if block.dominators is None:
+                continue
+            for successor in block.successors:
+                if successor not in block.dominators:
+                    continue
+
+                body = bodies.setdefault(successor, set([successor]))
+                pending = [block]
+                while pending:
+                    member = pending.pop()
+                    if member not in body and member.dominators is not None:
+                        body.add(member)
+                        pending.extend(member.predecessors)
+
+        return sorted(bodies.items(), key=lambda item: (len(item[1]), item[0].start))
+
+    # The flow graph in the dot language of Graphviz, as a cluster of a larger graph
+    # An edge to a block which dominates the block it leaves, closing a loop, is dashed.
+    def dot(self):
+        quadruples = self.quadruples
+        name = str(quadruples[self.start][2])
+        self.dominance()
+
+        lines = ["    subgraph \"cluster_" + name + "\" {", "        label=\"" + name + "\";"]
+        for block in self.blocks:
+            label = "".join(" ".join(str(operand) for operand in quadruples[position] if operand != "") + "\\l"
+                            for position in range(block.start, block.end + 1))
+            style = "" if block.dominators is not None else ", style=dotted"
+            lines.append("        " + dot_node(name, block) + " [label=\"" + label.replace('"', '\\"') + "\"" +
+                         style + "];")
+
+        for block in self.blocks:
+            for successor in block.successors:
+                back = block.dominators is not None and successor in block.dominators
+                lines.append("        " + dot_node(name, block) + " -> " + dot_node(name, successor) +
+                             (" [style=dashed];" if back else ";"))
+
+        lines.append("    }")
+        return "\n".join(lines)
+
+
+#   Dot Node
+#   Name of a block in the dot language
+def dot_node(function, block):
+    return "\"" + function + "_" + str(block.start + 1) + "\""
+
+
+#   Program Dot
+#   The flow graphs of every function of a program in the dot language of Graphviz
+#   Blocks which cannot be reached are dotted.
+def program_dot(quadruples, title="program"):
+    lines = ["digraph \"" + title.replace('"', "") + "\" {", "    node [shape=box, fontname=monospace];"]
+    for start, end in function_ranges(quadruples):
+        lines.append(FlowGraph(quadruples, start, end).dot())
+    lines.append("}")
+
+    return "\n".join(lines) + "\n"
+
+
+#   Local Blocks
+#   Split the basic blocks of a flow graph further, after each call and around each block and end block, as
+#   (first position, last position) of each run
+#   Within a run no call changes memory, and each name stands for the same variable.
+def local_blocks(graph):
+    quadruples = graph.quadruples
+    runs = []
+
+    for block in graph.blocks:
+        first = block.start
+        for position in range(block.start, block.end + 1):
+            quadruple = quadruples[position]
+            if quadruple[1] == "block" or (quadruple[1] == "end" and quadruple[2] == "block"):
+                if first < position:
+                    runs.append((first, position - 1))
+                runs.append((position, position))
+                first = position + 1
+            elif quadruple[1] == "call":
+                runs.append((first, position))
+                first = position + 1
+
+        if first <= block.end:
+            runs.append((first, block.end))
+
+    return runs
@@ -0,0 +1,336 @@
+#
+#
+#   Incremental Compiler
+#   This module recompiles a C- source after an edit, redoing only the top level declarations which changed
+#
+#   The source is split into chunks, one per top level declaration, each running from the first token of its
+#   declaration to the first token of the next. The lexer is between tokens and outside any comment where a chunk
+#   starts, so a chunk lexes the same on its own as it does in place. After an edit, only the chunks overlapping the
+#   changed text are lexed and parsed again.
+#
+#   A chunk keeps its syntax tree and the quadruples generated from it, numbered as if the chunk were the whole
+#   program, and those are renumbered into place when the program is put back together. Temps need no renumbering,
+#   as each function numbers its own. It also keeps the semantic
+#   rejections found in a function body, replayed while the global identifiers the body uses keep their signatures.
+#
+#
+from __future__ import print_function
+import io
+from array import array
+from bisect import bisect_right
+from lib.code_generator import CodeGenerator, BRANCH_OPCODES
+from lib.driver import compile_tree
+from lib.lexical_analyzer import LexicalAnalyzer, NEWLINE
+from lib.parser import SEMICOLON
+from lib.semantic_analyzer import SemanticAnalyzer
+from lib.syntax_tree import FunctionDeclaration
+from lib.tree_parser import TreeParser, SyntaxRejection, LEFT_BRACE, RIGHT_BRACE
+
+
+#   Chunk
+#   The text of one top level declaration, and what it compiles to
+class Chunk(object):
+
+    __slots__ = ("text", "tokens", "offsets", "declaration", "symbol", "quadruples", "references", "rejections",
+                 "placement")
+
+    # offsets - offset of each token, from the start of the text
+    def __init__(self, text, tokens, offsets):
+        self.text = text
+        self.tokens = tokens
+        self.offsets = offsets
+        self.declaration = None  # syntax tree, None until parsed
+        self.symbol = None  # symbol the declaration declares
+        self.quadruples = None  # generated from the declaration, numbered from 1
+        self.references = None  # signatures of the global identifiers the body uses, None until analyzed
+        self.rejections = []  # semantic rejections of the body, located by token index within the chunk
+        self.placement = None  # (quadruples before the chunk, its quadruples numbered to follow them) as last placed
+
+
+#   Source Positions
+#   Stands in for the LexicalAnalyzer when locating tokens of a program put together from chunks
+#   The token and line offsets of the whole source are only worked out when a position is asked for.
+class SourcePositions(object):
+
+    def __init__(self, text, starts, chunks):
+        self.text = text
+        self.starts = starts
+        self.chunks = chunks
+        self.token_offsets = None
+        self.line_offsets = None
+
+    # offset into the source of each token
+    @property
+    def offsets(self):
+        if self.token_offsets is None:
+            self.token_offsets = array("l")
+            for start, chunk in zip(self.starts, self.chunks):
+                self.token_offsets.extend(start + offset for offset in chunk.offsets)
+
+        return self.token_offsets
+
+    # Position of a token by its index, as LexicalAnalyzer.get_position
+    def get_position(self, index, token=None):
+        if self.line_offsets is None:
+            self.line_offsets = array("l", [0])
+            self.line_offsets.extend(match.end() for match in NEWLINE.finditer(self.text, 0, len(self.text) - 1))
+
+        offset = self.offsets[index]
+        line = bisect_right(self.line_offsets, offset)
+        column = offset - self.line_offsets[line - 1] + 1
+
+        return line, column, offset, None
+
+
+class IncrementalCompiler(object):
+
+    # scanner - LexicalAnalyzer scanner backend
+    def __init__(self, scanner="regex"):
+        self.scanner = scanner
+        self.text = None  # source of the last compilation which split into chunks
+        self.chunks = []  # chunks of that source, in order
+        self.starts = []  # offset of each chunk in that source
+
+    # Compile a source, printing its diagnostics
+    # Returns the ACCEPT/REJECT result and the quadruples, as driver.compile_tree does for the whole source. The
+    # quadruples are shared with the chunks they came from, and must not be changed in place.
+    def compile(self, text):
+        split = None
+        if self.text is not None:
+            split = self.relex(text)
+
+        if split is None:
+            split = self.lex(text)
+            if split is None:
+                # the source does not split into declarations, leave reporting why to the whole source
+                analyzer = LexicalAnalyzer(self.scanner)
+                return compile_tree(analyzer.process_file(io.StringIO(text)), analyzer)
+
+        starts, chunks = split
+        for chunk in chunks:
+            if chunk.declaration is None and not self.parse(chunk):
+                analyzer = LexicalAnalyzer(self.scanner)
+                return compile_tree(analyzer.process_file(io.StringIO(text)), analyzer)
+
+        self.text = text
+        self.starts = starts
+        self.chunks = chunks
+
+        return self.assemble(text, starts, chunks)
+
+    #
+    #   Splitting
+    #
+
+    # Split a whole source into chunks, returning their offsets and the chunks, or None if it does not split
+    def lex(self, text):
+        cached = dict((chunk.text, chunk) for chunk in self.chunks)
+
+        return self.lex_span(text, 0, len(text), cached)
+
+    # Split a source into chunks, lexing only the chunks which differ from the last compilation
+    # Returns the offsets of the chunks and the chunks, or None if the changed text does not split into whole
+    # declarations, such as while a brace or comment is left open.
+    def relex(self, text):
+        old_text = self.text
+        starts = self.starts
+        chunks = self.chunks
+        count = len(chunks)
+        growth = len(text) - len(old_text)
+
+        # chunks unchanged at the start of the source, in the same place
+        first = 0
+        while first < count and text.startswith(chunks[first].text, starts[first]):
+            first += 1
+
+        if first == count and growth == 0:
+            return starts, chunks
+
+        # chunks unchanged at the end of the source, moved by the growth of the source
+        end = count
+        while end > first and starts[end - 1] + growth >= starts[first] \
+                and text.startswith(chunks[end - 1].text, starts[end - 1] + growth):
+            end -= 1
+
+        cached = dict((chunk.text, chunk) for chunk in chunks)
+
+        while True:
+            # relex at least one chunk, so text inserted between chunks has one to join
+            if first == end:
+                if first > 0:
+                    first -= 1
+                elif end < count:
+                    end += 1
+                else:
+                    return None
+
+            span_start = starts[first]
+            span_end = (starts[end] if end < count else len(old_text)) + growth
+
+            span = self.lex_span(text, span_start, span_end, cached)
+            if span is None:
+                return None
+
+            span_starts, span_chunks = span
+            if span_chunks:
+                break
+
+            # the changed text no longer holds a declaration, so it joins a neighbouring chunk
+            if first > 0:
+                first -= 1
+            elif end < count:
+                end += 1
+            else:
+                return None
+
+        moved_starts = [start + growth for start in starts[end:]]
+
+        return starts[:first] + span_starts + moved_starts, chunks[:first] + span_chunks + chunks[end:]
+
+    # Lex the text between two chunk boundaries and split it into chunks
+    # Returns the offsets of the chunks and the chunks, reusing cached chunks with the same text, or None if the
+    # text ends inside a comment or a declaration.
+    def lex_span(self, text, start, end, cached):
+        span = text[start:end]
+        analyzer = LexicalAnalyzer(self.scanner)
+        tokens = analyzer.process_file(io.StringIO(span))
+        offsets = analyzer.offsets
+
+        if analyzer.comment_nesting_level != 0:
+            return None
+
+        # a line comment left open at the end of the text would run on into the text after it
+        if end < len(text) and "//" in span[span.rfind("\n") + 1:]:
+            return None
+
+        firsts = split_declarations(tokens)
+        if firsts is None:
+            return None
+
+        starts = []
+        chunks = []
+        for number, first in enumerate(firsts):
+            last = firsts[number + 1] if number + 1 < len(firsts) else len(tokens)
+            chunk_start = offsets[first] if number > 0 else 0
+            chunk_end = offsets[last] if last < len(tokens) else len(span)
+
+            chunk_text = span[chunk_start:chunk_end]
+            chunk = cached.get(chunk_text)
+            if chunk is None:
+                chunk_offsets = array("l", (offset - chunk_start for offset in offsets[first if number > 0 else 0:last]))
+                chunk = Chunk(chunk_text, tokens[first if number > 0 else 0:last], chunk_offsets)
+
+            starts.append(start + chunk_start)
+            chunks.append(chunk)
+
+        return starts, chunks
+
+    #
+    #   Compiling
+    #
+
+    # Parse a chunk and generate its quadruples, returning False if it is not one whole declaration
+    def parse(self, chunk):
+        parser = TreeParser(chunk.tokens)
+
+        try:
+            while parser.current_token is SEMICOLON:
+                parser.next_token()
+
+            declaration = parser.declaration()
+
+            while parser.current_token is SEMICOLON:
+                parser.next_token()
+        except SyntaxRejection:
+            return False
+
+        if parser.current_token is not None:
+            return False
+
+        generator = CodeGenerator()
+        generator.declaration(declaration)
+
+        chunk.declaration = declaration
+        chunk.quadruples = generator.quadruples
+
+        return True
+
+    # Analyze the chunks in order and put their quadruples together, as compile_tree does for the whole source
+    def assemble(self, text, starts, chunks):
+        analyzer = SemanticAnalyzer(SourcePositions(text, starts, chunks))
+        analyzer.declare_builtins()
+
+        quadruples = []
+        token_base = 0
+
+        for chunk in chunks:
+            declaration = chunk.declaration
+            analyzer.token_base = token_base
+
+            if chunk.symbol is None:
+                chunk.symbol = analyzer.declaration_symbol(declaration)
+            symbol = analyzer.declare_symbol(chunk.symbol, declaration)
+
+            if isinstance(declaration, FunctionDeclaration):
+                if chunk.references is not None and analyzer.references_hold(chunk.references):
+                    analyzer.replay(chunk.rejections)
+                else:
+                    chunk.references, chunk.rejections = analyzer.record_function_body(declaration, symbol)
+
+            quadruples.extend(self.place(chunk, len(quadruples)))
+            token_base += len(chunk.tokens)
+
+        accepted = analyzer.finish()
+
+        return "ACCEPT" if accepted else "REJECT", quadruples
+
+    # The quadruples of a chunk, renumbered to follow the given number of quadruples
+    def place(self, chunk, quadruple_base):
+        placement = chunk.placement
+        if placement is not None and placement[0] == quadruple_base:
+            return placement[1]
+
+        if quadruple_base == 0:
+            placed = chunk.quadruples
+        else:
+            placed = [[index + quadruple_base, opcode, operand1, operand2,
+                       result + quadruple_base if opcode in BRANCH_OPCODES else result]
+                      for index, opcode, operand1, operand2, result in chunk.quadruples]
+
+        chunk.placement = (quadruple_base, placed)
+
+        return placed
+
+
+#   Split Declarations
+#   Index of the first token of each top level declaration, or None if the tokens end inside a declaration
+#   A declaration ends at a semicolon outside braces, or at the brace closing a function body. Semicolons between
+#   declarations are empty declarations, and are left with the declaration before them.
+def split_declarations(tokens):
+    firsts = []
+    depth = 0
+    inside = False
+
+    for index, token in enumerate(tokens):
+        if not inside:
+            if token is SEMICOLON:
+                continue
+
+            firsts.append(index)
+            inside = True
+
+        if token is LEFT_BRACE:
+            depth += 1
+        elif token is RIGHT_BRACE:
+            depth -= 1
+            if depth < 0:
+                return None
+            elif depth == 0:
+                inside = False
+        elif token is SEMICOLON and depth == 0:
+            inside = False
+
+    if inside:
+        return None
+
+    return firsts
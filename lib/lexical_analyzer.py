@@ -4,6 +4,13 @@
 #   This module contains functions and objects for use by the Lexical Analyzer
 #
 #
+from __future__ import print_function
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_right
+from lib.tokens import Token, intern, canonical_tokens, make_token, KEYWORD, IDENTIFIER, NUMBER, FLOAT, OPERATORS, ERROR, KIND_NAMES, KIND_CODES
 
 
 class LexicalAnalyzer(object):
@@ -46,239 +53,956 @@ class LexicalAnalyzer(object):
         "=",
     ]
 
-    def __init__(self):
+    # Scanner backends, all of which emit the same tokens
+    scanners = [
+        "character",
+        "table",
+        "regex",
+    ]
+
+    # Ways of reading the source file, see iter_tokens and iter_mapped_tokens
+    inputs = [
+        "text",
+        "mmap",
+    ]
+
+    def __init__(self, scanner="character"):
 
         self.debug = False
+        self.scanner = scanner  # one of the scanners above
         self.comment_nesting_level = 0
         self.tokens = []
         self.active_token = ""
         self.token_type = ""
+        self.token_start = 0
+
+        # source positions
+        self.offsets = array("l")  # offset into the source of each token, parallel to the tokens
+        self.line_offsets = array("l")  # offset into the source of each line
+        self.span_lengths = {}  # source length of tokens which had tabs removed from them, by token index
+        self.offset_base = 0  # offset into the source of the line being scanned, after stripping
+        self.offset = 0
 
     def process_file(self, file):
     
         #
         #   Process File for Tokens
         #
-    
-        for line in file.readlines():
-            line = line.replace("\n", "").replace("\t", "").strip() + " "
-    
-            if len(line) <= 1:
+
+        if self.scanner == "regex":
+            return self.process_buffer(file.read())
+
+        return self.process_lines(file.readlines())
+
+    # Tokenize a list of source lines, each normalized and scanned on its own
+    def process_lines(self, lines):
+        scan_line = self.get_line_scanner()
+        add_line_offset = self.line_offsets.append
+        offset = self.offset
+
+        for line in lines:
+            add_line_offset(offset)
+            offset_base = offset
+            offset += len(line)
+
+            # stripping first and removing tabs after is the same as the other way around, but cheaper
+            stripped = line.strip()
+
+            if len(stripped) == 0:
                 continue
 
+            if line[0].isspace():
+                offset_base += len(line) - len(line.lstrip())
+
+            if "\t" in stripped:
+                self.scan_tabbed_line(stripped, offset_base, scan_line)
+                continue
+
+            line = stripped + " "
+
             if self.debug:
                 print("\nINPUT: " + line)
-    
-            #
-            #   Begin Line-by-Line Processing
-            #
-            current_position_in_line = 0
-            while current_position_in_line < len(line):
-    
-                char = line[current_position_in_line]
-                token_complete = False
-                self.token_type = ""
-    
-                # Determine a potential token type
-                if char is "/":
-                    self.token_type = "OPERATOR_OR_COMMENT"
-    
-                elif char is "*":
-                    self.token_type = "OPERATOR_OR_END_COMMENT"
-    
-                elif char.isalpha():
-                    self.token_type = "KEYWORD_OR_IDENTIFIER"
-    
-                elif char.isdigit():
-                    self.token_type = "NUMBER_OR_FLOAT"
-    
-                elif char is " ":
-                    self.token_type = "SPACE"
-                    self.active_token = ""
-    
+
+            scan_line(line, offset_base)
+
+        self.offset = offset
+
+        return self.get_tokens()
+
+    # Tokenize a whole source buffer with the regex scanner
+    # Buffers of printable ASCII need no per-line normalization, so they are scanned in one pass. Anything
+    # else is split into lines and normalized as usual.
+    def process_buffer(self, text):
+        if UNSAFE_CHARACTERS.search(text):
+            lines = [line + "\n" for line in text.split("\n")]
+            lines[-1] = lines[-1][:-1]
+            if lines[-1] == "":
+                lines.pop()
+
+            return self.process_lines(lines)
+
+        if text:
+            self.line_offsets.append(self.offset)
+            self.line_offsets.extend(self.offset + match.end() for match in NEWLINE.finditer(text, 0, len(text) - 1))
+
+        if self.debug:
+            print("\nINPUT: " + text)
+
+        self.scan_text_regex(text, self.offset)
+        self.offset += len(text)
+
+        return self.get_tokens()
+
+    # Tokenize a file lazily
+    # Lines are pulled from the file as the caller asks for tokens, and each line's tokens are released once
+    # handed out, so neither the source nor the token list is held in memory
+    def iter_tokens(self, file):
+        scan_line = self.get_line_scanner()
+        add_line_offset = self.line_offsets.append
+
+        # iterating the file object reads it in buffered chunks, a line at a time
+        for line in file:
+            offset = self.offset
+            add_line_offset(offset)
+            self.offset += len(line)
+
+            stripped = line.strip()
+
+            if len(stripped) == 0:
+                continue
+
+            if line[0].isspace():
+                offset += len(line) - len(line.lstrip())
+
+            if "\t" in stripped:
+                self.scan_tabbed_line(stripped, offset, scan_line)
+            else:
+                line = stripped + " "
+
+                if self.debug:
+                    print("\nINPUT: " + line)
+
+                scan_line(line, offset)
+
+            for token in self.tokens:
+                yield token
+
+            del self.tokens[:]
+
+    # Tokenize a file through a read-only memory map
+    # Returns the tokens, as process_file does
+    def process_mapped(self, filename):
+        for chunk in self.scan_mapped(filename):
+            pass
+
+        return self.get_tokens()
+
+    # Tokenize a file through a read-only memory map, lazily
+    # Tokens are yielded a chunk of lines at a time and released once handed out, as in iter_tokens
+    def iter_mapped_tokens(self, filename):
+        for chunk in self.scan_mapped(filename):
+            for token in self.tokens:
+                yield token
+
+            del self.tokens[:]
+
+    # Scan a memory-mapped file, yielding after each chunk of lines
+    # The regex scanner matches over the mapped bytes directly and decodes each lexeme as it is emitted, so no
+    # line is copied out of the file. Files which are not printable ASCII are read as text a chunk at a time,
+    # with the configured scanner, so their positions and tokens are those of process_file.
+    def scan_mapped(self, filename):
+        file = open(filename, "rb")
+
+        try:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:  # empty files cannot be mapped
+                return
+
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            try:
+                if MAPPED_UNSAFE_CHARACTERS.search(mapped):
+                    text_file = open(filename, "r")
+                    try:
+                        for lines in iter(lambda: text_file.readlines(MAPPED_CHUNK_SIZE), []):
+                            self.process_lines(lines)
+                            yield lines
+                    finally:
+                        text_file.close()
+
+                    return
+
+                offset_base = self.offset
+                self.line_offsets.append(offset_base)
+
+                start = 0
+                while start < size:
+                    # chunks end on a line break, which no token runs across
+                    end = mapped.find(b"\n", start + MAPPED_CHUNK_SIZE)
+                    end = size if end < 0 else end + 1
+
+                    self.line_offsets.extend(offset_base + match.end()
+                                             for match in MAPPED_NEWLINE.finditer(mapped, start, min(end, size - 1)))
+
+                    if self.debug:
+                        print("\nINPUT: " + mapped[start:end].decode("ascii"))
+
+                    self.scan_text_regex(mapped, offset_base, start, end)
+                    yield start
+
+                    start = end
+
+                self.offset += size
+            finally:
+                mapped.close()
+        finally:
+            file.close()
+
+    # Scan a stripped line which has tabs in it
+    # Tabs are removed before scanning, so the token offsets are corrected afterwards
+    def scan_tabbed_line(self, line, offset_base, scan_line):
+        first_token = len(self.offsets)
+        prepared_line = line.replace("\t", "") + " "
+
+        if self.debug:
+            print("\nINPUT: " + prepared_line)
+
+        scan_line(prepared_line, offset_base)
+
+        columns = [column for column in range(len(line)) if line[column] != "\t"]
+        offsets = self.offsets
+        line_tokens = self.tokens[len(self.tokens) - (len(offsets) - first_token):]
+
+        for index in range(first_token, len(offsets)):
+            column = offsets[index] - offset_base
+            length = len(line_tokens[index - first_token].value)
+            start = columns[column]
+            end = columns[column + length - 1] + 1
+
+            offsets[index] = offset_base + start
+            if end - start != length:
+                self.span_lengths[index] = end - start
+
+    # Select the line scanner for the configured scanner mode
+    def get_line_scanner(self):
+        if self.scanner == "table":
+            return self.scan_line_table
+        elif self.scanner == "regex":
+            return self.scan_line_regex
+
+        return self.scan_line
+
+    # Character scanner
+    # Walk a prepared line one character at a time, branching on the active token type
+    #
+    # line - line stripped of whitespace and tabs, ending in a space
+    # offset_base - offset into the source where the prepared line starts
+    def scan_line(self, line, offset_base):
+        self.offset_base = offset_base
+        start_types = START_TOKEN_TYPES
+
+        #
+        #   Begin Line-by-Line Processing
+        #
+        current_position_in_line = 0
+        while current_position_in_line < len(line):
+
+            char = line[current_position_in_line]
+            token_complete = False
+            self.token_start = current_position_in_line
+
+            # Determine a potential token type
+            self.token_type = start_types.get(char)
+            if self.token_type is None:
+                self.token_type = CLASS_TOKEN_TYPES[CHARACTER_CLASSES[ord(char)]]
+
+            if self.token_type == "SPACE":
+                self.active_token = ""
+
+                token_complete = True
+                self.process_complete_token()
+
+                current_position_in_line += 1
+
+            elif self.token_type == "OPERATOR":
+                self.token_type = "OPERATORS"
+
+                self.active_token = char
+                self.process_complete_token()
+
+                current_position_in_line += 1
+                token_complete = True
+
+            self.active_token = char
+
+            # If token is not a single-character token, let's begin collecting characters for the token
+            while not token_complete:
+
+                # let's prep the next character
+                current_position_in_line += 1
+
+                if current_position_in_line >= len(line):
+                    # if we've reached the end of the line, process the token as is
+                    if self.token_type == "OPERATORS" and self.active_token == "!":
+                        self.token_type = "ERROR"
+
                     token_complete = True
                     self.process_complete_token()
-    
-                    current_position_in_line += 1
-    
-                elif char in self.extendable_operators:
-                    self.token_type = "OPERATORS"
-    
-                elif char in self.operators:
-                    self.token_type = "OPERATORS"
-    
-                    self.active_token = char
-                    self.process_complete_token()
-    
-                    current_position_in_line += 1
-                    token_complete = True
-    
-                else:
-                    self.token_type = "ERROR"
-    
-                self.active_token = char
-    
-                # If token is not a single-character token, let's begin collecting characters for the token
-                while not token_complete:
-    
-                    # let's prep the next character
-                    current_position_in_line += 1
-    
-                    if current_position_in_line >= len(line):
-                        # if we've reached the end of the line, process the token as is
-                        if self.token_type is "OPERATORS" and self.active_token is "!":
-                            self.token_type = "ERROR"
-    
+                    break
+
+                # Process the next character into the token
+                char = line[current_position_in_line]
+
+                if self.token_type == "OPERATOR_OR_COMMENT":
+                    if char == "*":  # multi line comment
+                        self.comment_nesting_level += 1
+                        self.active_token += char
+                        current_position_in_line += 1
+                        self.token_type = "COMMENT"
                         token_complete = True
-                        self.process_complete_token()
-                        break
-    
-                    # Process the next character into the token
-                    char = line[current_position_in_line]
-    
-                    if self.token_type is "OPERATOR_OR_COMMENT":
-                        if char is "*":  # multi line comment
-                            self.comment_nesting_level += 1
-                            self.active_token += char
+                    elif char == "/":  # single line comment
+                        self.active_token += char
+                        token_complete = True
+                        current_position_in_line = len(line)
+                        self.token_type = "COMMENT"
+                    else:
+                        self.token_type = "OPERATORS"
+                        token_complete = True
+
+                    # end of the line, pass the token on
+                    if current_position_in_line + 1 >= len(line):
+                        token_complete = True
+
+                elif self.token_type == "OPERATORS":
+                    if char == "=":  # extended operator
+                        self.active_token += char
+                        current_position_in_line += 1
+                        token_complete = True
+                    elif self.active_token == "!":
+                        self.token_type = "ERROR"
+                        token_complete = True
+                    else:
+                        token_complete = True
+
+                elif self.token_type == "OPERATOR_OR_END_COMMENT":
+
+                    if char == "/":  # end of multiline comment
+                        if self.comment_nesting_level > 0:
+                            self.comment_nesting_level -= 1
+                            self.active_token = ""
                             current_position_in_line += 1
-                            self.token_type = "COMMENT"
-                            token_complete = True
-                        elif char is "/":  # single line comment
-                            self.active_token += char
-                            token_complete = True
-                            current_position_in_line = len(line)
-                            self.token_type = "COMMENT"
                         else:
                             self.token_type = "OPERATORS"
-                            token_complete = True
-    
-                        # end of the line, pass the token on
-                        if current_position_in_line + 1 >= len(line):
-                            token_complete = True
-    
-                    elif self.token_type is "OPERATORS":
-                        if char is "=":  # extended operator
+
+                        token_complete = True
+
+                    else:
+                        self.token_type = "OPERATORS"
+                        token_complete = True
+
+                    # end of the line, pass the token on
+                    if current_position_in_line + 1 >= len(line):
+                        token_complete = True
+
+                elif self.token_type == "KEYWORD_OR_IDENTIFIER":
+                    if char.isalpha():  # string is still being built
+                        self.active_token += char
+                    else:  # this is the end of the string
+                        token_complete = True
+
+                    # end of the line, pass the token on
+                    if current_position_in_line + 1 >= len(line):
+                        token_complete = True
+
+                elif self.token_type in NUMBER_TOKEN_TYPES:
+                    if char.isdigit():
+                        self.active_token += char
+                    elif char == "E":
+                        if 'E' in self.active_token:
                             self.active_token += char
-                            current_position_in_line += 1
-                            token_complete = True
-                        elif self.active_token is "!":
                             self.token_type = "ERROR"
-                            token_complete = True
                         else:
-                            token_complete = True
-    
-                    elif self.token_type is "OPERATOR_OR_END_COMMENT":
-    
-                        if char is "/":  # end of multiline comment
-                            if self.comment_nesting_level > 0:
-                                self.comment_nesting_level -= 1
-                                self.active_token = ""
-                                current_position_in_line += 1
-                            else:
-                                self.token_type = "OPERATORS"
-    
-                            token_complete = True
-    
-                        else:
-                            self.token_type = "OPERATORS"
-                            token_complete = True
-    
-                        # end of the line, pass the token on
-                        if current_position_in_line + 1 >= len(line):
-                            token_complete = True
-    
-                    elif self.token_type is "KEYWORD_OR_IDENTIFIER":
-                        if char.isalpha():  # string is still being built
                             self.active_token += char
-                        else:  # this is the end of the string
-                            token_complete = True
-    
-                        # end of the line, pass the token on
-                        if current_position_in_line + 1 >= len(line):
-                            token_complete = True
-    
-                    elif self.token_type in ["NUMBER_OR_FLOAT", "NUMBER", "FLOAT"]:
-                        if char.isdigit():
+                            self.token_type = "FLOAT"
+                    elif char == ".":
+                        if '.' in self.active_token:
                             self.active_token += char
-                        elif char is "E":
-                            if 'E' in self.active_token:
-                                self.active_token += char
-                                self.token_type = "ERROR"
-                            else:
-                                self.active_token += char
-                                self.token_type = "FLOAT"
-                        elif char is ".":
-                            if '.' in self.active_token:
-                                self.active_token += char
-                                self.token_type = "ERROR"
-                            else:
-                                self.active_token += char
-                                self.token_type = "FLOAT"
-                        elif char in ["+", "-"]:
-                            if '+' in self.active_token or '-' in self.active_token:
-                                self.active_token += char
-                                self.token_type = "ERROR"
-                            else:
-                                self.active_token += char
-                                self.token_type = "FLOAT"
-                        else:  # this is the end of the string
-                            token_complete = True
-    
-                        if token_complete and self.token_type is not "FLOAT":
-                            self.token_type = "NUMBER"
-    
-                    elif self.token_type is "ERROR":
-                        if char not in [" "]:
+                            self.token_type = "ERROR"
+                        else:
                             self.active_token += char
+                            self.token_type = "FLOAT"
+                    elif char == "+" or char == "-":
+                        if '+' in self.active_token or '-' in self.active_token:
+                            self.active_token += char
+                            self.token_type = "ERROR"
                         else:
-                            token_complete = True
-    
+                            self.active_token += char
+                            self.token_type = "FLOAT"
+                    else:  # this is the end of the string
+                        token_complete = True
+
+                    if token_complete and self.token_type != "FLOAT":
+                        self.token_type = "NUMBER"
+
+                elif self.token_type == "ERROR":
+                    if char != " ":
+                        self.active_token += char
                     else:
                         token_complete = True
-    
-                    # process a completed token
-                    if token_complete:
-                        self.process_complete_token()
 
-        return self.get_tokens()
+                else:
+                    token_complete = True
+
+                # process a completed token
+                if token_complete:
+                    self.process_complete_token()
+
+    # Table-driven scanner
+    # Walk a prepared line through the precomputed transition table, slicing completed tokens out of the line
+    def scan_line_table(self, line, offset_base):
+        self.offset_base = offset_base
+        transitions = TRANSITIONS
+        token_kinds = STATE_TOKEN_KINDS
+        keyword_kinds = KEYWORD_KINDS
+        canonical = canonical_tokens
+        add_token = self.tokens.append
+        add_offset = self.offsets.append
+        debug = self.debug
+        nesting = self.comment_nesting_level
+
+        # classify the whole line up front, one byte per character
+        classes = line.translate(CHARACTER_CLASSES).encode("latin-1")
+
+        state = STATE_START
+        token_start = 0
+        position = 0
+        length = len(line)
+
+        while position < length:
+            action = transitions[state + classes[position]]
+
+            if action >= 0:
+                # consume the character and move to the next state
+                if state == STATE_START:
+                    token_start = position
+                state = action
+                position += 1
+                continue
+
+            if action == ACTION_SKIP:
+                position += 1
+                continue
+
+            token = None
+
+            if action == ACTION_EMIT:
+                # the token ended before this character, which starts the next token
+                token = line[token_start:position]
+                kind = token_kinds[state]
+
+                if kind is None:
+                    kind = keyword_kinds.get(token, IDENTIFIER)
+                elif kind == ERROR:
+                    stripped = token.strip()
+                    if stripped != token:
+                        token_start += len(token) - len(token.lstrip())
+                        token = stripped
+
+            elif action == ACTION_OPERATOR:
+                if state == STATE_START:
+                    token_start = position
+                position += 1
+                token = line[token_start:position]
+                kind = OPERATORS
+
+            elif action == ACTION_OPEN_COMMENT:
+                nesting += 1
+                position += 1
+
+            elif action == ACTION_CLOSE_COMMENT:
+                if nesting > 0:
+                    nesting -= 1
+                    position += 1
+                else:
+                    token = "*"
+                    kind = OPERATORS
+
+            else:  # ACTION_LINE_COMMENT
+                break
+
+            state = STATE_START
+
+            if token and nesting == 0:
+                if debug:
+                    self.add_token(token, kind, token_start)
+                else:
+                    # make_token, inlined
+                    if kind == OPERATORS or kind == KEYWORD:
+                        add_token(canonical[token])
+                    else:
+                        add_token(Token(intern(token), kind))
+                    add_offset(offset_base + token_start)
+
+        self.comment_nesting_level = nesting
+
+    # Regex scanner, for a single prepared line
+    # Lines with characters outside printable ASCII are left to the table-driven scanner, as the pattern
+    # does not classify them the same way str.isalpha and str.isdigit do
+    def scan_line_regex(self, line, offset_base):
+        if UNSAFE_CHARACTERS.search(line):
+            self.scan_line_table(line, offset_base)
+        else:
+            self.scan_text_regex(line, offset_base)
+
+    # Regex scanner
+    # Match tokens with the compiled master pattern, counting comment nesting around it
+    #
+    # text - prepared line, a buffer of lines of printable ASCII, or a memory map of such a buffer
+    # offset_base - offset into the source where the text starts
+    # start, end - part of the text to scan, the whole text by default
+    def scan_text_regex(self, text, offset_base, start=0, end=None):
+        self.offset_base = offset_base
+        add_token = self.tokens.append
+        add_offset = self.offsets.append
+        debug = self.debug
+        nesting = self.comment_nesting_level
+
+        if end is None:
+            end = len(text)
+
+        # memory maps are matched as bytes, and their lexemes decoded once they are emitted
+        mapped = isinstance(text, mmap.mmap)
+        if mapped:
+            token_pattern = MAPPED_TOKEN_PATTERN
+            error_tail = MAPPED_ERROR_TAIL
+            keywords = MAPPED_KEYWORDS
+            canonical = MAPPED_CANONICAL_TOKENS
+        else:
+            token_pattern = TOKEN_PATTERN
+            error_tail = ERROR_TAIL
+            keywords = KEYWORD_KINDS
+            canonical = canonical_tokens
+
+        position = start
+        while position is not None:
+            matches = token_pattern.finditer(text, position, end)
+            position = None
+
+            for match in matches:
+                # each match starts with the spaces before the token, so the token is the matched group
+                group = match.lastindex
+                token = match.group(group)
+
+                # identifiers, keywords and operators outside of comments make up most tokens, emit them directly
+                if nesting == 0 and not debug:
+                    if group == GROUP_WORD:
+                        if token in keywords:
+                            add_token(canonical[token])
+                        else:
+                            add_token(Token(intern(token.decode("ascii") if mapped else token), IDENTIFIER))
+                        add_offset(offset_base + match.start(group))
+                        continue
+
+                    elif group == GROUP_OPERATOR:
+                        add_token(canonical[token])
+                        add_offset(offset_base + match.start(group))
+                        continue
+
+                token_start = match.start(group)
+                if mapped:
+                    token = token.decode("ascii")
+
+                if group == GROUP_WORD:
+                    kind = KEYWORD_KINDS.get(token, IDENTIFIER)
+
+                elif group == GROUP_OPERATOR:
+                    kind = OPERATORS
+
+                elif group == GROUP_NUMBER:
+                    kind = NUMBER
+
+                    if not token.isdigit():
+                        kind = FLOAT
+
+                        # a repeated exponent, decimal point or sign turns the number into an error to the next space
+                        if token.count("E") > 1 or token.count(".") > 1 or token.count("+") + token.count("-") > 1:
+                            position = error_tail.match(text, match.end(), end).end()
+                            token = text[token_start:position]
+                            if mapped:
+                                token = token.decode("ascii")
+                            kind = ERROR
+
+                elif group == GROUP_OPEN_COMMENT:
+                    nesting += 1
+                    continue
+
+                elif group == GROUP_LINE_COMMENT:
+                    continue
+
+                elif group == GROUP_CLOSE_COMMENT:
+                    if nesting > 0:
+                        nesting -= 1
+                        continue
+
+                    # not in a comment, so the star is an operator and the slash starts the next token
+                    token = "*"
+                    kind = OPERATORS
+                    position = token_start + 1
+
+                else:  # errors, including a lone bang
+                    kind = ERROR
+
+                if nesting == 0:
+                    if debug:
+                        self.add_token(token, kind, token_start)
+                    elif kind == OPERATORS or kind == KEYWORD:
+                        add_token(canonical_tokens[token])
+                        add_offset(offset_base + token_start)
+                    else:
+                        add_token(Token(intern(token), kind))
+                        add_offset(offset_base + token_start)
+
+                # the match ended somewhere else than the token, so restart matching from the token's end
+                if position is not None:
+                    break
+
+        self.comment_nesting_level = nesting
 
     # Add a token to the collection to be passed to the parser
     def process_complete_token(self):
-        self.active_token = self.active_token.strip()
+        token = self.active_token
+        self.active_token = token.strip()
 
         append_token = False
 
-        if self.active_token is not "" and self.comment_nesting_level is 0:
-            if self.token_type is "OPERATOR_OR_END_COMMENT":
-                if self.active_token is "*":
+        if self.active_token != "" and self.comment_nesting_level == 0:
+            if self.token_type == "OPERATOR_OR_END_COMMENT":
+                if self.active_token == "*":
                     self.token_type = "OPERATORS"
                     append_token = True
                 else:
                     self.token_type = "COMMENT"
 
-            elif self.token_type in ["KEYWORD_OR_IDENTIFIER"]:
+            elif self.token_type == "KEYWORD_OR_IDENTIFIER":
                 append_token = True
-                if self.active_token in self.keywords:
-                    self.token_type = "KEYWORD"
-                else:
-                    self.token_type = "IDENTIFIER"
+                kind = KEYWORD_KINDS.get(self.active_token, IDENTIFIER)
+                self.token_type = KIND_NAMES[kind]
 
-            elif self.token_type not in ["COMMENT", "SPACE"]:
+            elif self.token_type != "COMMENT" and self.token_type != "SPACE":
                 append_token = True
 
         if append_token:
-            self.tokens.append([self.active_token, self.token_type])
+            token_start = self.token_start
+            if self.active_token != token:
+                token_start += len(token) - len(token.lstrip())
+
+            self.add_token(self.active_token, KIND_CODES[self.token_type], token_start)
 
+        self.active_token = ""
+
+    # Append a finished token to the collection
+    # token_start is the column the token starts at in the prepared line
+    def add_token(self, token, kind, token_start):
+        self.tokens.append(make_token(token, kind))
+        self.offsets.append(self.offset_base + token_start)
+
+        if self.debug:
             tabs = 2
-            if self.token_type in ["IDENTIFIER"]:
+            if kind == IDENTIFIER:
                 tabs = 1
-            elif self.token_type in ["FLOAT", "ERROR"]:
+            elif kind == FLOAT or kind == ERROR:
                 tabs = 3
 
-            if self.debug:
-                print("[" + self.token_type + "]" + ("\t" * tabs) + self.active_token)
-
-        self.active_token = ""
+            print("[" + KIND_NAMES[kind] + "]" + ("\t" * tabs) + token)
 
     def get_tokens(self):
         return self.tokens
+
+    # Position of a token by its index in the token stream, as a (line, column, offset, length) tuple
+    # Line and column count from 1, the offset from 0. The length is None if the token is no longer held
+    # and not passed in.
+    def get_position(self, index, token=None):
+        offset = self.offsets[index]
+        line = bisect_right(self.line_offsets, offset)
+        column = offset - self.line_offsets[line - 1] + 1
+
+        if token is None and index < len(self.tokens) and len(self.tokens) == len(self.offsets):
+            token = self.tokens[index]
+
+        length = self.span_lengths.get(index)
+        if length is None and token is not None:
+            length = len(token.value)
+
+        return line, column, offset, length
+
+
+#
+#   Scanner Tables
+#   Precomputed character classes and transitions for the table-driven scanner
+#
+
+# Character classes
+CLASS_SPACE = 0
+CLASS_SLASH = 1
+CLASS_STAR = 2
+CLASS_EXPONENT = 3  # "E" is a letter, but also extends a number into a float
+CLASS_LETTER = 4
+CLASS_DIGIT = 5
+CLASS_DOT = 6
+CLASS_SIGN = 7
+CLASS_EQUALS = 8
+CLASS_BANG = 9
+CLASS_RELATIONAL = 10
+CLASS_OPERATOR = 11
+CLASS_OTHER = 12
+CLASS_COUNT = 13
+
+# Scanner states, numbered by the offset of their row in the transition table
+STATE_START = 0 * CLASS_COUNT
+STATE_IDENTIFIER = 1 * CLASS_COUNT
+STATE_ERROR = 2 * CLASS_COUNT
+STATE_SLASH = 3 * CLASS_COUNT
+STATE_STAR = 4 * CLASS_COUNT
+STATE_RELATIONAL = 5 * CLASS_COUNT
+STATE_BANG = 6 * CLASS_COUNT
+STATE_NUMBER = 7 * CLASS_COUNT  # numbers occupy 8 rows, offset by the FLAG_* parts seen so far
+STATE_COUNT = 15
+
+FLAG_EXPONENT = 1
+FLAG_DOT = 2
+FLAG_SIGN = 4
+
+# Actions, stored in the transition table as negative numbers
+ACTION_SKIP = -1  # consume the character without starting a token
+ACTION_EMIT = -2  # the token is complete, the character starts the next one
+ACTION_OPERATOR = -3  # consume the character, completing an operator token
+ACTION_OPEN_COMMENT = -4
+ACTION_CLOSE_COMMENT = -5
+ACTION_LINE_COMMENT = -6
+
+# Token kind emitted when a token completes in a given state, None for keyword lookup
+STATE_TOKEN_KINDS = {
+    STATE_IDENTIFIER: None,
+    STATE_ERROR: ERROR,
+    STATE_SLASH: OPERATORS,
+    STATE_STAR: OPERATORS,
+    STATE_RELATIONAL: OPERATORS,
+    STATE_BANG: ERROR,
+    STATE_NUMBER: NUMBER,
+}
+for flags in range(1, 8):
+    STATE_TOKEN_KINDS[STATE_NUMBER + flags * CLASS_COUNT] = FLOAT
+
+
+#   Character Classes
+#   Translation table from characters to their class, stored as a one character string so a whole
+#   line can be classified with str.translate. Characters outside the operator tables are classified
+#   the first time they are seen.
+class CharacterClasses(dict):
+
+    def __missing__(self, code):
+        char = chr(code)
+        if char.isalpha():
+            char_class = chr(CLASS_LETTER)
+        elif char.isdigit():
+            char_class = chr(CLASS_DIGIT)
+        else:
+            char_class = chr(CLASS_OTHER)
+
+        self[code] = char_class
+        return char_class
+
+
+#   Build Character Classes
+#   Map the operator tables of the Lexical Analyzer onto character classes
+def build_character_classes():
+    character_classes = CharacterClasses()
+    character_classes[ord(" ")] = chr(CLASS_SPACE)
+    character_classes[ord(".")] = chr(CLASS_DOT)
+    character_classes[ord("E")] = chr(CLASS_EXPONENT)
+
+    for char in LexicalAnalyzer.operators:
+        if char == "/":
+            char_class = CLASS_SLASH
+        elif char == "*":
+            char_class = CLASS_STAR
+        elif char in ["+", "-"]:
+            char_class = CLASS_SIGN
+        else:
+            char_class = CLASS_OPERATOR
+        character_classes[ord(char)] = chr(char_class)
+
+    for char in LexicalAnalyzer.extendable_operators:
+        if char == "=":
+            char_class = CLASS_EQUALS
+        elif char == "!":
+            char_class = CLASS_BANG
+        else:
+            char_class = CLASS_RELATIONAL
+        character_classes[ord(char)] = chr(char_class)
+
+    # classify the rest of ASCII up front
+    for code in range(128):
+        character_classes[code]
+
+    return character_classes
+
+
+#   Build Transition Table
+#   Flatten the scanner DFA into a list indexed by state + character class
+def build_transition_table():
+    table = [ACTION_EMIT] * (STATE_COUNT * CLASS_COUNT)
+
+    def set_transition(state, char_class, action):
+        table[state + char_class] = action
+
+    # start of a token
+    set_transition(STATE_START, CLASS_SPACE, ACTION_SKIP)
+    set_transition(STATE_START, CLASS_SLASH, STATE_SLASH)
+    set_transition(STATE_START, CLASS_STAR, STATE_STAR)
+    set_transition(STATE_START, CLASS_EXPONENT, STATE_IDENTIFIER)
+    set_transition(STATE_START, CLASS_LETTER, STATE_IDENTIFIER)
+    set_transition(STATE_START, CLASS_DIGIT, STATE_NUMBER)
+    set_transition(STATE_START, CLASS_DOT, STATE_ERROR)
+    set_transition(STATE_START, CLASS_SIGN, ACTION_OPERATOR)
+    set_transition(STATE_START, CLASS_EQUALS, STATE_RELATIONAL)
+    set_transition(STATE_START, CLASS_BANG, STATE_BANG)
+    set_transition(STATE_START, CLASS_RELATIONAL, STATE_RELATIONAL)
+    set_transition(STATE_START, CLASS_OPERATOR, ACTION_OPERATOR)
+    set_transition(STATE_START, CLASS_OTHER, STATE_ERROR)
+
+    # keywords and identifiers run until a non-letter
+    set_transition(STATE_IDENTIFIER, CLASS_EXPONENT, STATE_IDENTIFIER)
+    set_transition(STATE_IDENTIFIER, CLASS_LETTER, STATE_IDENTIFIER)
+
+    # errors run until the next space
+    for char_class in range(CLASS_COUNT):
+        if char_class != CLASS_SPACE:
+            set_transition(STATE_ERROR, char_class, STATE_ERROR)
+
+    # comments and the lone operators they are built from
+    set_transition(STATE_SLASH, CLASS_STAR, ACTION_OPEN_COMMENT)
+    set_transition(STATE_SLASH, CLASS_SLASH, ACTION_LINE_COMMENT)
+    set_transition(STATE_STAR, CLASS_SLASH, ACTION_CLOSE_COMMENT)
+
+    # equality operators may be extended by "=", a lone bang is an error
+    set_transition(STATE_RELATIONAL, CLASS_EQUALS, ACTION_OPERATOR)
+    set_transition(STATE_BANG, CLASS_EQUALS, ACTION_OPERATOR)
+
+    # numbers become floats with an exponent, a decimal point or a sign, each allowed once
+    for flags in range(8):
+        state = STATE_NUMBER + flags * CLASS_COUNT
+        set_transition(state, CLASS_DIGIT, state)
+
+        for char_class, flag in [(CLASS_EXPONENT, FLAG_EXPONENT), (CLASS_DOT, FLAG_DOT), (CLASS_SIGN, FLAG_SIGN)]:
+            if flags & flag:
+                set_transition(state, char_class, STATE_ERROR)
+            else:
+                set_transition(state, char_class, STATE_NUMBER + (flags | flag) * CLASS_COUNT)
+
+    return table
+
+
+#   Build Token Pattern
+#   Compile the operator tables of the Lexical Analyzer into one alternation for the regex scanner
+#   Alternatives are tried in order, so comments come before the lone slash and star operators.
+def build_token_pattern():
+    operators = [char for char in LexicalAnalyzer.operators if char not in ["/", "*"]]
+    extendable = [char for char in LexicalAnalyzer.extendable_operators if char != "!"]
+
+    def character_set(chars):
+        return "[" + "".join(re.escape(char) for char in chars) + "]"
+
+    alternatives = [
+        r"(?P<word>[A-Za-z]+)",
+        r"(?P<number>[0-9][0-9E.+\-]*)",
+        r"(?P<open_comment>/\*)",
+        r"(?P<line_comment>//[^\n]*)",
+        r"(?P<close_comment>\*/)",
+        "(?P<operator>" + character_set(LexicalAnalyzer.extendable_operators) + "=|" + character_set(extendable) +
+        "|" + character_set(operators) + r"|[/*])",
+        r"(?P<bang>!)",
+        r"(?P<error>[^ \n]+)",
+    ]
+
+    # spaces are matched ahead of the token, rather than searched past one position at a time
+    return re.compile("[ \n]*(?:" + "|".join(alternatives) + ")")
+
+
+CHARACTER_CLASSES = build_character_classes()
+TRANSITIONS = build_transition_table()
+
+TOKEN_PATTERN = build_token_pattern()
+GROUP_WORD = TOKEN_PATTERN.groupindex["word"]
+GROUP_NUMBER = TOKEN_PATTERN.groupindex["number"]
+GROUP_OPEN_COMMENT = TOKEN_PATTERN.groupindex["open_comment"]
+GROUP_LINE_COMMENT = TOKEN_PATTERN.groupindex["line_comment"]
+GROUP_CLOSE_COMMENT = TOKEN_PATTERN.groupindex["close_comment"]
+GROUP_OPERATOR = TOKEN_PATTERN.groupindex["operator"]
+ERROR_TAIL = re.compile(r"[^ \n]*")
+NEWLINE = re.compile(r"\n")
+
+# the regex scanner only handles printable ASCII and line breaks by itself
+UNSAFE_CHARACTERS = re.compile(r"[^ -~\n]")
+
+# Token type the character scanner starts with for each character class, for characters outside ASCII
+CLASS_TOKEN_TYPES = {
+    chr(CLASS_EXPONENT): "KEYWORD_OR_IDENTIFIER",
+    chr(CLASS_LETTER): "KEYWORD_OR_IDENTIFIER",
+    chr(CLASS_DIGIT): "NUMBER_OR_FLOAT",
+    chr(CLASS_DOT): "ERROR",
+    chr(CLASS_OTHER): "ERROR",
+}
+
+
+#   Build Start Token Types
+#   Map each ASCII character onto the token type the character scanner starts with
+#   Single character operators get the type "OPERATOR", as they complete the moment they are read.
+def build_start_token_types():
+    start_types = {
+        " ": "SPACE",
+        "/": "OPERATOR_OR_COMMENT",
+        "*": "OPERATOR_OR_END_COMMENT",
+    }
+
+    for char in LexicalAnalyzer.extendable_operators:
+        start_types[char] = "OPERATORS"
+
+    for char in LexicalAnalyzer.operators:
+        start_types.setdefault(char, "OPERATOR")
+
+    for code in range(128):
+        if chr(code) not in start_types:
+            start_types[chr(code)] = CLASS_TOKEN_TYPES[CHARACTER_CLASSES[code]]
+
+    return start_types
+
+
+START_TOKEN_TYPES = build_start_token_types()
+NUMBER_TOKEN_TYPES = frozenset(["NUMBER_OR_FLOAT", "NUMBER", "FLOAT"])
+
+# final kind of each keyword, anything else made of letters is an identifier
+KEYWORD_KINDS = dict((value, KEYWORD) for value in LexicalAnalyzer.keywords)
+
+# bytes forms of the regex scanner patterns, for memory-mapped files
+MAPPED_TOKEN_PATTERN = re.compile(TOKEN_PATTERN.pattern.encode("ascii"))
+MAPPED_ERROR_TAIL = re.compile(ERROR_TAIL.pattern.encode("ascii"))
+MAPPED_NEWLINE = re.compile(NEWLINE.pattern.encode("ascii"))
+MAPPED_UNSAFE_CHARACTERS = re.compile(UNSAFE_CHARACTERS.pattern.encode("ascii"))
+MAPPED_KEYWORDS = frozenset(value.encode("ascii") for value in LexicalAnalyzer.keywords)
+MAPPED_CHUNK_SIZE = 1 << 16  # bytes scanned between yields, rounded up to the end of a line
+
+# create the shared keyword and operator tokens up front, so the table-driven scanner can look them up directly
+for value in LexicalAnalyzer.keywords:
+    make_token(value, KEYWORD)
+
+for value in LexicalAnalyzer.operators:
+    make_token(value, OPERATORS)
+
+for value in LexicalAnalyzer.extendable_operators:
+    if value != "!":
+        make_token(value, OPERATORS)
+    make_token(value + "=", OPERATORS)
+
+# shared keyword and operator tokens, by their bytes, for memory-mapped files
+MAPPED_CANONICAL_TOKENS = dict((value.encode("ascii"), token) for value, token in canonical_tokens.items())
@@ -0,0 +1,1614 @@
+#
+#
+#   Optimizer
+#   This module contains passes rewriting generated quadruples into quadruples which do the same work faster
+#
+#   Each pass takes the quadruples of a whole program and returns new quadruples, along with a note on what it did.
+#   The quadruples given are never changed in place. The passes are written against the quadruples of the
+#   CodeGenerator, whose meaning is defined by lib/virtual_machine.py.
+#
+#
+import heapq
+from lib.code_generator import BRANCH_OPCODES, WORD_SIZE
+from lib.flow_graph import FlowGraph, READ_OPERANDS, WRITING_OPCODES, branch_target, function_ranges, \
+    is_declaration, is_temp, local_blocks, reads, reference_temps, writes
+from lib.virtual_machine import NUMBER, divide, number_value
+
+# opcodes computing their result from two operands
+BINARY_OPCODES = frozenset(["add", "sub", "mult", "div", "comp"])
+
+# opcodes whose repeated computations are removed by value numbering, and those whose operands may be swapped
+COMMON_OPCODES = frozenset(["add", "sub", "mult", "div", "disp"])
+COMMUTATIVE_OPCODES = frozenset(["add", "mult"])
+
+# most instructions a function may have and still be inlined
+INLINE_LIMIT = 24
+
+# whether the branch after a comp is taken, by the value of the comp
+BRANCH_TESTS = {
+    "BRGT": lambda comparison: comparison > 0,
+    "BRGEQ": lambda comparison: comparison >= 0,
+    "BRLT": lambda comparison: comparison < 0,
+    "BRLEQ": lambda comparison: comparison <= 0,
+    "BREQ": lambda comparison: comparison == 0,
+    "BRNEQ": lambda comparison: comparison != 0,
+}
+
+
+#   Copy Quadruples
+#   A copy of quadruples which a pass may change in place
+def copy_quadruples(quadruples):
+    return [list(quadruple) for quadruple in quadruples]
+
+
+#   Is Number
+#   True if an operand is a number literal
+def is_number(operand):
+    return isinstance(operand, str) and NUMBER.match(operand) is not None
+
+
+#   Number Literal
+#   The literal of a number, as a folded operand
+def number_literal(value):
+    if isinstance(value, int):
+        return str(value)
+
+    return repr(value)
+
+
+#   Remove Quadruples
+#   The quadruples without those at the given positions, renumbered
+#   A branch to a removed quadruple goes to the next quadruple kept.
+def remove_quadruples(quadruples, removed):
+    if not removed:
+        return quadruples
+
+    # kept[position] - quadruples kept before the position
+    kept = [0]
+    for position in range(len(quadruples)):
+        kept.append(kept[-1] + (position not in removed))
+
+    result = []
+    for position, quadruple in enumerate(quadruples):
+        if position in removed:
+            continue
+
+        quadruple = list(quadruple)
+        quadruple[0] = len(result) + 1
+        if quadruple[1] in BRANCH_OPCODES and isinstance(quadruple[4], int) and 0 < quadruple[4] <= len(quadruples):
+            quadruple[4] = kept[quadruple[4] - 1] + 1
+        result.append(quadruple)
+
+    return result
+
+
+#   Move Quadruples
+#   The quadruples with those at the given positions moved, in order, to just before the quadruple at another
+#   position, renumbered
+#   A branch to that quadruple from one of the given sources still goes to it, and any other branch to it goes to
+#   the first quadruple moved. A branch to a quadruple moved goes to the next quadruple which was not.
+def move_quadruples(quadruples, moved, before, sources):
+    moved = sorted(moved)
+    order = []
+    for position in range(len(quadruples)):
+        if position == before:
+            order.extend(moved)
+        if position not in moved:
+            order.append(position)
+
+    new_positions = dict((old, new) for new, old in enumerate(order))
+    landing = {}  # position of a quadruple moved -> position of the next quadruple which was not
+    following = len(quadruples)
+    for position in reversed(range(len(quadruples))):
+        if position in new_positions and position not in moved:
+            following = position
+        landing[position] = following
+
+    result = []
+    for position in order:
+        quadruple = list(quadruples[position])
+        quadruple[0] = len(result) + 1
+        if quadruple[1] in BRANCH_OPCODES and isinstance(quadruple[4], int) and 0 < quadruple[4] <= len(quadruples):
+            target = quadruple[4] - 1
+            if target == before and position not in sources:
+                target = moved[0]
+            elif target in moved:
+                target = landing[target]
+            quadruple[4] = new_positions.get(target, len(quadruples)) + 1
+        result.append(quadruple)
+
+    return result
+
+
+#   Insert Quadruples
+#   The quadruples with new quadruples inserted just before those at given positions, renumbered
+#   A branch to one of those positions from one of the branches entering its insertion goes to the first quadruple
+#   inserted, and any other branch to it goes past them.
+#
+#   insertions - position -> (quadruples to insert, positions of the branches entering them)
+def insert_quadruples(quadruples, insertions):
+    new_positions = []  # position -> position in the result
+    inserted = 0
+    for position in range(len(quadruples)):
+        if position in insertions:
+            inserted += len(insertions[position][0])
+        new_positions.append(position + inserted)
+    new_positions.append(len(quadruples) + inserted)
+
+    result = []
+    for position, quadruple in enumerate(quadruples):
+        if position in insertions:
+            for new_quadruple in insertions[position][0]:
+                result.append([len(result) + 1] + list(new_quadruple[1:]))
+
+        quadruple = list(quadruple)
+        quadruple[0] = len(result) + 1
+        if quadruple[1] in BRANCH_OPCODES and isinstance(quadruple[4], int) and 0 < quadruple[4] <= len(quadruples):
+            target = quadruple[4] - 1
+            if target in insertions and position in insertions[target][1]:
+                quadruple[4] = new_positions[target] - len(insertions[target][0]) + 1
+            else:
+                quadruple[4] = new_positions[target] + 1
+        result.append(quadruple)
+
+    return result
+
+
+#   Call Arguments
+#   Positions of the args of each call of a function, as position of the call -> positions of its args in order
+#   Args are stacked as they are passed, and a call takes the last of them, so the args of a call whose arguments
+#   call functions themselves come before and after those calls.
+def call_arguments(quadruples, start, end):
+    arguments = {}
+    pending = []
+
+    for position in range(start, end + 1):
+        quadruple = quadruples[position]
+        if quadruple[1] == "arg":
+            pending.append(position)
+        elif quadruple[1] == "call":
+            if not str(quadruple[3]).isdigit() or int(quadruple[3]) > len(pending):
+                pending = []  # not generated by this compiler, so its args are not followed
+                continue
+            count = int(quadruple[3])
+            arguments[position] = pending[len(pending) - count:]
+            del pending[len(pending) - count:]
+
+    return arguments
+
+
+#   Array Names
+#   Names which may be arrays anywhere in a program: those allocated more than a word, and those indexed by disp
+def array_names(quadruples):
+    names = set()
+    for index, opcode, operand1, operand2, result in quadruples:
+        if opcode == "alloc" and str(operand1) != str(WORD_SIZE):
+            names.add(result)
+        elif opcode == "disp":
+            names.add(operand1)
+
+    return names
+
+
+#   Global Names
+#   Names allocated outside functions
+def global_names(quadruples):
+    names = set()
+    depth = 0
+    for quadruple in quadruples:
+        if quadruple[1] == "func":
+            depth += 1
+        elif quadruple[1] == "end" and quadruple[2] == "func":
+            depth -= 1
+        elif quadruple[1] == "alloc" and depth == 0:
+            names.add(quadruple[4])
+
+    return names
+
+
+#   Scoped Locals
+#   The names standing for a local of a function at each of its positions, as position -> frozenset of names
+#   A local is only in scope from its alloc to the end of the block declaring it, so elsewhere in the function a name
+#   it shares with a global stands for the global.
+def scoped_locals(quadruples, start, end):
+    in_scope = {}
+    scopes = [[]]
+    names = frozenset()
+
+    for position in range(start, end + 1):
+        quadruple = quadruples[position]
+        if quadruple[1] == "alloc":
+            scopes[-1].append(quadruple[4])
+            names = names | frozenset([quadruple[4]])
+        elif quadruple[1] == "block":
+            scopes.append([])
+        elif quadruple[1] == "end" and quadruple[2] == "block" and len(scopes) > 1:
+            scopes.pop()
+            names = frozenset(name for scope in scopes for name in scope)
+        in_scope[position] = names
+
+    return in_scope
+
+
+#   Tracked Variables
+#   Names in a function which always stand for the same scalar, so their values may be followed
+#   That is each temp other than reference temps, each local allocated once which is not also a global, and each
+#   global the function does not allocate. Arrays are never followed.
+#
+#   global_names - names allocated outside functions
+#   arrays - see array_names
+def tracked_variables(quadruples, start, end, references, global_names, arrays):
+    allocations = {}
+    names = set()
+
+    for position in range(start, end + 1):
+        quadruple = quadruples[position]
+        if quadruple[1] == "alloc":
+            allocations[quadruple[4]] = allocations.get(quadruple[4], 0) + 1
+
+        for operand in quadruple[2:]:
+            if isinstance(operand, str):
+                names.add(operand)
+
+    tracked = set()
+    for name in names:
+        if name in references or name in arrays or is_number(name) or name == "":
+            continue
+        if is_temp(name):
+            tracked.add(name)
+        elif name in allocations:
+            if allocations[name] == 1 and name not in global_names:
+                tracked.add(name)
+        elif name in global_names:
+            tracked.add(name)
+
+    return tracked
+
+
+#
+#   Inlining
+#   A call to a small leaf function, one which calls no function of the program and has no more than INLINE_LIMIT
+#   instructions, is replaced by the body of the function. Its parameters and locals are renamed where they are in
+#   scope to names no source can use, callee.instance.name, and allocated at the top of the caller, and its temps are
+#   renamed to temps the caller does not use. Each arg for a scalar parameter becomes an assign to the parameter where the arg was, so
+#   the argument is still read when it was; an array parameter is replaced by the array passed. A return becomes an
+#   assign to the temp of the call and a BR past the body. A call leaves a function's locals at zero, so the body
+#   starts by zeroing them and the temp of the call. Functions with local arrays, or with a local sharing its name
+#   with a parameter or another local, are not inlined, nor calls from a function which declares a name the callee
+#   reads as a global.
+#
+
+class Inliner(object):
+
+    def __init__(self, quadruples):
+        self.quadruples = quadruples
+        self.ranges = function_ranges(quadruples)
+        self.functions = set(quadruples[start][2] for start, end in self.ranges)
+        self.inlined = 0  # calls replaced
+        self.callees = set()  # functions inlined
+
+    # Inline every call to a small leaf function, returning the new quadruples
+    def inline(self):
+        quadruples = self.quadruples
+        callees = {}
+        for start, end in self.ranges:
+            callee = self.describe(start, end)
+            if callee is not None:
+                callees[quadruples[start][2]] = callee
+        if not callees:
+            return quadruples
+
+        self.result = []
+        self.new_positions = {}  # position -> position in the result of it, or of what took its place
+        self.fixed = set()  # positions in the result of branches whose targets are already resolved
+
+        ends = dict(self.ranges)
+        position = 0
+        while position < len(quadruples):
+            if position in ends:
+                self.inline_function(position, ends[position], callees)
+                position = ends[position] + 1
+            else:
+                self.copy(position)
+                position += 1
+
+        for position, quadruple in enumerate(self.result):
+            quadruple[0] = position + 1
+            if position not in self.fixed and quadruple[1] in BRANCH_OPCODES and isinstance(quadruple[4], int) and \
+                    0 < quadruple[4] <= len(quadruples):
+                quadruple[4] = self.new_positions[quadruple[4] - 1] + 1
+
+        return self.result
+
+    # What is needed to inline a function, or None if it is not inlined
+    def describe(self, start, end):
+        quadruples = self.quadruples
+        parameters = [quadruple[4] for quadruple in quadruples[start:end + 1] if quadruple[1] == "param"]
+        if str(len(parameters)) != str(quadruples[start][4] or 0):
+            return None
+
+        locals_declared = []
+        body = []
+        instructions = 0
+        for position in range(start + 1, end):
+            quadruple = quadruples[position]
+            previous = quadruples[position - 1]
+            if quadruple[1] == "param" or (quadruple[1] == "alloc" and previous[1] == "param" and
+                                           previous[4] == quadruple[4]):
+                continue  # a parameter, or the alloc of the parameter before it
+            if quadruple[1] == "alloc":
+                if str(quadruple[2]) != str(WORD_SIZE) or quadruple[4] in locals_declared or quadruple[4] in parameters:
+                    return None  # a local array, or a local sharing a name with another local or a parameter
+                locals_declared.append(quadruple[4])
+                continue
+            if quadruple[1] == "call" and quadruple[2] in self.functions:
+                return None
+            if quadruple[1] in BRANCH_OPCODES:
+                target = branch_target(quadruple)
+                if target is None or not start < target <= end:
+                    return None
+
+            if not is_declaration(quadruple):
+                instructions += 1
+            body.append(position)
+
+        if instructions > INLINE_LIMIT:
+            return None
+
+        array_parameters = set(quadruples[position][2] for position in body
+                               if quadruples[position][1] == "disp" and quadruples[position][2] in parameters)
+
+        locals_at = scoped_locals(quadruples, start, end)
+        global_reads = set()
+        for position in body:
+            quadruple = quadruples[position]
+            if is_declaration(quadruple):
+                continue
+            for operand in (quadruple[4],) if quadruple[1] == "call" else quadruple[2:]:
+                if isinstance(operand, str) and operand not in locals_at[position] and operand != "" and \
+                        not is_temp(operand) and not is_number(operand):
+                    global_reads.add(operand)
+
+        return {
+            "start": start,
+            "end": end,
+            "parameters": parameters,
+            "array parameters": array_parameters,
+            "locals": locals_declared,
+            "body": body,
+            "locals at": locals_at,
+            "globals": global_reads,
+        }
+
+    # Copy a quadruple into the result
+    def copy(self, position):
+        self.new_positions[position] = len(self.result)
+        self.result.append(list(self.quadruples[position]))
+
+    # Copy a function into the result, inlining its calls to the given callees
+    def inline_function(self, start, end, callees):
+        quadruples = self.quadruples
+        caller = quadruples[start][2]
+        allocated = set(quadruple[4] for quadruple in quadruples[start:end + 1] if quadruple[1] == "alloc")
+        references = reference_temps(quadruples, start, end)
+
+        temps = 0
+        for quadruple in quadruples[start:end + 1]:
+            for operand in quadruple[2:]:
+                if is_temp(operand) and operand[2:].isdigit():
+                    temps = max(temps, int(operand[2:]) + 1)
+
+        # find the calls to inline and the args of each
+        sites = {}  # position of a call -> (callee, positions of its args)
+        for position, arguments in call_arguments(quadruples, start, end).items():
+            quadruple = quadruples[position]
+            callee = callees.get(quadruple[2])
+            if callee is None or quadruple[2] == caller or len(arguments) != len(callee["parameters"]) or \
+                    callee["globals"] & allocated or quadruple[4] in references:
+                continue
+            if any(not isinstance(quadruples[argument][4], str) or is_temp(quadruples[argument][4]) or
+                   is_number(quadruples[argument][4]) or quadruples[argument][4] == ""
+                   for argument, parameter in zip(arguments, callee["parameters"])
+                   if parameter in callee["array parameters"]):
+                continue
+            sites[position] = (callee, arguments)
+
+        if not sites:
+            for position in range(start, end + 1):
+                self.copy(position)
+            return
+
+        # name the parameters and locals of each call inlined
+        renames = {}  # position of a call -> callee name -> caller name
+        argument_sites = {}  # position of an arg -> (position of its call, parameter)
+        allocations = []
+        for instance, position in enumerate(sorted(sites), 1):
+            callee, arguments = sites[position]
+            prefix = quadruples[callee["start"]][2] + "." + str(instance) + "."
+            renames[position] = {}
+            for argument, parameter in zip(arguments, callee["parameters"]):
+                argument_sites[argument] = (position, parameter)
+                if parameter in callee["array parameters"]:
+                    renames[position][parameter] = quadruples[argument][4]
+                else:
+                    renames[position][parameter] = prefix + parameter
+                    allocations.append(prefix + parameter)
+            for name in callee["locals"]:
+                renames[position][name] = prefix + name
+                allocations.append(prefix + name)
+
+        position = start
+        self.copy(position)
+        position += 1
+        while position < end and quadruples[position][1] in ("param", "alloc"):
+            self.copy(position)
+            position += 1
+        for name in allocations:
+            self.result.append([0, "alloc", str(WORD_SIZE), "", name])
+
+        while position <= end:
+            quadruple = quadruples[position]
+            if position in argument_sites:
+                call, parameter = argument_sites[position]
+                self.new_positions[position] = len(self.result)
+                if parameter not in sites[call][0]["array parameters"]:
+                    self.result.append([0, "assign", quadruple[4], "", renames[call][parameter]])
+            elif position in sites:
+                self.new_positions[position] = len(self.result)
+                temps = self.emit_body(sites[position][0], renames[position], quadruple[4], temps)
+                self.inlined += 1
+                self.callees.add(quadruple[2])
+            else:
+                self.copy(position)
+            position += 1
+
+    # Put the body of a callee into the result in place of a call, returning the temps the caller now uses
+    def emit_body(self, callee, renames, result, temps):
+        quadruples = self.quadruples
+        temp_names = {}
+
+        # a parameter or local is renamed only where it is in scope, elsewhere its name is a global's
+        def rename(operand, position):
+            if operand in renames and operand in callee["locals at"][position]:
+                return renames[operand]
+            if is_temp(operand):
+                if operand not in temp_names:
+                    temp_names[operand] = "_t" + str(temps + len(temp_names))
+                return temp_names[operand]
+            return operand
+
+        self.result.append([0, "assign", "0", "", result])
+        for name in callee["locals"]:
+            self.result.append([0, "assign", "0", "", renames[name]])
+
+        # lay the body out first, so branches within it can be resolved
+        emitted = []  # (quadruple, callee position it branches to or None)
+        first_emitted = {}  # callee position -> index in emitted of its first quadruple
+        for position in callee["body"]:
+            quadruple = quadruples[position]
+            first_emitted[position] = len(emitted)
+            if quadruple[1] == "return":
+                if quadruple[4] != "":
+                    emitted.append(([0, "assign", rename(quadruple[4], position), "", result], None))
+                emitted.append(([0, "BR", "", "", 0], callee["end"]))
+            elif quadruple[1] in BRANCH_OPCODES:
+                emitted.append(([0, quadruple[1], rename(quadruple[2], position), "", 0], branch_target(quadruple)))
+            elif is_declaration(quadruple):
+                emitted.append((list(quadruple), None))
+            elif quadruple[1] == "call":
+                emitted.append(([0, "call", quadruple[2], quadruple[3], rename(quadruple[4], position)], None))
+            else:
+                emitted.append(([0, quadruple[1]] + [rename(operand, position) for operand in quadruple[2:]], None))
+
+        following = len(emitted)
+        for position in range(callee["end"], callee["start"], -1):
+            if position in first_emitted:
+                following = first_emitted[position]
+            else:
+                first_emitted[position] = following
+
+        base = len(self.result)
+        for quadruple, target in emitted:
+            if target is not None:
+                quadruple[4] = base + first_emitted[target] + 1
+                self.fixed.add(len(self.result))
+            self.result.append(quadruple)
+
+        return temps + len(temp_names)
+
+
+#   Inline Functions
+#   Replace calls to small leaf functions by their bodies
+def inline_functions(quadruples):
+    inliner = Inliner(copy_quadruples(quadruples))
+    inlined = inliner.inline()
+
+    return inlined, "inlined " + str(inliner.inlined) + " calls to " + str(len(inliner.callees)) + " functions"
+
+
+#
+#   Tail Calls
+#   A call of a function to itself whose result is returned at once, with nothing run in between, is a tail call:
+#   the call made has nothing left to do once the call it makes returns. It is replaced by a BR back to the start of
+#   the function, after giving the parameters their new values, so the recursion runs as a loop in one activation
+#   record. Each arg becomes an assign to a temp of its own where the arg was, as later arguments may still read the
+#   parameters, and the temps are copied to the parameters in place of the call. A call leaves the locals of a
+#   function at zero, so they are zeroed before the BR. Only functions whose locals are scalars declared at the top
+#   of the function are changed, and only calls passing no array but the function's own array parameters.
+#
+
+#   Eliminate Tail Calls
+#   Turn calls of functions to themselves which end them into branches back to their start
+def eliminate_tail_calls(quadruples):
+    quadruples = copy_quadruples(quadruples)
+    arrays = array_names(quadruples)
+    calls = 0
+    functions = set()
+
+    # later functions first, so positions in earlier functions do not move
+    for start, end in reversed(function_ranges(quadruples)):
+        name, returns = quadruples[start][2], quadruples[start][3]
+        parameters = [quadruple[4] for quadruple in quadruples[start:end + 1] if quadruple[1] == "param"]
+
+        entry = start + 1
+        while entry < end and quadruples[entry][1] in ("param", "alloc"):
+            entry += 1
+        local_names = [quadruple[4] for quadruple in quadruples[start + 1:entry]
+                       if quadruple[1] == "alloc" and quadruple[4] not in parameters]
+        if any(quadruples[position][1] == "alloc" for position in range(entry, end)) or \
+                any(str(quadruple[2]) != str(WORD_SIZE) for quadruple in quadruples[start + 1:entry]
+                    if quadruple[1] == "alloc"):
+            continue  # locals which cannot be zeroed from the tail calls
+
+        temps = 0
+        for quadruple in quadruples[start:end + 1]:
+            for operand in quadruple[2:]:
+                if is_temp(operand) and operand[2:].isdigit():
+                    temps = max(temps, int(operand[2:]) + 1)
+
+        insertions = {}
+        for position, arguments in sorted(call_arguments(quadruples, start, end).items()):
+            quadruple = quadruples[position]
+            if quadruple[2] != name or len(arguments) != len(parameters):
+                continue
+
+            following = quadruples[destination(quadruples, position + 1, end)]
+            if following[1] == "return" and following[4] != "":
+                if following[4] != quadruple[4]:
+                    continue
+            elif returns != "void" or not (following[1] == "return" or following[1:3] == ["end", "func"]):
+                continue
+
+            values = [quadruples[argument][4] for argument in arguments]
+            if any(value in arrays and value not in parameters for value in values):
+                continue
+
+            sequence = []
+            for argument, parameter in zip(arguments, parameters):
+                quadruples[argument][1:] = ["assign", quadruples[argument][4], "", "_t" + str(temps)]
+                sequence.append([0, "assign", "_t" + str(temps), "", parameter])
+                temps += 1
+            sequence.extend([0, "assign", "0", "", local] for local in local_names)
+            sequence.append([0, "BR", "", "", entry + 1])
+
+            quadruples[position][1:] = sequence[0][1:]
+            insertions[position + 1] = (sequence[1:], ())
+            calls += 1
+            functions.add(name)
+
+        if insertions:
+            quadruples = insert_quadruples(quadruples, insertions)
+
+    return quadruples, "tail calls " + str(calls) + " in " + str(len(functions)) + " functions"
+
+
+#
+#   Constant Folding
+#   Values are followed forward through each function, over its flow graph, as a map from a tracked name to the
+#   literal it is known to hold. A name is known on entry to a block when every block leading to it leaves it with
+#   the same literal. Reads of known names are replaced by their literals, arithmetic and comparisons on literals
+#   become assignments of the result, and branches on known comparisons become a BR or are removed. Temps which
+#   were given a literal and are no longer read are removed, and the quadruples renumbered. A call may change any
+#   global, so globals are forgotten at each call.
+#
+
+#   Fold
+#   The literal an opcode gives for two literals, or None if it is not worked out while compiling
+def fold(opcode, left, right):
+    left = number_value(left)
+    right = number_value(right)
+
+    if opcode == "add":
+        value = left + right
+    elif opcode == "sub":
+        value = left - right
+    elif opcode == "mult":
+        value = left * right
+    elif opcode == "div":
+        if right == 0:
+            return None  # left for the program to fail on
+        value = divide(left, right)
+    else:
+        value = (left > right) - (left < right)
+
+    return number_literal(value)
+
+
+#   Identity
+#   The operand an arithmetic quadruple with one literal operand leaves unchanged, or None
+def identity(opcode, left, right):
+    if opcode == "add" and left == "0":
+        return right
+    if opcode in ("add", "sub") and right == "0":
+        return left
+    if opcode == "mult" and left == "1":
+        return right
+    if opcode in ("mult", "div") and right == "1":
+        return left
+
+    return None
+
+
+class ConstantFolder(object):
+
+    def __init__(self, quadruples):
+        self.quadruples = copy_quadruples(quadruples)
+        self.global_names = global_names(quadruples)
+        self.arrays = array_names(quadruples)
+        self.folded = 0  # arithmetic and comparisons worked out
+        self.propagated = 0  # reads replaced by a literal
+        self.branches = 0  # branches decided
+
+    # Fold every function, returning the folded quadruples
+    def fold(self):
+        removed = set()
+
+        for start, end in function_ranges(self.quadruples):
+            removed |= self.fold_function(start, end)
+
+        return remove_quadruples(self.quadruples, removed)
+
+    # Fold a function in place, returning the positions of quadruples to remove
+    def fold_function(self, start, end):
+        quadruples = self.quadruples
+        graph = FlowGraph(quadruples, start, end)
+        references = graph.references
+        tracked = tracked_variables(quadruples, start, end, references, self.global_names, self.arrays)
+        globals_tracked = set(name for name in tracked if name in self.global_names)
+
+        # find the literals known on entry to each block
+        entry_states = {graph.blocks[0]: {}}
+        exit_states = {}
+        pending = list(graph.blocks)
+        while pending:
+            block = pending.pop(0)
+            if block not in entry_states:
+                continue
+
+            state = dict(entry_states[block])
+            for position in range(block.start, block.end + 1):
+                self.step(quadruples[position], state, tracked, references, globals_tracked)
+
+            if exit_states.get(block) == state:
+                continue
+            exit_states[block] = state
+
+            for successor in block.successors:
+                known = [exit_states[predecessor] for predecessor in successor.predecessors
+                         if predecessor in exit_states]
+                if successor is graph.blocks[0]:
+                    known.append({})
+
+                entry = dict(known[0])
+                for other in known[1:]:
+                    entry = dict((name, literal) for name, literal in entry.items() if other.get(name) == literal)
+
+                if entry_states.get(successor) != entry:
+                    entry_states[successor] = entry
+                    if successor not in pending:
+                        pending.append(successor)
+
+        # rewrite each block reached, from what is known on entry to it
+        constant_temps = set()  # positions of quadruples leaving a literal in a temp
+        removed = set()
+        for block in graph.blocks:
+            if block not in entry_states:
+                continue
+
+            state = dict(entry_states[block])
+            for position in range(block.start, block.end + 1):
+                if self.rewrite(quadruples[position], state, references):
+                    removed.add(position)
+                    continue
+
+                quadruple = quadruples[position]
+                if quadruple[1] == "assign" and is_number(quadruple[2]) and quadruple[4] in tracked \
+                        and is_temp(quadruple[4]):
+                    constant_temps.add(position)
+
+                self.step(quadruple, state, tracked, references, globals_tracked)
+
+        # remove quadruples leaving a literal in a temp which is no longer read
+        read = set()
+        for position in range(start, end + 1):
+            if position not in removed:
+                read.update(operand for operand in reads(quadruples[position], references) if is_temp(operand))
+
+        for position in constant_temps:
+            if quadruples[position][4] not in read:
+                removed.add(position)
+
+        return removed
+
+    # Replace the reads of a quadruple by what is known of them, folding it if it can be
+    # Returns True if the quadruple should be removed, as a branch which is never taken.
+    def rewrite(self, quadruple, state, references):
+        opcode = quadruple[1]
+
+        for operand in READ_OPERANDS.get(opcode, ()):
+            if opcode == "disp" and operand == 2:
+                continue  # the array, not a value
+            literal = state.get(quadruple[operand])
+            if literal is not None:
+                quadruple[operand] = literal
+                self.propagated += 1
+
+        if opcode in BINARY_OPCODES:
+            left, right = quadruple[2], quadruple[3]
+            if is_number(left) and is_number(right):
+                value = fold(opcode, left, right)
+                if value is not None:
+                    quadruple[1:4] = ["assign", value, ""]
+                    self.folded += 1
+            elif opcode != "comp" and quadruple[4] not in references:
+                same = identity(opcode, left, right)
+                if same is not None:
+                    quadruple[1:4] = ["assign", same, ""]
+                    self.folded += 1
+        elif opcode in BRANCH_TESTS and is_number(quadruple[2]):
+            self.branches += 1
+            if not BRANCH_TESTS[opcode](number_value(quadruple[2])):
+                return True
+            quadruple[1:4] = ["BR", "", ""]
+
+        return False
+
+    # Update what is known after a quadruple
+    def step(self, quadruple, state, tracked, references, globals_tracked):
+        opcode = quadruple[1]
+
+        if opcode == "call":
+            for name in globals_tracked:
+                state.pop(name, None)
+
+        written = writes(quadruple, references)
+        if written is None or written not in tracked:
+            return
+
+        literal = None
+        if opcode == "assign":
+            literal = self.known(quadruple[2], state)
+        elif opcode in BINARY_OPCODES:
+            left = self.known(quadruple[2], state)
+            right = self.known(quadruple[3], state)
+            if left is not None and right is not None:
+                literal = fold(opcode, left, right)
+
+        if literal is None:
+            state.pop(written, None)
+        else:
+            state[written] = literal
+
+    # the literal an operand is known to hold, or None
+    def known(self, operand, state):
+        if is_number(operand):
+            return operand
+
+        return state.get(operand)
+
+
+#   Fold Constants
+#   Work out arithmetic and comparisons on constants while compiling, and carry known values forward
+def fold_constants(quadruples):
+    folder = ConstantFolder(quadruples)
+    folded = folder.fold()
+
+    return folded, "folded " + str(folder.folded) + ", propagated " + str(folder.propagated) + \
+        ", branches decided " + str(folder.branches) + ", removed " + str(len(quadruples) - len(folded))
+
+
+#
+#   Jump Threading
+#   A branch to a BR is sent on to where the BR goes, so a chain of jumps is taken in one. Then blocks of the flow
+#   graph which cannot be reached from the start of their function lose their instructions, and branches to the
+#   instruction which would run next anyway are removed. Declarations are kept, as the scopes of a function are
+#   read from them. The quadruples and branch targets are renumbered, and the whole is repeated until nothing
+#   changes.
+#
+
+#   Destination
+#   Position of the first instruction at or after a position, passing over declarations
+def destination(quadruples, position, end):
+    while position < end and is_declaration(quadruples[position]):
+        position += 1
+
+    return position
+
+
+#   Thread Jumps
+#   Send branches straight to where they end up, and remove branches and instructions which are never needed
+def thread_jumps(quadruples):
+    quadruples = copy_quadruples(quadruples)
+    threaded = 0
+    unreachable = 0
+    branches = 0
+
+    while True:
+        removed = set()
+
+        for start, end in function_ranges(quadruples):
+            for position in range(start, end + 1):
+                quadruple = quadruples[position]
+                target = branch_target(quadruple) if quadruple[1] in BRANCH_OPCODES else None
+                if target is None or not start < target <= end:
+                    continue
+
+                passed = set()
+                while True:
+                    landing = destination(quadruples, target, end)
+                    following = branch_target(quadruples[landing]) if quadruples[landing][1] == "BR" else None
+                    if following is None or not start < following <= end or landing in passed:
+                        break
+                    passed.add(landing)
+                    target = following
+
+                if target != branch_target(quadruple):
+                    quadruple[4] = target + 1
+                    threaded += 1
+
+            graph = FlowGraph(quadruples, start, end)
+            reached = graph.reachable()
+            for block in graph.blocks:
+                if block in reached:
+                    continue
+                for position in range(block.start, block.end + 1):
+                    if position < end and not is_declaration(quadruples[position]):
+                        removed.add(position)
+                        unreachable += 1
+
+            for position in range(start, end):
+                quadruple = quadruples[position]
+                target = branch_target(quadruple) if quadruple[1] in BRANCH_OPCODES else None
+                if position in removed or target is None or not start < target <= end:
+                    continue
+                if destination(quadruples, position + 1, end) == destination(quadruples, target, end):
+                    removed.add(position)
+                    branches += 1
+
+        if not removed:
+            break
+        quadruples = remove_quadruples(quadruples, removed)
+
+    return quadruples, "threaded " + str(threaded) + ", unreachable removed " + str(unreachable) + \
+        ", branches removed " + str(branches)
+
+
+#
+#   Common Subexpressions
+#   Within each run of local_blocks, every value is given a number: a literal by its text, a name by what was last
+#   written to it, and an arithmetic quadruple or disp by its opcode and the numbers of its operands. An element
+#   read through a reference temp is numbered by its address and the stores made so far in the run, so a store
+#   gives every element read after it a new number. A quadruple computing a number a temp already holds is removed,
+#   and its temp renamed to that temp. This is only done when both temps are written once in the function and the
+#   removed temp is only read later in the run, so the temp kept holds the same value wherever the other was read.
+#
+
+class ValueNumbering(object):
+
+    def __init__(self, quadruples):
+        self.quadruples = copy_quadruples(quadruples)
+        self.eliminated = 0  # computations removed
+
+    # Number every function, returning the quadruples without repeated computations
+    def eliminate(self):
+        removed = set()
+
+        for start, end in function_ranges(self.quadruples):
+            removed |= self.eliminate_function(start, end)
+
+        return remove_quadruples(self.quadruples, removed)
+
+    # Number a function in place, returning the positions of quadruples to remove
+    def eliminate_function(self, start, end):
+        quadruples = self.quadruples
+        graph = FlowGraph(quadruples, start, end)
+        references = graph.references
+
+        writes_of = {}  # temp -> quadruples writing it
+        first_read = {}  # temp -> first and last positions reading it
+        last_read = {}
+        for position in range(start, end + 1):
+            written = writes(quadruples[position], references)
+            if is_temp(written):
+                writes_of[written] = writes_of.get(written, 0) + 1
+            for operand in reads(quadruples[position], references):
+                if is_temp(operand):
+                    first_read.setdefault(operand, position)
+                    last_read[operand] = position
+
+        removed = set()
+        for first, last in local_blocks(graph):
+            numbers = {}  # operand -> value number
+            computations = {}  # (opcode, operand numbers) -> value number
+            holders = {}  # value number -> temp written once holding it
+            renamed = {}  # removed temp -> temp holding its value
+            stores = 0
+
+            def number(operand):
+                if operand not in numbers:
+                    numbers[operand] = len(numbers) + len(computations)
+                if operand in references:
+                    return computation(("element", numbers[operand], stores))
+                return numbers[operand]
+
+            def computation(key):
+                if key not in computations:
+                    computations[key] = len(numbers) + len(computations)
+                return computations[key]
+
+            for position in range(first, last + 1):
+                quadruple = quadruples[position]
+                for operand in range(2, 5):
+                    if quadruple[operand] in renamed:
+                        quadruple[operand] = renamed[quadruple[operand]]
+
+                opcode = quadruple[1]
+                written = writes(quadruple, references)
+                if written is None:
+                    if opcode in WRITING_OPCODES:
+                        stores += 1
+                    continue
+
+                if opcode in COMMON_OPCODES:
+                    if opcode == "disp":
+                        key = (opcode, quadruple[2], number(quadruple[3]))
+                    else:
+                        key = (opcode, number(quadruple[2]), number(quadruple[3]))
+                        if opcode in COMMUTATIVE_OPCODES:
+                            key = (opcode,) + tuple(sorted(key[1:]))
+
+                    value = computation(key)
+                    holder = holders.get(value)
+                    if holder is not None and holder != written and writes_of.get(written) == 1 and \
+                            first_read.get(written, end + 1) > position and last_read.get(written, first) <= last:
+                        renamed[written] = holder
+                        removed.add(position)
+                        self.eliminated += 1
+                        continue
+                elif opcode == "assign":
+                    value = number(quadruple[2])
+                else:
+                    value = computation((position,))  # a value of its own
+
+                numbers[written] = value
+                if is_temp(written) and writes_of.get(written) == 1:
+                    holders.setdefault(value, written)
+
+        return removed
+
+
+#   Eliminate Common Subexpressions
+#   Remove computations of a value a temp already holds, within each run of quadruples
+def eliminate_common_subexpressions(quadruples):
+    numbering = ValueNumbering(quadruples)
+    numbered = numbering.eliminate()
+
+    return numbered, "eliminated " + str(numbering.eliminated)
+
+
+#
+#   Loop Invariant Code Motion
+#   The natural loops of each function are found from its back edges, inner loops first. An add, sub, mult or disp
+#   in a loop whose operands are literals, names the loop never writes, or temps of quadruples already moved, gives
+#   the same value on every iteration. It is moved into a preheader just before the header of the loop, to run once
+#   rather than on every iteration. A div is only moved when it divides by a literal other than zero, so it cannot
+#   fail. The temp of a quadruple moved must be written once in the function, and only read where the quadruple
+#   has already run. A global is not invariant in a loop which calls a function, even where another block of the
+#   function declares a local of the same name, as names are resolved by scope with scoped_locals. A name declared
+#   within the loop is never moved out of its scope. Branches to the header from outside the loop go to the preheader, and the
+#   back edges still go to the header.
+#
+#   A loop may not run at all, so the preheader runs quadruples the loop might not have. None of them can fail, as
+#   a disp only works out an address, see lib/virtual_machine.py.
+#
+
+class LoopInvariants(object):
+
+    def __init__(self, quadruples):
+        self.quadruples = copy_quadruples(quadruples)
+        self.hoisted = 0  # quadruples moved out of a loop
+        self.loops = 0  # loops given a preheader
+
+    # Move invariant quadruples out of every loop, returning the new quadruples
+    def hoist(self):
+        changed = True
+        while changed:
+            changed = False
+            for start, end in function_ranges(self.quadruples):
+                if self.hoist_function(start, end):
+                    changed = True
+                    break
+
+        return self.quadruples
+
+    # Move the invariant quadruples of the first loop of a function which has any, returning True if it did
+    def hoist_function(self, start, end):
+        quadruples = self.quadruples
+        graph = FlowGraph(quadruples, start, end)
+        loops = graph.loops()
+        if not loops:
+            return False
+
+        references = graph.references
+        block_of = {}  # position -> block holding it
+        for block in graph.blocks:
+            for position in range(block.start, block.end + 1):
+                block_of[position] = block
+
+        locals_at = scoped_locals(quadruples, start, end)
+        writes_of = {}  # temp -> quadruples writing it
+        read_at = {}  # temp -> positions reading it
+        for position in range(start, end + 1):
+            quadruple = quadruples[position]
+            written = writes(quadruple, references)
+            if is_temp(written):
+                writes_of[written] = writes_of.get(written, 0) + 1
+            for operand in reads(quadruple, references):
+                if is_temp(operand):
+                    read_at.setdefault(operand, []).append(position)
+
+        for header, body in loops:
+            previous = block_of.get(header.start - 1)
+            if previous in body:
+                continue  # the loop falls into its header, so there is no place outside it for a preheader
+
+            positions = sorted(position for block in body for position in range(block.start, block.end + 1))
+            written = set()
+            declared = set()
+            calls = False
+            for position in range(positions[0], positions[-1] + 1):
+                if quadruples[position][1] == "alloc":
+                    declared.add(quadruples[position][4])
+            for position in positions:
+                written.add(writes(quadruples[position], references))
+                calls = calls or quadruples[position][1] == "call"
+
+            hoisted = []
+            hoisted_temps = set()
+
+            # whether an operand read at a position holds the same value on every iteration
+            def invariant(operand, position):
+                if operand == "" or operand in references:
+                    return False  # an element may change on any iteration
+                if is_number(operand) or operand in hoisted_temps:
+                    return True
+                if operand in written or operand in declared:
+                    return False
+
+                return not calls or is_temp(operand) or operand in locals_at[position]
+
+            for position in positions:
+                opcode, operand1, operand2, temp = quadruples[position][1:]
+                if opcode not in COMMON_OPCODES or not is_temp(temp) or writes_of.get(temp) != 1:
+                    continue
+                if opcode == "disp":
+                    if operand1 in declared or not invariant(operand2, position):
+                        continue
+                elif temp in references or not invariant(operand1, position) or not invariant(operand2, position):
+                    continue
+                if opcode == "div" and not (is_number(operand2) and number_value(operand2) != 0):
+                    continue
+
+                block = block_of[position]
+                if not all(block_of[read] is block and read > position or
+                           block_of[read] is not block and block in (block_of[read].dominators or ())
+                           for read in read_at.get(temp, ())):
+                    continue
+
+                hoisted.append(position)
+                hoisted_temps.add(temp)
+
+            if hoisted:
+                self.quadruples = move_quadruples(quadruples, hoisted, header.start, set(positions))
+                self.hoisted += len(hoisted)
+                self.loops += 1
+                return True
+
+        return False
+
+
+#   Hoist Loop Invariants
+#   Move quadruples giving the same value on every iteration of a loop out in front of it
+def hoist_loop_invariants(quadruples):
+    invariants = LoopInvariants(quadruples)
+    hoisted = invariants.hoist()
+
+    return hoisted, "hoisted " + str(invariants.hoisted) + " from " + str(invariants.loops) + " loops"
+
+
+#
+#   Strength Reduction
+#   A basic induction variable of a loop is a variable which the loop only changes by adding or subtracting a
+#   literal, as i = i + 1 is generated: an add or sub of the variable and a literal into a temp, then an assign of
+#   the temp to the variable. A temp is linear in an induction variable when it is worked out from it in the same
+#   block, adding or subtracting invariants and multiplying by literals. The offset of an array element, a mult of
+#   such a temp by the word size, then changes by a known step whenever the variable does. Each such offset is given
+#   a temp of its own, worked out in a preheader in front of the loop and stepped by an add after each change of
+#   the variable, and the mult is removed along with the quadruples which only fed it. This is only done when more
+#   quadruples leave the loop than adds are put in. An address can only be read through, so the disp of the offset
+#   stays. In a loop which calls a function, a global is neither an induction variable nor invariant, since the call
+#   may change it; as in loop invariant code motion, names are resolved by scope with scoped_locals.
+#
+
+class InductionVariables(object):
+
+    def __init__(self, quadruples):
+        self.quadruples = copy_quadruples(quadruples)
+        self.arrays = array_names(quadruples)
+        self.reduced = 0  # mults removed
+        self.offsets = 0  # offset temps stepped instead
+
+    # Reduce the offsets of every loop, returning the new quadruples
+    def reduce(self):
+        changed = True
+        while changed:
+            changed = False
+            for start, end in function_ranges(self.quadruples):
+                if self.reduce_function(start, end):
+                    changed = True
+                    break
+
+        return self.quadruples
+
+    # Reduce the offsets of the first loop of a function which has any, returning True if it did
+    def reduce_function(self, start, end):
+        quadruples = self.quadruples
+        graph = FlowGraph(quadruples, start, end)
+        loops = graph.loops()
+        if not loops:
+            return False
+
+        references = graph.references
+        block_of = {}  # position -> block holding it
+        for block in graph.blocks:
+            for position in range(block.start, block.end + 1):
+                block_of[position] = block
+
+        locals_at = scoped_locals(quadruples, start, end)
+        writes_of = {}  # temp -> quadruples writing it
+        defined_at = {}  # temp -> position of a quadruple writing it
+        read_at = {}  # temp -> positions reading it
+        temps = 0  # temps numbered below this one are taken
+        for position in range(start, end + 1):
+            quadruple = quadruples[position]
+            written = writes(quadruple, references)
+            if is_temp(written):
+                writes_of[written] = writes_of.get(written, 0) + 1
+                defined_at[written] = position
+            for operand in reads(quadruple, references):
+                if is_temp(operand):
+                    read_at.setdefault(operand, []).append(position)
+            for operand in quadruple[2:]:
+                if is_temp(operand) and operand[2:].isdigit():
+                    temps = max(temps, int(operand[2:]) + 1)
+
+        for header, body in loops:
+            if block_of.get(header.start - 1) in body:
+                continue  # no place outside the loop for a preheader
+
+            positions = sorted(position for block in body for position in range(block.start, block.end + 1))
+            inside = set(positions)
+            written = {}  # name -> positions in the loop writing it
+            declared = set()
+            calls = False
+            for position in range(positions[0], positions[-1] + 1):
+                if quadruples[position][1] == "alloc":
+                    declared.add(quadruples[position][4])
+            for position in positions:
+                written.setdefault(writes(quadruples[position], references), []).append(position)
+                calls = calls or quadruples[position][1] == "call"
+
+            # whether an operand read at a position holds the same value on every iteration
+            def invariant(operand, position):
+                if operand == "" or operand in references or operand in written or operand in declared:
+                    return False
+
+                return is_number(operand) or not calls or is_temp(operand) or operand in locals_at[position]
+
+            # position of each change of each basic induction variable -> its step
+            steps = {}
+            for name, changes in written.items():
+                if name is None or is_temp(name) or name in references or name in self.arrays or name in declared:
+                    continue
+                if calls and any(name not in locals_at[position] for position in changes + [header.start]):
+                    continue  # a global, which the calls may change
+
+                updates = {}
+                for position in changes:
+                    step = self.step(name, position, defined_at, writes_of, block_of)
+                    if step is None or any(position > other > defined_at[quadruples[position][2]]
+                                           for other in changes):
+                        break
+                    updates[position] = step
+                else:
+                    steps[name] = updates
+
+            # the induction variable, factor, quadruples and form of a temp read at a position, or None
+            def linear(operand, position):
+                if operand in steps:
+                    return operand, 1, [], operand
+                if not is_temp(operand) or writes_of.get(operand) != 1:
+                    return None
+
+                definition = defined_at[operand]
+                if definition not in inside or block_of[definition] is not block_of[position] or \
+                        definition > position:
+                    return None
+
+                opcode = quadruples[definition][1]
+                if opcode not in ("add", "sub", "mult"):
+                    return None
+
+                for side, other in ((2, 3), (3, 2)):
+                    found = linear(quadruples[definition][side], definition)
+                    if found is None:
+                        continue
+
+                    variable, factor, chain, form = found
+                    operand = quadruples[definition][other]
+                    if opcode == "mult":
+                        if not is_number(operand) or not isinstance(number_value(operand), int):
+                            continue
+                        factor *= number_value(operand)
+                    elif not invariant(operand, definition):
+                        continue
+                    elif opcode == "sub" and side == 3:
+                        factor = -factor
+
+                    return variable, factor, chain + [definition], (opcode, side, form, operand)
+
+                return None
+
+            candidates = {}  # form -> (induction variable, factor, chain, positions of mults, of their chains)
+            for position in positions:
+                opcode, operand1, operand2, temp = quadruples[position][1:]
+                if opcode != "mult" or not is_temp(temp) or temp in references or writes_of.get(temp) != 1:
+                    continue
+                if operand2 == str(WORD_SIZE):
+                    found = linear(operand1, position)
+                elif operand1 == str(WORD_SIZE):
+                    found = linear(operand2, position)
+                else:
+                    continue
+                if found is None:
+                    continue
+
+                variable, factor, chain, form = found
+                first = chain[0] if chain else position
+                reads_of_temp = read_at.get(temp, [])
+                if not all(block_of[read] is block_of[position] and read > position for read in reads_of_temp):
+                    continue
+                last = max(reads_of_temp) if reads_of_temp else position
+                if any(first < change <= last for change in steps[variable]):
+                    continue  # the variable changes before the offset is used
+
+                candidate = candidates.setdefault(form, (variable, factor, chain, [], set()))
+                candidate[3].append(position)
+                candidate[4].update(chain)
+
+            # an offset is stepped only if that takes more quadruples out of the loop than the adds stepping it
+            offsets = {}  # form -> [temp, induction variable, factor, chain]
+            renamed = {}  # temp of a mult removed -> offset temp
+            removed = set()
+            for form, (variable, factor, chain, mults, chains) in sorted(candidates.items(),
+                                                                         key=lambda item: item[1][3]):
+                gone = set(mults)
+                for definition in sorted(chains, reverse=True):
+                    if all(read in gone for read in read_at.get(quadruples[definition][4], ())):
+                        gone.add(definition)
+                if len(gone) <= len([step for step in steps[variable].values() if step * factor]):
+                    continue
+
+                offsets[form] = ["_t" + str(temps), variable, factor, chain]
+                temps += 1
+                for position in mults:
+                    renamed[quadruples[position][4]] = offsets[form][0]
+                removed |= gone
+
+            if not removed:
+                continue
+
+            preheader = []
+            changes = {}  # position of a change of a variable -> quadruples stepping its offsets
+            for form, (offset, variable, factor, chain) in sorted(offsets.items(), key=lambda item: item[1][0]):
+                copies = {}
+                for definition in chain:
+                    copies[quadruples[definition][4]] = "_t" + str(temps)
+                    temps += 1
+                    preheader.append([0] + [copies.get(operand, operand) for operand in quadruples[definition][1:]])
+
+                value = copies[quadruples[chain[-1]][4]] if chain else variable
+                preheader.append([0, "mult", value, str(WORD_SIZE), offset])
+
+                for change, step in steps[variable].items():
+                    if step * factor:
+                        changes.setdefault(change + 1, []).append(
+                            [0, "add", offset, number_literal(step * factor * WORD_SIZE), offset])
+
+            for position in range(start, end + 1):
+                quadruple = quadruples[position]
+                for operand in range(2, 5):
+                    if quadruple[operand] in renamed:
+                        quadruple[operand] = renamed[quadruple[operand]]
+
+            entering = set(position for position in range(start, end + 1)
+                           if position not in inside and quadruples[position][1] in BRANCH_OPCODES and
+                           branch_target(quadruples[position]) == header.start)
+            insertions = dict((position, (stepping, ())) for position, stepping in changes.items())
+            insertions[header.start] = (preheader + insertions.get(header.start, ([], ()))[0], entering)
+
+            inserted = insert_quadruples(quadruples, insertions)
+            shift = lambda position: position + sum(len(insertions[other][0]) for other in insertions
+                                                    if other <= position)
+            self.quadruples = remove_quadruples(inserted, set(shift(position) for position in removed))
+            self.reduced += len(renamed)
+            self.offsets += len(offsets)
+            return True
+
+        return False
+
+    # The step a quadruple changing a variable adds to it, or None if it is not of the form variable = variable + c
+    def step(self, name, position, defined_at, writes_of, block_of):
+        quadruple = self.quadruples[position]
+        if quadruple[1] != "assign" or not is_temp(quadruple[2]) or writes_of.get(quadruple[2]) != 1:
+            return None
+
+        definition = defined_at[quadruple[2]]
+        if block_of[definition] is not block_of[position] or definition > position:
+            return None
+
+        opcode, operand1, operand2 = self.quadruples[definition][1:4]
+        if opcode == "add" and operand2 == name:
+            operand1, operand2 = operand2, operand1
+        if opcode not in ("add", "sub") or operand1 != name or not is_number(operand2):
+            return None
+
+        step = number_value(operand2)
+        if not isinstance(step, int):
+            return None
+
+        return step if opcode == "add" else -step
+
+
+#   Reduce Strength
+#   Step the offsets of array elements indexed by induction variables, rather than multiplying them out
+def reduce_strength(quadruples):
+    induction = InductionVariables(quadruples)
+    reduced = induction.reduce()
+
+    return reduced, "mults removed " + str(induction.reduced) + ", offsets stepped " + str(induction.offsets)
+
+
+#
+#   Dead Code
+#   Temps and scalar locals are followed backward over the flow graph of each function, as the operands live after
+#   each quadruple. An arithmetic, comp, assign or disp writing a name which is not live after it is removed, so a
+#   temp which is never read and a store to a local which is overwritten or forgotten before it is read both go.
+#   Globals may be read by other functions, so they are always live. Calls, arguments, returns and branches are
+#   never removed, nor a store through a reference temp. A quadruple reading an element, or dividing by anything but
+#   a literal other than zero, is kept as well, since it may fail. Removing a quadruple may leave those feeding it
+#   dead, so the whole is repeated until nothing is removed. Then the allocs of locals which are no longer used are
+#   removed too.
+#
+
+# opcodes which have no effect besides writing their result
+PURE_OPCODES = frozenset(["add", "sub", "mult", "div", "comp", "assign", "disp"])
+
+
+#   Is Dead
+#   True if a quadruple only writes a name which is not live after it, and cannot fail
+def is_dead(quadruple, written, live, tracked, references):
+    if quadruple[1] not in PURE_OPCODES or written is None or written not in tracked or written in live:
+        return False
+    if quadruple[1] == "div" and not (is_number(quadruple[3]) and number_value(quadruple[3]) != 0):
+        return False
+    if quadruple[1] != "disp" and any(operand in references for operand in quadruple[2:4]):
+        return False
+
+    return True
+
+
+#   Remove Dead Code
+#   Remove quadruples whose results are never read
+def remove_dead_code(quadruples):
+    globals_allocated = global_names(quadruples)
+    arrays = array_names(quadruples)
+
+    temps = 0
+    stores = 0
+    while True:
+        removed = set()
+
+        for start, end in function_ranges(quadruples):
+            graph = FlowGraph(quadruples, start, end)
+            references = graph.references
+            tracked = tracked_variables(quadruples, start, end, references, globals_allocated, arrays)
+            tracked = (tracked - globals_allocated) | references
+            graph.liveness(tracked=lambda operand: operand in tracked)
+
+            for block in graph.blocks:
+                live = set(block.live_out)
+                for position in range(block.end, block.start - 1, -1):
+                    quadruple = quadruples[position]
+                    written = writes(quadruple, references)
+                    if is_dead(quadruple, written, live, tracked, references):
+                        removed.add(position)
+                        if is_temp(written):
+                            temps += 1
+                        else:
+                            stores += 1
+                        continue
+
+                    live.discard(written)
+                    live.update(operand for operand in reads(quadruple, references) if operand in tracked)
+
+        if not removed:
+            break
+        quadruples = remove_quadruples(quadruples, removed)
+
+    # locals no quadruple uses any more need no storage
+    removed = set()
+    for start, end in function_ranges(quadruples):
+        parameters = set(quadruple[4] for quadruple in quadruples[start:end + 1] if quadruple[1] == "param")
+        used = set()
+        for quadruple in quadruples[start:end + 1]:
+            if quadruple[1] != "alloc":
+                used.update(quadruple[2:])
+        for position in range(start, end + 1):
+            quadruple = quadruples[position]
+            if quadruple[1] == "alloc" and quadruple[4] not in used and quadruple[4] not in parameters:
+                removed.add(position)
+    quadruples = remove_quadruples(quadruples, removed)
+
+    return quadruples, "dead temps " + str(temps) + ", dead stores " + str(stores) + ", unused locals " + \
+        str(len(removed))
+
+
+#
+#   Temp Reuse
+#   Temps are renamed so that temps which are never live at the same time share a name. A temp is live from where
+#   it is written to where it is last read, and over every block it is live through, so its live range is an
+#   interval of positions. Each quadruple has two points: its reads, then its write, so a temp last read by a
+#   quadruple may share a name with the temp the quadruple writes. The intervals are given names in a linear scan.
+#   Reference temps hold addresses rather than values, so they only share names with one another. An assign of
+#   one temp to another given the same name is removed.
+#
+
+#   Live Intervals
+#   The interval of points over which each temp of a function is live, as temp -> [first, last]
+def live_intervals(graph):
+    quadruples = graph.quadruples
+    intervals = {}
+
+    def extend(temp, point):
+        interval = intervals.get(temp)
+        if interval is None:
+            intervals[temp] = [point, point]
+        elif point < interval[0]:
+            interval[0] = point
+        elif point > interval[1]:
+            interval[1] = point
+
+    for block in graph.blocks:
+        for temp in block.live_in:
+            extend(temp, 2 * block.start)
+        for temp in block.live_out:
+            extend(temp, 2 * block.end + 2)
+
+        for position in range(block.start, block.end + 1):
+            for operand in reads(quadruples[position], graph.references):
+                if is_temp(operand):
+                    extend(operand, 2 * position)
+
+            written = writes(quadruples[position], graph.references)
+            if is_temp(written):
+                extend(written, 2 * position + 1)
+
+    return intervals
+
+
+#   Reuse Temps
+#   Rename the temps of each function to as few names as the temps live at once allow
+def reuse_temps(quadruples):
+    quadruples = copy_quadruples(quadruples)
+    temps_before = 0
+    temps_after = 0
+    peaks = []
+    copies = set()  # positions of assigns of a temp to itself
+
+    for start, end in function_ranges(quadruples):
+        graph = FlowGraph(quadruples, start, end)
+        graph.liveness()
+        intervals = live_intervals(graph)
+
+        names = {}  # temp -> new name
+        free = {True: [], False: []}  # numbers free to reuse, for reference temps and for other temps
+        active = []  # (last point, number, is reference) of each temp holding a number
+        numbers = 0
+        peak = 0
+
+        for temp, interval in sorted(intervals.items(), key=lambda item: (item[1][0], item[1][1], item[0])):
+            while active and active[0][0] < interval[0]:
+                last, number, is_reference = heapq.heappop(active)
+                heapq.heappush(free[is_reference], number)
+
+            is_reference = temp in graph.references
+            if free[is_reference]:
+                number = heapq.heappop(free[is_reference])
+            else:
+                number = numbers
+                numbers += 1
+
+            heapq.heappush(active, (interval[1], number, is_reference))
+            names[temp] = "_t" + str(number)
+            peak = max(peak, len(active))
+
+        for position in range(start, end + 1):
+            quadruple = quadruples[position]
+            for operand in range(2, 5):
+                if quadruple[operand] in names:
+                    quadruple[operand] = names[quadruple[operand]]
+
+        temps_before += len(intervals)
+        temps_after += numbers
+        peaks.append(quadruples[start][2] + " " + str(peak))
+
+        # temps renamed to the same name leave copies which do nothing
+        for position in range(start, end + 1):
+            quadruple = quadruples[position]
+            if quadruple[1] == "assign" and quadruple[2] == quadruple[4] and quadruple[4] not in graph.references:
+                copies.add(position)
+
+    quadruples = remove_quadruples(quadruples, copies)
+    return quadruples, "temps " + str(temps_before) + " -> " + str(temps_after) + ", peak live: " + ", ".join(peaks)
+
+
+# passes, in the order they run, with the optimization level which turns each on
+PASSES = [
+    ("inlining", inline_functions, 2),
+    ("tail calls", eliminate_tail_calls, 2),
+    ("constant folding", fold_constants, 1),
+    ("jump threading", thread_jumps, 1),
+    ("common subexpressions", eliminate_common_subexpressions, 2),
+    ("loop invariants", hoist_loop_invariants, 2),
+    ("strength reduction", reduce_strength, 2),
+    ("dead code", remove_dead_code, 1),
+    ("temp reuse", reuse_temps, 1),
+]
+
+
+class Optimizer(object):
+
+    # level - optimization level, every pass of this level or below runs
+    def __init__(self, level=1):
+        self.passes = [(name, function) for name, function, pass_level in PASSES if pass_level <= level]
+        self.statistics = []  # [pass, quadruples before, quadruples after, note] of each pass run
+
+    # Optimize the quadruples of a program, returning the optimized quadruples
+    def optimize(self, quadruples):
+        for name, function in self.passes:
+            before = len(quadruples)
+            quadruples, note = function(quadruples)
+            self.statistics.append([name, before, len(quadruples), note])
+
+        return quadruples
@@ -7,7 +7,56 @@
 from __future__ import print_function
 import sys
 import inspect
-from lib import symbol_table
+from array import array
+from lib import symbol_table, util
+from lib.tokens import make_token, as_token, KEYWORD, IDENTIFIER, NUMBER, FLOAT, OPERATORS, KIND_NAMES
+
+# shared keyword and operator tokens, which the grammar compares by identity
+LEFT_PARENTHESIS = make_token("(", OPERATORS)
+RIGHT_PARENTHESIS = make_token(")", OPERATORS)
+LEFT_BRACKET = make_token("[", OPERATORS)
+SEMICOLON = make_token(";", OPERATORS)
+COMMA = make_token(",", OPERATORS)
+PLUS = make_token("+", OPERATORS)
+TIMES = make_token("*", OPERATORS)
+LESS_EQUAL = make_token("<=", OPERATORS)
+LESS = make_token("<", OPERATORS)
+GREATER = make_token(">", OPERATORS)
+GREATER_EQUAL = make_token(">=", OPERATORS)
+EQUAL = make_token("==", OPERATORS)
+INT = make_token("int", KEYWORD)
+VOID = make_token("void", KEYWORD)
+
+
+#   Token Stream
+#   Wrap a token iterator so the parser can pop from it like the reversed token list, holding one
+#   token of lookahead so the parser can still tell whether tokens remain
+class TokenStream(object):
+
+    def __init__(self, tokens):
+        self.iterator = iter(tokens)
+        self.lookahead = next(self.iterator, None)
+
+    # take the next token, or None if the stream is exhausted
+    def pop(self):
+        token = self.lookahead
+        if token is not None:
+            self.lookahead = next(self.iterator, None)
+
+        return token
+
+    def __len__(self):
+        return 0 if self.lookahead is None else 1
+
+    def __str__(self):
+        return "TokenStream(" + str(self.lookahead) + ", ...)"
+
+
+#   Production
+#   Mark a method of the Parser as a production of the grammar, to be traced by the TracedParser
+def production(method):
+    method.production = True
+    return method
 
 
 class Parser(object):
@@ -15,7 +64,14 @@ class Parser(object):
     # static variables
 
     # initialization of properties
-    def __init__(self, tokens):
+    #
+    # tokens - reversed token list, or a TokenStream
+    # lexical_analyzer - analyzer which produced the tokens, used to locate them in the source
+    def __init__(self, tokens, lexical_analyzer=None):
+        if isinstance(tokens, list):
+            # accept [value, type] list tokens from older callers
+            tokens[:] = [as_token(token) for token in tokens]
+
         self.indentation = 0
         self.tokens = tokens
         self.debug = False
@@ -30,6 +86,7 @@ class Parser(object):
         self.temps = []  # temporary variables needed for code generation
         self.backpatches = []  # codes in table needed to be patched
         self.displacements = [] # holds generated displacement array vars
+        self.quadruple_tokens = array("l")  # index of the token being parsed when each quadruple was generated
 
         self.parsing_main = False
         self.main_function_exists = False
@@ -43,6 +100,8 @@ class Parser(object):
         self.found_float_type = False
         self.parsing_float_function = False
 
+        self.lexical_analyzer = lexical_analyzer
+        self.token_index = 0  # index of the current token in the token stream
         self.last_token = None
         self.current_token = self.tokens.pop()
 
@@ -50,6 +109,11 @@ class Parser(object):
         self.function_params = []  # list of params for a function
         self.args_parsed = 0  # number of passed args, for catching mismatched params
 
+    # Parse tokens pulled lazily from an iterator, such as LexicalAnalyzer.iter_tokens
+    @classmethod
+    def from_iterator(cls, tokens, lexical_analyzer=None):
+        return cls(TokenStream(tokens), lexical_analyzer)
+
     # Process input tokens for parsing
     # Start the recursive descent parsing
     def parse(self):
@@ -75,53 +139,50 @@ class Parser(object):
             return 'REJECT'
 
     # program -> declaration-list
+    @production
     def program(self):
-        self.start()
         self.declaration_list()
-        self.end()
 
     # declaration-list -> var-declaration | function-declaration | empty-declaration
+    @production
     def declaration_list(self):
-        self.start()
         while len(self.tokens) > 0 and self.accepted is not False:
             self.declaration()
-        self.end()
 
     # declaration -> type-specifier ID ; | type-specifier ID [ NUM ] ;
+    @production
     def declaration(self):
-        self.start()
-
-        if self.current_token == [";", "OPERATORS"]:
+        if self.current_token is SEMICOLON:
             self.empty_declaration()
         else:
             current_symbol = symbol_table.Symbol()
-            type = self.current_token[0]
+            type = self.current_token.value
             current_symbol.set_scope(self.scope)
             array_info = [False, 0]
 
-            if self.current_token[0] == "void":
+            if self.current_token.value == "void":
                 self.found_void_type = True
-            if self.current_token[0] == "int":
+            if self.current_token.value == "int":
                 self.found_int_type = True
-            if self.current_token[0] == "float":
+            if self.current_token.value == "float":
                 self.found_float_type = True
 
             self.type_specifier()
 
-            identifier = self.current_token[0]
+            identifier = self.current_token.value
             current_symbol.set_identifier(identifier)
-            if self.current_token[0] == "main":
+            if self.current_token.value == "main":
                 self.parsing_main = True
 
-            self.match("IDENTIFIER")
+            self.match(IDENTIFIER)
 
-            if self.current_token == ["[", "OPERATORS"]:
+            if self.current_token is LEFT_BRACKET:
                 type += "[]"
 
             current_symbol.set_type(type)
 
             is_function = False
-            if self.current_token == ["(", "OPERATORS"]:
+            if self.current_token is LEFT_PARENTHESIS:
                 is_function = True
                 current_symbol.set_is_function(is_function)
 
@@ -131,7 +192,7 @@ class Parser(object):
             if not self.symbol_table.add_symbol(current_symbol):
                 self.reject_semantic("Symbol already exists in scope: " + current_symbol.identifier)
 
-            if self.current_token == ["(", "OPERATORS"]:
+            if self.current_token is LEFT_PARENTHESIS:
 
                 if self.found_void_type:
                     self.parsing_void_function = True
@@ -154,148 +215,127 @@ class Parser(object):
 
                 self.add_quadruple("end", "func", identifier, "")
 
-            elif self.current_token and self.current_token[0] in ['[', ';']:
+            elif self.current_token and self.current_token.value in ['[', ';']:
                 array_info = self.var_declaration()
                 size = self.calculate_quadruple_size(type, array_info)
                 self.add_quadruple("alloc", size, "", identifier)
 
             self.parsing_main = False
 
-        self.end()
-
     # var-declaration -> type-specifier ID ; | type-specifier ID [ NUM ] ; | type-specifier ID [ FLOAT ] ;
+    @production
     def var_declaration(self):
-        self.start()
-
         is_array = False
         size = 0
 
-        if self.current_token == ['[', 'OPERATORS']:
+        if self.current_token is LEFT_BRACKET:
             is_array = True
-            self.match("OPERATORS", "[")
+            self.match(OPERATORS, "[")
             size = self.integer()
-            self.match("OPERATORS", "]")
-
-        self.match("OPERATORS", ";")
+            self.match(OPERATORS, "]")
 
-        self.end()
+        self.match(OPERATORS, ";")
 
         return [is_array, size]
 
     # function-declaration -> type-specifier ( params ) compound-statement
+    @production
     def function_declaration(self):
-        self.start()
+        calling_function = self.last_token.value
 
-        calling_function = self.last_token[0]
-
-        self.match("OPERATORS", "(")
+        self.match(OPERATORS, "(")
         param_count = self.params(calling_function)
-        self.match("OPERATORS", ")")
-        self.compound_statement(calling_function)
+        self.match(OPERATORS, ")")
+        self.run(self.compound_statement(calling_function))
 
         if self.parsing_main is True and self.accepted is not False:
             self.main_function_exists = True
 
-        self.end()
-
         return param_count
 
     # type-specifier -> int | void | float
+    @production
     def type_specifier(self):
-        self.start()
-        if self.current_token == ["int", "KEYWORD"]:
-            self.match("KEYWORD", "int")
-        elif self.current_token == ["void", "KEYWORD"]:
-            self.match("KEYWORD", "void")
+        if self.current_token is INT:
+            self.match(KEYWORD, "int")
+        elif self.current_token is VOID:
+            self.match(KEYWORD, "void")
         else:
-            self.match("KEYWORD", "float")
-
-        self.end()
+            self.match(KEYWORD, "float")
 
     # integer -> NUM
+    @production
     def integer(self):
-        self.start()
-        match = self.match("NUMBER")
-        self.end()
+        match = self.match(NUMBER)
 
         return int(match)
 
     # any-number -> NUM | FLOAT
+    @production
     def any_number(self):
-        self.start()
-
-        if self.current_token and self.current_token[1] == "NUMBER":
-            self.match("NUMBER")
+        if self.current_token and self.current_token.kind == NUMBER:
+            self.match(NUMBER)
             any_number_type = "int"
         else:
-            self.match("FLOAT")
+            self.match(FLOAT)
             any_number_type = "float"
 
-        self.end()
-
         return any_number_type
 
     # params -> void | params-list
+    @production
     def params(self, calling_function):
-        self.start()
-
         param_count = self.params_list(calling_function)
 
-        self.end()
-
         return param_count
 
     # params-list -> params-list , param | param
+    @production
     def params_list(self, calling_function):
-        self.start()
-
         param_count = 0
 
         param_count += self.param(calling_function)
-        while self.current_token == [",", "OPERATORS"] \
+        while self.current_token is COMMA \
                 and self.accepted is not False:
-            self.match("OPERATORS", ",")
+            self.match(OPERATORS, ",")
             param_count += self.param(calling_function)
 
-        self.end()
-
         return param_count
 
     # param -> type-specifier ID | type-specifier ID [ NUM ]
+    @production
     def param(self, calling_function):
 
-        self.start()
-
         param_count = 0
 
         self.current_symbol = symbol_table.Symbol()
         self.current_symbol.set_scope(self.scope+1)
         self.current_symbol.set_parent(calling_function, self.scope)
 
-        is_void = self.current_token == ["void", "KEYWORD"]
-        type = self.current_token[0]
+        is_void = self.current_token is VOID
+        type = self.current_token.value
         self.type_specifier()
 
-        if self.current_token[1] == "IDENTIFIER":
-            self.add_quadruple("param", "", "", self.current_token[0])
+        if self.current_token.kind == IDENTIFIER:
+            self.add_quadruple("param", "", "", self.current_token.value)
             param_count = 1
 
         is_void_with_identifier = is_void and \
-            self.current_token and self.current_token[1] == "IDENTIFIER"
+            self.current_token and self.current_token.kind == IDENTIFIER
 
         if not is_void or is_void_with_identifier:
-            identifier = self.current_token[0]
+            identifier = self.current_token.value
             self.current_symbol.set_identifier(identifier)
 
-            if is_void_with_identifier and self.current_token[1] is "IDENTIFIER":
-                self.reject_semantic("Void parameter cannot be named: " + str(self.calling_function) + ", " + self.current_token[0])
-            self.match("IDENTIFIER")
+            if is_void_with_identifier and self.current_token.kind == IDENTIFIER:
+                self.reject_semantic("Void parameter cannot be named: " + str(self.calling_function) + ", " + self.current_token.value)
+            self.match(IDENTIFIER)
 
             array_info = [False, None]
-            if self.current_token == ['[', "OPERATORS"]:
+            if self.current_token is LEFT_BRACKET:
                 type += "[]"
-                self.match('OPERATORS', '[')
-                self.match('OPERATORS', ']')
+                self.match(OPERATORS, '[')
+                self.match(OPERATORS, ']')
                 array_info = [True, 1]
 
             self.current_symbol.set_type(type)
@@ -308,45 +348,49 @@ class Parser(object):
 
         self.current_symbol = None
 
-        self.end()
-
         return param_count
 
+    #
+    #   Statement Productions
+    #   The productions holding other statements, from compound-statement to iteration-statement, are generators
+    #   run on an explicit stack like the expression productions below, so blocks, ifs and whiles may nest far
+    #   deeper than the Python recursion limit.
+    #
+
     # compound-statement -> { local-declarations statement-list }
+    @production
     def compound_statement(self, calling_function):
-        self.start()
-        self.match("OPERATORS", "{")
+        self.match(OPERATORS, "{")
 
         self.scope += 1
         self.local_declarations()
-        self.statement_list(calling_function)
-        self.match("OPERATORS", "}")
+        yield self.statement_list(calling_function)
+        self.match(OPERATORS, "}")
 
         self.symbol_table.destroy_scope(self.scope)
         self.scope -= 1
-        self.end()
 
     # local-declarations -> local-declarations var-declaration | @
+    @production
     def local_declarations(self):
-        self.start()
-        while self.current_token and self.current_token[0] in ["int", "float", "void"] \
+        while self.current_token and self.current_token.value in ["int", "float", "void"] \
                 and self.accepted is not False:
 
             self.current_symbol = symbol_table.Symbol()
-            type = self.current_token[0]
+            type = self.current_token.value
             self.current_symbol.set_type(type)
             self.current_symbol.set_scope(self.scope)
 
-            is_void = self.current_token and self.current_token == ["void", "KEYWORD"]
+            is_void = self.current_token and self.current_token is VOID
 
             self.type_specifier()
 
-            if is_void and self.current_token and self.current_token[1] is "IDENTIFIER":
-                self.reject_semantic("variables with type void are not permitted: " + str(self.current_token[0]))
+            if is_void and self.current_token and self.current_token.kind == IDENTIFIER:
+                self.reject_semantic("variables with type void are not permitted: " + str(self.current_token.value))
 
-            self.current_symbol.set_identifier(self.current_token[0])
-            identifier = self.current_token[0]
-            self.match("IDENTIFIER")
+            self.current_symbol.set_identifier(self.current_token.value)
+            identifier = self.current_token.value
+            self.match(IDENTIFIER)
             array_info = self.var_declaration()
 
             if array_info[0]:
@@ -360,76 +404,64 @@ class Parser(object):
 
             self.current_symbol = None
 
-        self.end()
-
     # statement-list -> statement-list statement | @
+    @production
     def statement_list(self, calling_function):
-        self.start()
-        while self.current_token and self.current_token[0] != "}" and self.accepted is not False:
-            self.statement(calling_function)
-
-        self.end()
+        while self.current_token and self.current_token.value != "}" and self.accepted is not False:
+            yield self.statement(calling_function)
 
     # statement -> expression-statement | selection-statement | compound-statement
     #   | iteration-statement | return-statement | empty-statement
+    @production
     def statement(self, calling_function):
-        self.start()
-        if self.current_token[0] == "if":
-            self.selection_statement(calling_function)
-        elif self.current_token[0] == "while":
-            self.iteration_statement(calling_function)
-        elif self.current_token[0] == "return":
+        if self.current_token.value == "if":
+            yield self.selection_statement(calling_function)
+        elif self.current_token.value == "while":
+            yield self.iteration_statement(calling_function)
+        elif self.current_token.value == "return":
             self.return_statement(calling_function)
-        elif self.current_token[0] == "{":
+        elif self.current_token.value == "{":
             self.add_quadruple("block", "", "", "")
-            self.compound_statement(calling_function)
+            yield self.compound_statement(calling_function)
             self.add_quadruple("end", "block", "", "")
 
             if len(self.backpatches) > 0:
                 used_patch = self.apply_backpatch(len(self.quadruples)+2)
                 self.add_quadruple("BR", "", "", used_patch[0])
 
-        elif self.current_token[0] == ";":
+        elif self.current_token.value == ";":
             self.empty_statement()
         else:
             self.expression_statement()
 
-        self.end()
-
     # selection-statement -> if ( expression ) statement | if ( expression ) statement else statement
+    @production
     def selection_statement(self, calling_function):
-        self.start()
-        self.match("KEYWORD", "if")
-        self.match("OPERATORS", "(")
-        self.expression()
-        self.match("OPERATORS", ")")
-        self.statement(calling_function)
-        if self.current_token and self.current_token[0] == "else":
-            self.match("KEYWORD", "else")
-            self.statement(calling_function)
-
-        self.end()
+        self.match(KEYWORD, "if")
+        self.match(OPERATORS, "(")
+        self.run(self.expression())
+        self.match(OPERATORS, ")")
+        yield self.statement(calling_function)
+        if self.current_token and self.current_token.value == "else":
+            self.match(KEYWORD, "else")
+            yield self.statement(calling_function)
 
     # iteration-statement -> while ( expression ) statement
+    @production
     def iteration_statement(self, calling_function):
 
-        self.start()
-
-        self.match("KEYWORD", "while")
-        self.match("OPERATORS", "(")
-        self.expression()
-        self.match("OPERATORS", ")")
-        self.statement(calling_function)
-
-        self.end()
+        self.match(KEYWORD, "while")
+        self.match(OPERATORS, "(")
+        self.run(self.expression())
+        self.match(OPERATORS, ")")
+        yield self.statement(calling_function)
 
     # return-statement -> return expression ; | return ;
+    @production
     def return_statement(self, calling_function):
 
-        self.start()
-
-        self.match("KEYWORD", "return")
-        if self.current_token != [';', 'OPERATORS']:
+        self.match(KEYWORD, "return")
+        if self.current_token is not SEMICOLON:
             if self.parsing_void_function:
                 self.reject_semantic("Void function should not have a return value.")
             else:
@@ -441,10 +473,10 @@ class Parser(object):
                 else:
                     calling_symbol_type = calling_symbol.type
 
-                if self.current_token and self.current_token[0] == "[" and calling_symbol_type.endwith("[]"):
+                if self.current_token and self.current_token.value == "[" and calling_symbol_type.endwith("[]"):
                     calling_symbol_type = calling_symbol_type[:-2]
 
-                expression_type, return_temp = self.expression(calling_symbol_type)
+                expression_type, return_temp = self.run(self.expression(calling_symbol_type))
 
                 self.add_quadruple("return", "", "", "_t"+str(self.temps[len(self.temps)-1]))
 
@@ -453,47 +485,42 @@ class Parser(object):
                 elif calling_symbol.type != expression_type:
                     self.reject_semantic("return value is invalid type")
 
-        self.match("OPERATORS", ";")
-
-        self.end()
+        self.match(OPERATORS, ";")
 
     # expression-statement -> expression ;
+    @production
     def expression_statement(self):
 
-        self.start()
-
-        self.expression()
-        self.match("OPERATORS", ";")
-
-        self.end()
+        self.run(self.expression())
+        self.match(OPERATORS, ";")
 
     # empty-statement -> ;
+    @production
     def empty_statement(self):
 
-        self.start()
-
-        self.match("OPERATORS", ";")
-
-        self.end()
+        self.match(OPERATORS, ";")
 
     # empty-declaration -> ;
+    @production
     def empty_declaration(self):
 
-        self.start()
-
-        self.match("OPERATORS", ";")
+        self.match(OPERATORS, ";")
 
-        self.end()
+    #
+    #   Expression Productions
+    #   The productions from assignment-statement down are generators, run on an explicit stack by run(). Rather
+    #   than calling the productions they are built from, they yield them and are sent back their results, so
+    #   expressions may nest far deeper than the Python recursion limit.
+    #
 
     # assignment-statement -> = expression
+    @production
     def assignment_statement(self, assignment_statement_type):
 
-        self.start()
+        identifier = self.last_token.value
 
-        identifier = self.last_token[0]
-
-        self.match("OPERATORS", "=")
-        expression_type, assignment_temp = self.expression(assignment_statement_type)
+        self.match(OPERATORS, "=")
+        expression_type, assignment_temp = yield self.expression(assignment_statement_type)
 
         self.add_quadruple("assign", "_t"+str(self.temps[len(self.temps)-1]), "", identifier)
 
@@ -501,94 +528,85 @@ class Parser(object):
             self.reject_semantic("attempted to assign a " + str(expression_type) + " to " + \
                                  str(assignment_statement_type) + " var")
 
-        self.end()
-
         return assignment_statement_type
 
     # expression -> ID var assignment-expression | simple-expression
+    @production
     def expression(self, expression_type=None):
-        self.start()
-
         expression_temp = None
 
-        if self.current_token and self.current_token[1] == "IDENTIFIER":
-            active_symbol = self.symbol_table.exists(self.current_token[0], self.scope)
+        if self.current_token and self.current_token.kind == IDENTIFIER:
+            active_symbol = self.symbol_table.exists(self.current_token.value, self.scope)
 
             active_symbol_type = ""
             if not active_symbol:
-                self.reject_semantic("Unknown symbol encountered: '" + self.current_token[0] + "'")
+                self.reject_semantic("Unknown symbol encountered: '" + self.current_token.value + "'")
             else:
                 active_symbol_type = active_symbol.type
 
             if active_symbol:
-                self.match("IDENTIFIER")
+                self.match(IDENTIFIER)
 
-                if self.current_token == ["[", "OPERATORS"] and active_symbol_type.endswith("[]"):
+                if self.current_token is LEFT_BRACKET and active_symbol_type.endswith("[]"):
                     active_symbol_type = active_symbol_type[:-2]
 
                 if not expression_type:
                     expression_type = active_symbol_type
-                    if self.current_token == ["[", "OPERATORS"] and expression_type.endswith("[]"):
+                    if self.current_token is LEFT_BRACKET and expression_type.endswith("[]"):
                         expression_type = expression_type[:-2]
                 elif expression_type != active_symbol_type:
                     self.reject_semantic("operand type mismatch in expression *")
 
-                var_type, expression_temp = self.var(expression_type)
+                var_type, expression_temp = yield self.var(expression_type)
                 if expression_type != var_type:
                     self.reject_semantic("operand type mismatch in expression **")
 
-                if self.current_token and self.current_token[0] == "=":
-                    assignment_type = self.assignment_statement(expression_type)
+                if self.current_token and self.current_token.value == "=":
+                    assignment_type = yield self.assignment_statement(expression_type)
 
                     if expression_type != assignment_type:
                         self.reject_semantic("operand type mismatch in expression ***")
 
                 else:
-                    simple_expression_type, expression_temp = self.simple_expression(expression_type)
+                    simple_expression_type, expression_temp = yield self.simple_expression(expression_type)
 
                     if expression_type != simple_expression_type:
                         self.reject_semantic("operand type mismatch in expression ***")
             else:
-                self.reject_semantic("Undeclared identifier: " + self.current_token[0])
+                self.reject_semantic("Undeclared identifier: " + self.current_token.value)
         else:
-            simple_expression_type, expression_temp = self.simple_expression(expression_type)
+            simple_expression_type, expression_temp = yield self.simple_expression(expression_type)
 
             if not expression_type:
                 expression_type = simple_expression_type
             elif expression_type != simple_expression_type:
                 self.reject_semantic("operand type mismatch in expression ***")
 
-        self.end()
-
         return expression_type, expression_temp
 
     # simple-expression -> additive-expression relational-expression
+    @production
     def simple_expression(self, simple_expression_type=None):
 
-        self.start()
-
         backpatch_position = len(self.quadruples)+1
-        simple_expression_type, simple_expression_temp = self.additive_expression(simple_expression_type)
-        self.relational_expression(simple_expression_type, backpatch_position)
-
-        self.end()
+        simple_expression_type, simple_expression_temp = yield self.additive_expression(simple_expression_type)
+        yield self.relational_expression(simple_expression_type, backpatch_position)
 
         return simple_expression_type, simple_expression_temp
 
     # relational-expression -> relational-operation additive expression relational-operation | @
+    @production
     def relational_expression(self, relational_expression_type, backpatch_position):
 
-        self.start()
-
         relational_expression_temp = None
 
-        while self.current_token and self.current_token[0] in ['<=', '<', '>', '>=', '==', '!='] \
+        while self.current_token and self.current_token.value in ['<=', '<', '>', '>=', '==', '!='] \
                 and self.accepted is not False:
-            operation = self.current_token[0]
+            operation = self.current_token.value
 
             self.relational_operation()
 
-            self.add_quadruple("comp", "_t"+str(self.temps[len(self.temps)-1]), self.current_token[0], "_t"+str(len(self.temps)))
+            self.add_quadruple("comp", "_t"+str(self.temps[len(self.temps)-1]), self.current_token.value, "_t"+str(len(self.temps)))
             relational_expression_temp = len(self.temps)
             self.temps.append(relational_expression_temp)
 
@@ -609,45 +627,42 @@ class Parser(object):
             self.add_quadruple(opcode, "_t"+str(self.temps[len(self.temps)-1]), "", "_bp")
             self.add_backpatch(backpatch_position, len(self.quadruples))
 
-            relational_expression_type, relational_expression_temp = self.additive_expression(relational_expression_type)
-
-        self.end()
+            relational_expression_type, relational_expression_temp = yield self.additive_expression(relational_expression_type)
 
         return relational_expression_type, relational_expression_temp
 
     # additive-expression -> term | add-operation term additive-expression
+    @production
     def additive_expression(self, additive_expression_type=None):
 
-        self.start()
-
-        term_type, additive_expression_temp = self.term(additive_expression_type)
+        term_type, additive_expression_temp = yield self.term(additive_expression_type)
         if not additive_expression_type:
             additive_expression_type = term_type
         elif additive_expression_type != term_type:
             self.reject_semantic("operand type mismatch in additive expression *")
 
-        while self.current_token and self.current_token[0] in ["+", "-"] \
+        while self.current_token and self.current_token.value in ["+", "-"] \
                 and self.accepted is not False:
-            opcode = "add" if self.current_token[0] == "+" else "sub"
+            opcode = "add" if self.current_token.value == "+" else "sub"
 
             operand1 = "1"
             if additive_expression_temp is not None:
                 operand1 = "_t"+str(additive_expression_temp)
-            elif self.last_token[1] == "IDENTIFIER":
-                operand1 = self.last_token[0]
+            elif self.last_token.kind == IDENTIFIER:
+                operand1 = self.last_token.value
             elif len(self.displacements) > 0:
                 operand1 = self.displacements.pop()
                 operand1 = "_t"+str(operand1[2])
 
             self.add_operation()
 
-            term_type, additive_expression_temp = self.term(additive_expression_type)
+            term_type, additive_expression_temp = yield self.term(additive_expression_type)
 
             operand2 = "2"
             if additive_expression_temp is not None:
                 operand2 = "_t"+str(additive_expression_temp)
-            elif self.last_token[1] == "IDENTIFIER":
-                operand2 = self.last_token[0]
+            elif self.last_token.kind == IDENTIFIER:
+                operand2 = self.last_token.value
             elif len(self.displacements) > 0:
                 operand2 = self.displacements.pop()
                 operand2 = "_t"+str(operand2[2])
@@ -659,87 +674,77 @@ class Parser(object):
             if term_type != additive_expression_type:
                 self.reject_semantic("operand type mismatch in additive expression **")
 
-        self.end()
-
         return additive_expression_type, additive_expression_temp
 
     # add-operation -> + | -
+    @production
     def add_operation(self):
 
-        self.start()
-
-        if self.current_token == ['+', 'OPERATORS']:
-            self.match("OPERATORS", "+")
+        if self.current_token is PLUS:
+            self.match(OPERATORS, "+")
         else:
-            self.match("OPERATORS", "-")
-
-        self.end()
+            self.match(OPERATORS, "-")
 
     # multiply-operation -> * | /
+    @production
     def multiply_operation(self):
 
-        self.start()
-        if self.current_token == ['*', 'OPERATORS']:
-            self.match("OPERATORS", "*")
+        if self.current_token is TIMES:
+            self.match(OPERATORS, "*")
         else:
-            self.match("OPERATORS", "/")
-
-        self.end()
+            self.match(OPERATORS, "/")
 
     # relational-operation -> <= | < | > | >= | == | !=
+    @production
     def relational_operation(self):
-        self.start()
-        if self.current_token == ['<=', 'OPERATORS']:
-            self.match("OPERATORS", "<=")
-        elif self.current_token == ['<', 'OPERATORS']:
-            self.match("OPERATORS", "<")
-        elif self.current_token == ['>', 'OPERATORS']:
-            self.match("OPERATORS", ">")
-        elif self.current_token == ['>=', 'OPERATORS']:
-            self.match("OPERATORS", ">=")
-        elif self.current_token == ['==', 'OPERATORS']:
-            self.match("OPERATORS", "==")
+        if self.current_token is LESS_EQUAL:
+            self.match(OPERATORS, "<=")
+        elif self.current_token is LESS:
+            self.match(OPERATORS, "<")
+        elif self.current_token is GREATER:
+            self.match(OPERATORS, ">")
+        elif self.current_token is GREATER_EQUAL:
+            self.match(OPERATORS, ">=")
+        elif self.current_token is EQUAL:
+            self.match(OPERATORS, "==")
         else:
-            self.match("OPERATORS", "!=")
-
-        self.end()
+            self.match(OPERATORS, "!=")
 
     # term -> factor | factor multiply-operation factor term
+    @production
     def term(self, term_type=None):
 
-        self.start()
-
-        factor_type, term_temp = self.factor(term_type)
+        factor_type, term_temp = yield self.factor(term_type)
         if not term_type:
             term_type = factor_type
-            if self.current_token == ["[", "OPERATORS"] and term_type.endswith("[]"):
+            if self.current_token is LEFT_BRACKET and term_type.endswith("[]"):
                 term_type = term_type[:-2]
         elif term_type != factor_type:
             self.reject_semantic("operand type mismatch in term *")
 
-        while self.current_token and self.current_token[0] in ["*", "/"] \
+        while self.current_token and self.current_token.value in ["*", "/"] \
                 and self.accepted is not False:
 
-            opcode = "mult" if self.current_token[0] == "*" else "div"
+            opcode = "mult" if self.current_token.value == "*" else "div"
 
             operand1 = "1"
             if term_temp is not None:
                 operand1 = "_t"+str(term_temp)
-            elif self.last_token[1] == "IDENTIFIER":
-                operand1 = self.last_token[0]
+            elif self.last_token.kind == IDENTIFIER:
+                operand1 = self.last_token.value
             elif len(self.displacements) > 0:
                 operand1 = self.displacements.pop()
                 operand1 = "_t"+str(operand1[2])
 
             self.multiply_operation()
 
-            factor_type, term_temp = self.factor(term_type)
+            factor_type, term_temp = yield self.factor(term_type)
 
             operand2 = "2"
             if term_temp is not None:
                 operand2 = "_t"+str(term_temp)
-            elif self.last_token[1] == "IDENTIFIER":
-                operand2 = self.last_token[0]
+            elif self.last_token.kind == IDENTIFIER:
+                operand2 = self.last_token.value
             elif len(self.displacements) > 0:
                 operand2 = self.displacements.pop()
                 operand2 = "_t"+str(operand2[2])
@@ -751,47 +756,41 @@ class Parser(object):
             if factor_type != term_type:
                 self.reject_semantic("operand type mismatch in term **")
 
-        self.end()
-
         return term_type, term_temp
 
     # factor -> ( expression ) | call | var | NUM | FLOAT
+    @production
     def factor(self, factor_type=None):
-        self.start()
-
         factor_temp = None
 
-        if self.current_token == ["(", "OPERATORS"]:
-            if self.last_token and self.last_token[1] == "IDENTIFIER":
-                if not self.symbol_table.function_exists(self.last_token[0], self.scope):
-                    self.reject_semantic("" + self.last_token[0] + " is not a function")
+        if self.current_token is LEFT_PARENTHESIS:
+            if self.last_token and self.last_token.kind == IDENTIFIER:
+                if not self.symbol_table.function_exists(self.last_token.value, self.scope):
+                    self.reject_semantic("" + self.last_token.value + " is not a function")
 
-                self.calling_function = self.last_token[0]
-                factor_type, factor_temp = self.call()
+                self.calling_function = self.last_token.value
+                factor_type, factor_temp = yield self.call()
             else:
-                self.match("OPERATORS", "(")
-                factor_type, factor_temp = self.expression(factor_type)
-                self.match("OPERATORS", ")")
-        elif self.current_token and self.current_token[1] in ["NUMBER", "FLOAT"]:
+                self.match(OPERATORS, "(")
+                factor_type, factor_temp = yield self.expression(factor_type)
+                self.match(OPERATORS, ")")
+        elif self.current_token and self.current_token.kind in (NUMBER, FLOAT):
             factor_type = self.any_number()
         else:
-            factor_type, factor_temp = self.call_or_var(factor_type)
-
-        self.end()
+            factor_type, factor_temp = yield self.call_or_var(factor_type)
 
         return factor_type, factor_temp
 
     # call-or-var -> ID | call | var
+    @production
     def call_or_var(self, call_or_var_type=None):
-        self.start()
-
-        self.calling_function = self.last_token[0]
+        self.calling_function = self.last_token.value
 
-        if self.current_token and self.current_token[1] == "IDENTIFIER":
-            var_type = self.symbol_table.load_type(self.current_token[0], self.scope)
-            self.match("IDENTIFIER")
+        if self.current_token and self.current_token.kind == IDENTIFIER:
+            var_type = self.symbol_table.load_type(self.current_token.value, self.scope)
+            self.match(IDENTIFIER)
 
-            if self.current_token and self.current_token[0] == "[":
+            if self.current_token and self.current_token.value == "[":
                 var_type = var_type[:-2]
 
             if not call_or_var_type:
@@ -799,25 +798,25 @@ class Parser(object):
             elif call_or_var_type != var_type:
                 self.reject_semantic("operand type mismatch in call_or_var *")
 
-            self.calling_function = self.last_token[0]
+            self.calling_function = self.last_token.value
 
-        if self.current_token == ["(", "OPERATORS"]:
-            call_type, call_or_var_temp = self.call()
+        if self.current_token is LEFT_PARENTHESIS:
+            call_type, call_or_var_temp = yield self.call()
             if not call_or_var_type:
                 call_or_var_type = call_type
             elif call_type != call_or_var_type:
                 self.reject_semantic("operand type mismatch in call_or_var **")
         else:
-            active_symbol = self.symbol_table.exists(self.current_token[0], self.scope)
+            active_symbol = self.symbol_table.exists(self.current_token.value, self.scope)
             if active_symbol:
-                var_type, call_or_var_temp = self.var(active_symbol.type)
+                var_type, call_or_var_temp = yield self.var(active_symbol.type)
                 if not call_or_var_type:
                     call_or_var_type = var_type
                 elif call_or_var_type != var_type:
                     self.reject_semantic("operand type mismatch in call_or_var ***")
 
             else:
-                var_type, call_or_var_temp = self.var(call_or_var_type)
+                var_type, call_or_var_temp = yield self.var(call_or_var_type)
                 if not call_or_var_type:
                     call_or_var_type = var_type
                 elif call_or_var_type != var_type:
@@ -825,22 +824,19 @@ class Parser(object):
 
         self.calling_function = None
 
-        self.end()
-
         return call_or_var_type, call_or_var_temp
 
     # call -> ( args )
+    @production
     def call(self):
-        self.start()
-
         called_function = self.calling_function
 
         function_params = self.symbol_table.load_params(self.calling_function, self.scope)
         call_type = self.symbol_table.load_type(self.calling_function, self.scope)
 
-        self.match("OPERATORS", "(")
-        args_parsed = self.args()
-        self.match("OPERATORS", ")")
+        self.match(OPERATORS, "(")
+        args_parsed = yield self.args()
+        self.match(OPERATORS, ")")
 
         self.add_quadruple("call", called_function, len(args_parsed), "_t"+str(len(self.temps)))
         call_temp = len(self.temps)
@@ -857,40 +853,37 @@ class Parser(object):
                     self.reject_semantic("Mismatched type of argument index " + str(i) + " for '" + str(called_function) + "'. Found " +
                                  str(args_parsed[i]) + ", Expected " + str(function_params[i].type))
 
-        self.end()
-
         return call_type, call_temp
 
     # var -> [ expression ] | @
+    @production
     def var(self, var_type):
 
-        self.start()
-
         var_temp = None
 
-        identifier = self.last_token[0]
+        identifier = self.last_token.value
 
-        if self.current_token and self.current_token[1] == "IDENTIFIER":
-            identifier = self.current_token[0]
-            self.match("IDENTIFIER")
-            var_type, var_temp = self.var(var_type)
+        if self.current_token and self.current_token.kind == IDENTIFIER:
+            identifier = self.current_token.value
+            self.match(IDENTIFIER)
+            var_type, var_temp = yield self.var(var_type)
 
-        if self.last_token and self.last_token[1] == "IDENTIFIER" and self.current_token[0] != "(":
-            if not self.symbol_table.var_exists(self.last_token[0], self.scope):
-                self.reject_semantic("" + self.last_token[0] + " is a function, not a variable")
+        if self.last_token and self.last_token.kind == IDENTIFIER and self.current_token.value != "(":
+            if not self.symbol_table.var_exists(self.last_token.value, self.scope):
+                self.reject_semantic("" + self.last_token.value + " is a function, not a variable")
 
-        if self.current_token == ["[", "OPERATORS"]:
-            self.match("OPERATORS", "[")
+        if self.current_token is LEFT_BRACKET:
+            self.match(OPERATORS, "[")
 
             if var_type.endswith("[]"):
                 # remove [], value was de-referenced
                 var_type = var_type[:-2]
 
-            array_index_type, var_temp = self.expression("int") # hard code to an int - array index should be an int
+            array_index_type, var_temp = yield self.expression("int") # hard code to an int - array index should be an int
             if array_index_type != "int":
                 self.reject_semantic("array index type was not int, was " + array_index_type + " instead")
 
-            self.match("OPERATORS", "]")
+            self.match(OPERATORS, "]")
 
             size = self.calculate_quadruple_size(var_type, [True, 5])
             self.add_quadruple("disp", identifier, size,  "_t"+str(len(self.temps)))
@@ -899,66 +892,62 @@ class Parser(object):
             displacement = [identifier, size, var_temp]
             self.displacements.append(displacement)
 
-        self.end()
-
         return var_type, var_temp
 
     # args -> args-list | @
+    @production
     def args(self):
 
-        self.start()
-
         return_args = []
 
-        if self.current_token != [")", "OPERATORS"]:
-            return_args = self.arg_list()
-
-        self.end()
+        if self.current_token is not RIGHT_PARENTHESIS:
+            return_args = yield self.arg_list()
 
         return return_args
 
     # arg-list -> expression | expression , arg-list
+    @production
     def arg_list(self):
 
-        self.start()
-
-        arg, temp = self.expression()
+        arg, temp = yield self.expression()
 
         if temp is not None:
             result = "_t"+str(temp)
         else:
-            result = "_t"+str(self.current_token[0])
+            result = "_t"+str(self.current_token.value)
 
         self.add_quadruple("arg", "", "", result)
 
         return_args = [arg]
 
-        while self.current_token == [",", "OPERATORS"] \
+        while self.current_token is COMMA \
                 and self.accepted is not False:
-            self.match("OPERATORS", ",")
+            self.match(OPERATORS, ",")
 
-            self.add_quadruple("arg", "", "", self.current_token[0])
-            arg, temp = self.expression()
+            self.add_quadruple("arg", "", "", self.current_token.value)
+            arg, temp = yield self.expression()
             return_args.append(arg)
 
-        self.end()
-
         return return_args
 
+    # Run an expression production on an explicit stack, returning its result
+    def run(self, steps):
+        return util.run_steps(steps)
+
     # accept a token out from the input stream
     def match(self, token_type, token_value=None):
-        if self.current_token is not None and self.current_token[1] == token_type:
+        if self.current_token is not None and self.current_token.kind == token_type:
             if token_value is not None:
-                if self.current_token[0] == token_value:
+                if self.current_token.value == token_value:
                     if self.debug:
                         print("\t"*self.indentation + "Token matched (by value): " + str(self.current_token))
-                    return_value = self.current_token[0]
+                    return_value = self.current_token.value
                     self.next_token()
                     return return_value
             else:
                 if self.debug:
                     print("\t"*self.indentation + "Token matched (by type): " + str(self.current_token))
-                return_value = self.current_token[0]
+                return_value = self.current_token.value
                 self.next_token()
                 return return_value
 
@@ -968,6 +957,7 @@ class Parser(object):
 
     # advance the parser to the next token
     def next_token(self):
+        self.token_index += 1
         self.last_token = self.current_token
         if len(self.tokens) > 0:
             self.current_token = self.tokens.pop()
@@ -979,18 +969,48 @@ class Parser(object):
     def reject(self, token_type, token_value):
         # self.accepted = False  # disable failures to parse
         if self.debug:
-            print("Current Token: " + str(self.current_token))
-            print("Failed to match [" + str(token_type) + ", " + str(token_value) + "] in " + str(inspect.stack()[2][3]))
+            print("Current Token: " + str(self.current_token) + self.describe_location())
+            print("Failed to match [" + KIND_NAMES[token_type] + ", " + str(token_value) + "] in " + sys._getframe(2).f_code.co_name)
 
     # a semantic error has occurred, reject the input
     def reject_semantic(self, reason):
         # self.accepted = False  # disable semantic failures
         if self.accepted is True and self.debug_semantics:
-            print("Semantic Rejection: " + reason)
+            print("Semantic Rejection: " + reason + self.describe_location())
+
+    # source line and column of a token, the current token by default
+    # At the end of the input, the last token is located instead. None if the source is unknown.
+    def locate(self, token_index=None):
+        if self.lexical_analyzer is None:
+            return None
+
+        if token_index is None:
+            token_index = self.token_index
+
+        token_index = min(token_index, len(self.lexical_analyzer.offsets) - 1)
+        if token_index < 0:
+            return None
+
+        line, column, offset, length = self.lexical_analyzer.get_position(token_index)
+
+        return line, column
+
+    # location of the current token for messages, empty if the source is unknown
+    def describe_location(self):
+        location = self.locate()
+        if location is None:
+            return ""
+
+        return " at line " + str(location[0]) + ", column " + str(location[1])
+
+    # source line and column a quadruple was generated from, by quadruple index
+    def locate_quadruple(self, quadruple_index):
+        return self.locate(self.quadruple_tokens[quadruple_index-1])
 
     # generate code
     def add_quadruple(self, opcode, operand1, operand2, result):
         self.quadruples.append([len(self.quadruples)+1, opcode, operand1, operand2, result])
+        self.quadruple_tokens.append(self.token_index)
 
     # add code
     def add_backpatch(self, backpatch_index, patch_location):
@@ -1019,15 +1039,53 @@ class Parser(object):
 
         return size
 
-    # debug output for entering a recursive function
-    def start(self):
-        if self.debug:
-            print(("\t"*self.indentation) + "Starting '" + inspect.stack()[1][3] + "'...")
+
+#   Traced Parser
+#   Parser which prints each production of the grammar as it is entered and left
+#   The productions are wrapped once, when the class is built, so the plain Parser pays nothing for tracing.
+class TracedParser(Parser):
+
+    def __init__(self, tokens, lexical_analyzer=None):
+        super(TracedParser, self).__init__(tokens, lexical_analyzer)
+        self.debug = True
+
+
+#   Trace
+#   Wrap a production so it prints when it is entered and left
+#   Expression productions are wrapped in a generator of their own, which yields the production to the stack.
+#
+#   name - name of the production
+#   method - production to wrap
+def trace(name, method):
+    if inspect.isgeneratorfunction(method):
+        def traced(self, *args, **kwargs):
+            print(("\t"*self.indentation) + "Starting '" + name + "'...")
             self.indentation += 1
 
-    # debug output for exiting a recursive function
-    def end(self):
-        if self.debug:
+            result = yield method(self, *args, **kwargs)
+
             self.indentation -= 1
-            print(("\t"*self.indentation) + "Ending '" + inspect.stack()[1][3] + "'...")
+            print(("\t"*self.indentation) + "Ending '" + name + "'...")
+
+            return result
+    else:
+        def traced(self, *args, **kwargs):
+            print(("\t"*self.indentation) + "Starting '" + name + "'...")
+            self.indentation += 1
+
+            result = method(self, *args, **kwargs)
+
+            self.indentation -= 1
+            print(("\t"*self.indentation) + "Ending '" + name + "'...")
+
+            return result
+
+    traced.__name__ = name
+    traced.__doc__ = method.__doc__
+
+    return traced
+
 
+for name, method in list(vars(Parser).items()):
+    if getattr(method, "production", False):
+        setattr(TracedParser, name, trace(name, method))
@@ -0,0 +1,349 @@
+#
+#
+#   Semantic Analyzer
+#   This module contains a walk over the abstract syntax tree checking it against the semantic rules of C-
+#
+#   The analyzer fills in the type of every expression in the tree, for the passes which follow it.
+#
+#
+from __future__ import print_function
+from lib import util
+from lib.symbol_table import SymbolTable, Symbol
+from lib.syntax_tree import FunctionDeclaration, CompoundStatement, ExpressionStatement, EmptyStatement, \
+    SelectionStatement, IterationStatement, ReturnStatement, Assignment, BinaryOperation, Variable, Call, Number, \
+    RELATIONAL_OPERATORS, describe_location
+
+# functions every C- program may call, as (identifier, type, parameter types)
+# They are declared in a scope enclosing the globals, so a program may still declare its own.
+BUILTIN_FUNCTIONS = [
+    ("input", "int", []),
+    ("output", "void", ["int"]),
+]
+BUILTIN_SCOPE = -1
+
+
+#   New Symbol
+#   A symbol with no value
+def new_symbol(identifier, type, scope, is_function):
+    symbol = Symbol()
+    symbol.create(identifier, type, None, scope, is_function)
+
+    return symbol
+
+
+#   Signature
+#   What analyzing a use of a symbol depends on, None for an undeclared identifier
+def signature(symbol):
+    if symbol is None:
+        return None
+
+    return symbol.type, symbol.is_function, tuple(parameter.type for parameter in symbol.parameters)
+
+
+class SemanticAnalyzer(object):
+
+    # initialization of properties
+    #
+    # lexical_analyzer - analyzer which produced the tokens of the tree, used to locate rejections in the source
+    def __init__(self, lexical_analyzer=None):
+        self.lexical_analyzer = lexical_analyzer
+        self.symbol_table = SymbolTable()
+        self.scope = 0
+        self.function = None  # symbol of the function being analyzed
+        self.accepted = True
+        self.rejections = []  # (reason, token index) of each rejection, the index relative to token_base
+        self.token_base = 0  # index of the first token of the tree being analyzed, in the whole token stream
+        self.references = None  # global identifier -> signature, while recording a function body
+
+        # statement and expression nodes, by class, to the method which analyzes them
+        self.analyzers = {
+            CompoundStatement: self.compound_statement,
+            ExpressionStatement: self.expression_statement,
+            EmptyStatement: self.empty_statement,
+            SelectionStatement: self.selection_statement,
+            IterationStatement: self.iteration_statement,
+            ReturnStatement: self.return_statement,
+            Assignment: self.assignment,
+            BinaryOperation: self.binary_operation,
+            Variable: self.variable,
+            Call: self.call,
+            Number: self.number,
+        }
+
+    # Analyze a Program, returning True if it follows the semantic rules
+    def analyze(self, program):
+        self.declare_builtins()
+
+        for declaration in program.declarations:
+            symbol = self.declaration(declaration)
+            if isinstance(declaration, FunctionDeclaration):
+                self.function_body(declaration, symbol)
+
+        return self.finish()
+
+    def declare_builtins(self):
+        for identifier, type, parameter_types in BUILTIN_FUNCTIONS:
+            function = new_symbol(identifier, type, BUILTIN_SCOPE, True)
+            for parameter_type in parameter_types:
+                function.parameters.append(new_symbol(None, parameter_type, BUILTIN_SCOPE + 1, False))
+
+            self.symbol_table.add_symbol(function)
+
+    # the checks made once every declaration has been analyzed, returning True if the program was accepted
+    def finish(self):
+        main = self.symbol_table.lookup("main", 0)
+        if main is None or not main.is_function:
+            self.reject("Main function undefined", None)
+
+        return self.accepted
+
+    #
+    #   Declarations
+    #   A top level declaration is declared first, then the body of a function is analyzed on its own. Later
+    #   declarations depend only on what is declared, so the analysis of a body may be cached, see replay.
+    #
+
+    # Declare a top level declaration, returning its symbol
+    def declaration(self, declaration):
+        return self.declare_symbol(self.declaration_symbol(declaration), declaration)
+
+    # The symbol a declaration declares, not yet added to the table
+    # The symbol of a function holds its parameters, for checking calls to it.
+    def declaration_symbol(self, declaration):
+        type = declaration.type
+
+        if isinstance(declaration, FunctionDeclaration):
+            function = new_symbol(declaration.identifier, type, self.scope, True)
+
+            for parameter in declaration.parameters:
+                type = parameter.type
+                if parameter.is_array:
+                    type += "[]"
+
+                # parameters belong to the scope of the function body
+                function.parameters.append(new_symbol(parameter.identifier, type, self.scope + 1, False))
+
+            return function
+
+        if declaration.size is not None:
+            type += "[]"
+
+        return new_symbol(declaration.identifier, type, self.scope, False)
+
+    # Add the symbol of a declaration to the table, returning it
+    def declare_symbol(self, symbol, declaration):
+        if declaration.type == "void" and not symbol.is_function:
+            if self.scope == 0:
+                self.reject("invalid type for variable, void", declaration)
+            else:
+                self.reject("variables with type void are not permitted: " + declaration.identifier, declaration)
+
+        if not self.symbol_table.add_symbol(symbol):
+            self.reject("Symbol already exists in scope: " + declaration.identifier, declaration)
+
+        return symbol
+
+    # Analyze the parameters and body of a declared function
+    def function_body(self, declaration, function):
+        self.function = function
+
+        for parameter, symbol in zip(declaration.parameters, function.parameters):
+            if parameter.type == "void":
+                self.reject("Void parameter cannot be named: " + declaration.identifier + ", " + parameter.identifier,
+                            parameter)
+
+            if not self.symbol_table.add_symbol(symbol):
+                self.reject("Symbol already exists in scope: " + parameter.identifier, parameter)
+
+        util.run_steps(self.compound_statement(declaration.body))
+        self.function = None
+
+    # Analyze a function body as function_body does, returning what its analysis depended on and found
+    # That is the signature of each global identifier it looked up, and the rejections it made. While the
+    # identifiers keep their signatures, the analysis may be replayed instead of repeated.
+    def record_function_body(self, declaration, function):
+        self.references = {}
+        first_rejection = len(self.rejections)
+
+        self.function_body(declaration, function)
+
+        references, self.references = self.references, None
+
+        return references, self.rejections[first_rejection:]
+
+    # True if global identifiers still have the signatures recorded by record_function_body
+    def references_hold(self, references):
+        for identifier, recorded in references.items():
+            if signature(self.symbol_table.lookup(identifier, self.scope)) != recorded:
+                return False
+
+        return True
+
+    # Report the rejections recorded by record_function_body again, for the body being declared at token_base
+    def replay(self, rejections):
+        for reason, token_index in rejections:
+            self.report(reason, token_index)
+
+    # find the symbol an identifier refers to, recording the use of a global for record_function_body
+    def lookup(self, identifier):
+        symbol = self.symbol_table.lookup(identifier, self.scope)
+
+        if self.references is not None and (symbol is None or symbol.scope <= 0):
+            self.references[identifier] = signature(symbol)
+
+        return symbol
+
+    #
+    #   Statements and Expressions
+    #   These are generators run on an explicit stack, as the TreeParser builds them, so deeply nested blocks and
+    #   expressions are walked without reaching the Python recursion limit. Expressions return their type.
+    #
+
+    def compound_statement(self, statement):
+        self.scope += 1
+
+        for declaration in statement.declarations:
+            self.declaration(declaration)
+
+        for nested in statement.statements:
+            yield self.visit(nested)
+
+        self.symbol_table.destroy_scope(self.scope)
+        self.scope -= 1
+
+    def expression_statement(self, statement):
+        yield self.visit(statement.expression)
+
+    def empty_statement(self, statement):
+        return
+        yield  # a generator like the other analyzers
+
+    def selection_statement(self, statement):
+        yield self.visit(statement.condition)
+        yield self.visit(statement.then_statement)
+
+        if statement.else_statement is not None:
+            yield self.visit(statement.else_statement)
+
+    def iteration_statement(self, statement):
+        yield self.visit(statement.condition)
+        yield self.visit(statement.body)
+
+    def return_statement(self, statement):
+        if statement.expression is None:
+            return
+
+        type = yield self.visit(statement.expression)
+
+        if self.function.type == "void":
+            self.reject("Void function should not have a return value.", statement)
+        elif type is not None and type != self.function.type:
+            self.reject("return value is invalid type", statement)
+
+    def assignment(self, expression):
+        target_type = yield self.visit(expression.target)
+        value_type = yield self.visit(expression.value)
+
+        if target_type is not None and value_type is not None and target_type != value_type:
+            self.reject("attempted to assign a " + value_type + " to " + target_type + " var", expression)
+
+        expression.type = target_type
+        return target_type
+
+    def binary_operation(self, expression):
+        left_type = yield self.visit(expression.left)
+        right_type = yield self.visit(expression.right)
+
+        if left_type == "void" or right_type == "void":
+            self.reject("void value used in expression", expression)
+        elif left_type is not None and right_type is not None and left_type != right_type:
+            self.reject("operand type mismatch in expression", expression)
+
+        if expression.operator in RELATIONAL_OPERATORS:
+            expression.type = "int"
+        else:
+            expression.type = left_type
+
+        return expression.type
+
+    def variable(self, expression):
+        symbol = self.lookup(expression.identifier)
+
+        type = None
+        if symbol is None:
+            self.reject("Undeclared identifier: " + expression.identifier, expression)
+        elif symbol.is_function:
+            self.reject(expression.identifier + " is a function, not a variable", expression)
+        else:
+            type = symbol.type
+
+        if expression.index is not None:
+            index_type = yield self.visit(expression.index)
+            if index_type is not None and index_type != "int":
+                self.reject("array index type was not int, was " + index_type + " instead", expression)
+
+            if type is not None:
+                if type.endswith("[]"):
+                    type = type[:-2]
+                else:
+                    self.reject(expression.identifier + " is not an array", expression)
+                    type = None
+
+        expression.type = type
+        return type
+
+    def call(self, expression):
+        symbol = self.lookup(expression.identifier)
+
+        argument_types = []
+        for argument in expression.arguments:
+            argument_types.append((yield self.visit(argument)))
+
+        if symbol is None:
+            self.reject("Undeclared identifier: " + expression.identifier, expression)
+            return None
+        elif not symbol.is_function:
+            self.reject(expression.identifier + " is not a function", expression)
+            return None
+
+        if len(argument_types) != len(symbol.parameters):
+            self.reject("Mismatched number of arguments for '" + expression.identifier + "'. Found " +
+                        str(len(argument_types)) + ", Expected " + str(len(symbol.parameters)), expression)
+        else:
+            for index, (argument_type, parameter) in enumerate(zip(argument_types, symbol.parameters)):
+                if argument_type is not None and argument_type != parameter.type:
+                    self.reject("Mismatched type of argument index " + str(index) + " for '" +
+                                expression.identifier + "'. Found " + argument_type + ", Expected " +
+                                parameter.type, expression)
+
+        expression.type = symbol.type
+        return symbol.type
+
+    def number(self, expression):
+        return expression.type
+        yield  # a generator like the other analyzers
+
+    # the generator analyzing a statement or expression node
+    def visit(self, node):
+        return self.analyzers[node.__class__](node)
+
+    # a semantic error has occurred, reject the program
+    #
+    # node - the node at fault, None for the program as a whole
+    def reject(self, reason, node):
+        token_index = None
+        if node is not None:
+            token_index = node.token_index
+
+        self.rejections.append((reason, token_index))
+        self.report(reason, token_index)
+
+    # print a rejection, located at a token of the tree being analyzed
+    def report(self, reason, token_index):
+        self.accepted = False
+
+        location = ""
+        if token_index is not None:
+            location = describe_location(self.lexical_analyzer, self.token_base + token_index)
+
+        print("Semantic Rejection: " + reason + location)
@@ -14,86 +14,107 @@ from lib.util import deepcopy
 class SymbolTable(object):
 
     def __init__(self):
-        self.symbols = []
+        self.symbols = []  # every symbol in the table, in the order added
+        self.shadow_chains = {}  # identifier -> symbols with that identifier, in the order added
+        self.scoped_symbols = {}  # (identifier, scope) -> symbol
+        self.scopes = {}  # scope -> symbols declared in it, in the order added
 
     def add_symbol(self, symbol_to_add):
         if not self.exists_in_scope(symbol_to_add.identifier, symbol_to_add.scope):
 
-            if symbol_to_add.parent is not None:
-                for symbol in reversed(self.symbols):
-                    if symbol_to_add.parent:
-                        if symbol.identifier == symbol_to_add.parent[0] and symbol.scope <= symbol_to_add.scope:
-                            symbol.parameters.append(symbol_to_add)
-                            break
+            if symbol_to_add.parent:
+                symbol = self.lookup(symbol_to_add.parent[0], symbol_to_add.scope)
+                if symbol is not None:
+                    symbol.parameters.append(symbol_to_add)
 
             self.symbols.append(symbol_to_add)
+            self.shadow_chains.setdefault(symbol_to_add.identifier, []).append(symbol_to_add)
+            self.scoped_symbols[(symbol_to_add.identifier, symbol_to_add.scope)] = symbol_to_add
+            self.scopes.setdefault(symbol_to_add.scope, []).append(symbol_to_add)
 
             return True
         else:
             return False
 
+    # Find the symbol an identifier refers to from a scope
+    # That is the most recently added symbol with the identifier in the scope or an enclosing one, or None
+    def lookup(self, identifier, scope):
+        chain = self.shadow_chains.get(identifier)
+
+        if chain is not None:
+            for symbol in reversed(chain):
+                if symbol.scope <= scope:
+                    return symbol
+
+        return None
+
     def exists(self, identifier, scope):
-        for symbol in reversed(self.symbols):
-            if symbol.identifier == identifier and symbol.scope <= scope:
-                return symbol
+        symbol = self.lookup(identifier, scope)
+        if symbol is None:
+            return False
 
-        return False
+        return symbol
 
     def load_params(self, function_name, scope):
-        for symbol in reversed(self.symbols):
-            if symbol.identifier == function_name and symbol.scope <= scope:
-                return symbol.parameters
+        symbol = self.lookup(function_name, scope)
+        if symbol is None:
+            return []
 
-        return []
+        return symbol.parameters
 
     def load_type(self, symbol_name, scope):
-        for symbol in reversed(self.symbols):
-            if symbol.identifier == symbol_name and symbol.scope <= scope:
-                return symbol.type
+        symbol = self.lookup(symbol_name, scope)
+        if symbol is None:
+            return []
 
-        return []
+        return symbol.type
 
     def function_exists(self, identifier, scope):
-        for symbol in reversed(self.symbols):
-            if symbol.identifier == identifier and symbol.scope <= scope:
-                if not symbol.is_function:
-                    # found matching symbol, but it is not a function
-                    return False
-                else:
-                    # found matching symbol in closest scope, and is a function
-                    return True
-
-        # no match found
-        return False
+        symbol = self.lookup(identifier, scope)
+        if symbol is None:
+            # no match found
+            return False
+
+        # the symbol in the closest scope must be a function
+        return symbol.is_function
 
     def var_exists(self, identifier, scope):
-        for symbol in reversed(self.symbols):
-            if symbol.identifier == identifier and symbol.scope <= scope:
-                if symbol.is_function:
-                    # found matching symbol, but it is not a function
-                    return False
-                else:
-                    # found matching symbol in closest scope, and is a function
-                    return True
-
-        # no match found
-        return False
+        symbol = self.lookup(identifier, scope)
+        if symbol is None:
+            # no match found
+            return False
 
-    def exists_in_scope(self, identifier, scope):
-        for symbol in self.symbols:
-            if symbol.identifier == identifier and symbol.scope == scope:
-                return True
+        # the symbol in the closest scope must not be a function
+        return not symbol.is_function
 
-        return False
+    def exists_in_scope(self, identifier, scope):
+        return (identifier, scope) in self.scoped_symbols
 
+    # Remove the symbols declared in a scope, in time proportional to their number
+    # The scope being destroyed is normally the innermost one, so its symbols are the last ones added to the table
+    # and to their shadow chains, and come off the ends of those lists.
     def destroy_scope(self, scope):
-        symbols_to_remove = []
-        for symbol in self.symbols:
-            if symbol.scope == scope:
-                symbols_to_remove.append(symbol)
+        frame = self.scopes.pop(scope, None)
+        if not frame:
+            return True
+
+        count = len(frame)
+        if self.symbols[-count:] == frame:
+            del self.symbols[-count:]
+        else:
+            self.symbols[:] = [symbol for symbol in self.symbols if symbol.scope != scope]
+
+        for symbol in reversed(frame):
+            chain = self.shadow_chains[symbol.identifier]
+            if chain[-1] is symbol:
+                chain.pop()
+            else:
+                chain.remove(symbol)
+
+            if not chain:
+                del self.shadow_chains[symbol.identifier]
 
-        for symbol_to_remove in symbols_to_remove:
-            self.symbols.remove(symbol_to_remove)
+            del self.scoped_symbols[(symbol.identifier, scope)]
 
         return True
 
@@ -0,0 +1,225 @@
+#
+#
+#   Syntax Tree
+#   This module contains the nodes of the abstract syntax tree built by the TreeParser
+#
+#   Nodes are small: each class lists its fields in __slots__, so a node carries no instance dictionary. Every node
+#   records the index of the token it was built from, so later passes can report source positions.
+#
+#
+
+
+class Node(object):
+
+    __slots__ = ("token_index",)
+
+    # names of every field, in the order the constructor takes them
+    @classmethod
+    def fields(cls):
+        names = []
+        for klass in reversed(cls.__mro__):
+            names.extend(name for name in klass.__dict__.get("__slots__", ()) if name != "token_index")
+
+        return names
+
+    def __repr__(self):
+        values = (name + "=" + repr(getattr(self, name, None)) for name in self.fields())
+        return self.__class__.__name__ + "(" + ", ".join(values) + ")"
+
+
+#   Declarations
+
+
+class Program(Node):
+
+    __slots__ = ("declarations",)
+
+    def __init__(self, declarations, token_index=0):
+        self.declarations = declarations
+        self.token_index = token_index
+
+
+class VariableDeclaration(Node):
+
+    __slots__ = ("type", "identifier", "size")
+
+    # size - number of elements of an array, None for a scalar
+    def __init__(self, type, identifier, size=None, token_index=0):
+        self.type = type
+        self.identifier = identifier
+        self.size = size
+        self.token_index = token_index
+
+
+class FunctionDeclaration(Node):
+
+    __slots__ = ("type", "identifier", "parameters", "body")
+
+    def __init__(self, type, identifier, parameters, body, token_index=0):
+        self.type = type
+        self.identifier = identifier
+        self.parameters = parameters
+        self.body = body
+        self.token_index = token_index
+
+
+class Parameter(Node):
+
+    __slots__ = ("type", "identifier", "is_array")
+
+    def __init__(self, type, identifier, is_array=False, token_index=0):
+        self.type = type
+        self.identifier = identifier
+        self.is_array = is_array
+        self.token_index = token_index
+
+
+#   Statements
+
+
+class CompoundStatement(Node):
+
+    __slots__ = ("declarations", "statements")
+
+    def __init__(self, declarations, statements, token_index=0):
+        self.declarations = declarations
+        self.statements = statements
+        self.token_index = token_index
+
+
+class ExpressionStatement(Node):
+
+    __slots__ = ("expression",)
+
+    def __init__(self, expression, token_index=0):
+        self.expression = expression
+        self.token_index = token_index
+
+
+class EmptyStatement(Node):
+
+    __slots__ = ()
+
+    def __init__(self, token_index=0):
+        self.token_index = token_index
+
+
+class SelectionStatement(Node):
+
+    __slots__ = ("condition", "then_statement", "else_statement")
+
+    # else_statement - None without an else clause
+    def __init__(self, condition, then_statement, else_statement=None, token_index=0):
+        self.condition = condition
+        self.then_statement = then_statement
+        self.else_statement = else_statement
+        self.token_index = token_index
+
+
+class IterationStatement(Node):
+
+    __slots__ = ("condition", "body")
+
+    def __init__(self, condition, body, token_index=0):
+        self.condition = condition
+        self.body = body
+        self.token_index = token_index
+
+
+class ReturnStatement(Node):
+
+    __slots__ = ("expression",)
+
+    # expression - None for a bare return
+    def __init__(self, expression=None, token_index=0):
+        self.expression = expression
+        self.token_index = token_index
+
+
+#   Expressions
+#   The type of an expression is filled in by the SemanticAnalyzer
+
+
+class Expression(Node):
+
+    __slots__ = ("type",)
+
+
+class Assignment(Expression):
+
+    __slots__ = ("target", "value")
+
+    # target - the Variable assigned to
+    def __init__(self, target, value, token_index=0):
+        self.target = target
+        self.value = value
+        self.type = None
+        self.token_index = token_index
+
+
+class BinaryOperation(Expression):
+
+    __slots__ = ("operator", "left", "right")
+
+    def __init__(self, operator, left, right, token_index=0):
+        self.operator = operator
+        self.left = left
+        self.right = right
+        self.type = None
+        self.token_index = token_index
+
+
+class Variable(Expression):
+
+    __slots__ = ("identifier", "index")
+
+    # index - expression of the element of an array, None for the whole variable
+    def __init__(self, identifier, index=None, token_index=0):
+        self.identifier = identifier
+        self.index = index
+        self.type = None
+        self.token_index = token_index
+
+
+class Call(Expression):
+
+    __slots__ = ("identifier", "arguments")
+
+    def __init__(self, identifier, arguments, token_index=0):
+        self.identifier = identifier
+        self.arguments = arguments
+        self.type = None
+        self.token_index = token_index
+
+
+class Number(Expression):
+
+    __slots__ = ("value",)
+
+    # value - the lexeme of the number, type - "int" or "float"
+    def __init__(self, value, type, token_index=0):
+        self.value = value
+        self.type = type
+        self.token_index = token_index
+
+
+# operators of the relational expressions, which compare rather than compute
+RELATIONAL_OPERATORS = frozenset(["<=", "<", ">", ">=", "==", "!="])
+
+
+#   Describe Location
+#   Location of a token for messages, empty if the source is unknown
+#
+#   lexical_analyzer - analyzer which produced the tokens, or None
+#   token_index - index of the token in the token stream. Past the end of the input, the last token is located
+def describe_location(lexical_analyzer, token_index):
+    if lexical_analyzer is None:
+        return ""
+
+    token_index = min(token_index, len(lexical_analyzer.offsets) - 1)
+    if token_index < 0:
+        return ""
+
+    line, column, offset, length = lexical_analyzer.get_position(token_index)
+
+    return " at line " + str(line) + ", column " + str(column)
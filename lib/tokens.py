@@ -0,0 +1,112 @@
+#
+#
+#   Tokens
+#   This module contains the token objects passed from the Lexical Analyzer to the Parser
+#
+#
+import sys
+
+if sys.version_info[0] >= 3:
+    intern = sys.intern
+else:
+    intern = intern  # make the builtin importable from this module
+
+# Token kinds
+KEYWORD = 0
+IDENTIFIER = 1
+NUMBER = 2
+FLOAT = 3
+OPERATORS = 4
+ERROR = 5
+
+# Token type names, indexed by kind
+KIND_NAMES = [
+    "KEYWORD",
+    "IDENTIFIER",
+    "NUMBER",
+    "FLOAT",
+    "OPERATORS",
+    "ERROR",
+]
+
+KIND_CODES = dict((name, kind) for kind, name in enumerate(KIND_NAMES))
+
+
+class Token(object):
+
+    __slots__ = ("value", "kind")
+
+    def __init__(self, value, kind):
+        self.value = value
+        self.kind = kind
+
+    # name of the token type, as used by list tokens
+    @property
+    def type(self):
+        return KIND_NAMES[self.kind]
+
+    # the [value, type] list form of the token
+    def as_list(self):
+        return [self.value, KIND_NAMES[self.kind]]
+
+    # tokens used to be [value, type] lists, keep reading them that way working
+    def __getitem__(self, index):
+        return self.as_list()[index]
+
+    def __len__(self):
+        return 2
+
+    def __iter__(self):
+        return iter(self.as_list())
+
+    def __eq__(self, other):
+        if isinstance(other, Token):
+            return self.kind == other.kind and self.value == other.value
+        elif isinstance(other, (list, tuple)):
+            return self.as_list() == list(other)
+
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+
+        return not equal
+
+    def __hash__(self):
+        return hash((self.value, self.kind))
+
+    def __repr__(self):
+        return repr(self.as_list())
+
+
+# Keywords and operators are shared, so the parser may compare them by identity
+canonical_tokens = {}
+
+
+#   Make Token
+#   Create a token with an interned value, reusing the shared token for keywords and operators
+#
+#   value - lexeme of the token
+#   kind - one of the token kinds above
+def make_token(value, kind):
+    if kind == KEYWORD or kind == OPERATORS:
+        token = canonical_tokens.get(value)
+        if token is None:
+            token = canonical_tokens[value] = Token(intern(value), kind)
+
+        return token
+
+    return Token(intern(value), kind)
+
+
+#   As Token
+#   Convert a [value, type] list token to a Token
+#
+#   token - Token or [value, type] list
+def as_token(token):
+    if isinstance(token, Token) or token is None:
+        return token
+
+    return make_token(token[0], KIND_CODES[token[1]])
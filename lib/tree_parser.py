@@ -0,0 +1,376 @@
+#
+#
+#   Tree Parser
+#   This module contains a recursive descent parser which builds an abstract syntax tree, see lib/syntax_tree.py
+#
+#   The TreeParser only checks the input against the grammar. Semantic analysis and code generation are separate
+#   walks over the tree it builds, see lib/semantic_analyzer.py and lib/code_generator.py.
+#
+#
+from __future__ import print_function
+from lib import util
+from lib.parser import TokenStream, production, LEFT_PARENTHESIS, RIGHT_PARENTHESIS, LEFT_BRACKET, SEMICOLON, \
+    COMMA, INT, VOID
+from lib.syntax_tree import Program, VariableDeclaration, FunctionDeclaration, Parameter, CompoundStatement, \
+    ExpressionStatement, EmptyStatement, SelectionStatement, IterationStatement, ReturnStatement, Assignment, \
+    BinaryOperation, Variable, Call, Number, RELATIONAL_OPERATORS, describe_location
+from lib.tokens import make_token, as_token, KEYWORD, IDENTIFIER, NUMBER, FLOAT, OPERATORS, KIND_NAMES
+
+RIGHT_BRACKET = make_token("]", OPERATORS)
+LEFT_BRACE = make_token("{", OPERATORS)
+RIGHT_BRACE = make_token("}", OPERATORS)
+ASSIGN = make_token("=", OPERATORS)
+FLOAT_TYPE = make_token("float", KEYWORD)
+IF = make_token("if", KEYWORD)
+ELSE = make_token("else", KEYWORD)
+WHILE = make_token("while", KEYWORD)
+RETURN = make_token("return", KEYWORD)
+
+TYPE_SPECIFIERS = (INT, VOID, FLOAT_TYPE)
+
+
+#   Syntax Rejection
+#   Raised when the input does not match the grammar, ending the parse
+class SyntaxRejection(Exception):
+    pass
+
+
+class TreeParser(object):
+
+    # initialization of properties
+    #
+    # tokens - tokens in source order, as a list or an iterator such as LexicalAnalyzer.iter_tokens
+    # lexical_analyzer - analyzer which produced the tokens, used to locate them in the source
+    def __init__(self, tokens, lexical_analyzer=None):
+        self.tokens = TokenStream(as_token(token) for token in tokens)
+        self.lexical_analyzer = lexical_analyzer
+        self.accepted = True
+        self.token_index = 0  # index of the current token in the token stream
+        self.current_token = self.tokens.pop()
+
+    # Parse the tokens, returning the Program, or None if they do not match the grammar
+    def parse(self):
+        try:
+            program = self.program()
+        except SyntaxRejection as rejection:
+            self.accepted = False
+            print("Syntax Rejection: " + str(rejection) + describe_location(self.lexical_analyzer, self.token_index))
+            return None
+
+        return program
+
+    # program -> declaration-list
+    @production
+    def program(self):
+        declarations = []
+        while self.current_token is not None:
+            if self.current_token is SEMICOLON:
+                # empty-declaration -> ;
+                self.next_token()
+            else:
+                declarations.append(self.declaration())
+
+        return Program(declarations)
+
+    # declaration -> var-declaration | function-declaration
+    @production
+    def declaration(self):
+        token_index = self.token_index
+        type = self.type_specifier()
+        identifier = self.match(IDENTIFIER)
+
+        if self.current_token is LEFT_PARENTHESIS:
+            return self.function_declaration(type, identifier, token_index)
+
+        return self.var_declaration(type, identifier, token_index)
+
+    # var-declaration -> type-specifier ID ; | type-specifier ID [ NUM ] ;
+    @production
+    def var_declaration(self, type, identifier, token_index):
+        size = None
+        if self.current_token is LEFT_BRACKET:
+            self.next_token()
+            size = int(self.match(NUMBER))
+            self.match_token(RIGHT_BRACKET)
+
+        self.match_token(SEMICOLON)
+
+        return VariableDeclaration(type, identifier, size, token_index)
+
+    # function-declaration -> type-specifier ID ( params ) compound-statement
+    @production
+    def function_declaration(self, type, identifier, token_index):
+        self.match_token(LEFT_PARENTHESIS)
+        parameters = self.params()
+        self.match_token(RIGHT_PARENTHESIS)
+        body = self.run(self.compound_statement())
+
+        return FunctionDeclaration(type, identifier, parameters, body, token_index)
+
+    # type-specifier -> int | void | float
+    @production
+    def type_specifier(self):
+        if self.current_token not in TYPE_SPECIFIERS:
+            self.reject("a type")
+
+        return self.match(KEYWORD)
+
+    # params -> void | param-list
+    @production
+    def params(self):
+        if self.current_token is VOID and self.tokens.lookahead is RIGHT_PARENTHESIS:
+            self.next_token()
+            return []
+
+        parameters = [self.param()]
+        while self.current_token is COMMA:
+            self.next_token()
+            parameters.append(self.param())
+
+        return parameters
+
+    # param -> type-specifier ID | type-specifier ID [ ]
+    @production
+    def param(self):
+        token_index = self.token_index
+        type = self.type_specifier()
+        identifier = self.match(IDENTIFIER)
+
+        is_array = False
+        if self.current_token is LEFT_BRACKET:
+            self.next_token()
+            self.match_token(RIGHT_BRACKET)
+            is_array = True
+
+        return Parameter(type, identifier, is_array, token_index)
+
+    #
+    #   Statement Productions
+    #   Compound, selection and iteration statements, and the statement production between them, are generators run
+    #   on an explicit stack like the expression productions, so blocks may nest far deeper than the recursion limit.
+    #
+
+    # compound-statement -> { local-declarations statement-list }
+    @production
+    def compound_statement(self):
+        token_index = self.token_index
+        self.match_token(LEFT_BRACE)
+
+        declarations = []
+        while self.current_token in TYPE_SPECIFIERS:
+            declaration_index = self.token_index
+            type = self.type_specifier()
+            identifier = self.match(IDENTIFIER)
+            declarations.append(self.var_declaration(type, identifier, declaration_index))
+
+        statements = []
+        while self.current_token is not RIGHT_BRACE:
+            if self.current_token is None:
+                self.reject("'}'")
+            statements.append((yield self.statement()))
+
+        self.next_token()
+
+        return CompoundStatement(declarations, statements, token_index)
+
+    # statement -> expression-statement | selection-statement | compound-statement
+    #   | iteration-statement | return-statement | empty-statement
+    @production
+    def statement(self):
+        if self.current_token is IF:
+            return (yield self.selection_statement())
+        elif self.current_token is WHILE:
+            return (yield self.iteration_statement())
+        elif self.current_token is RETURN:
+            return self.return_statement()
+        elif self.current_token is LEFT_BRACE:
+            return (yield self.compound_statement())
+        elif self.current_token is SEMICOLON:
+            token_index = self.token_index
+            self.next_token()
+            return EmptyStatement(token_index)
+
+        token_index = self.token_index
+        expression = self.run(self.expression())
+        self.match_token(SEMICOLON)
+
+        return ExpressionStatement(expression, token_index)
+
+    # selection-statement -> if ( expression ) statement | if ( expression ) statement else statement
+    @production
+    def selection_statement(self):
+        token_index = self.token_index
+        self.next_token()
+        condition = self.parenthesized_expression()
+        then_statement = yield self.statement()
+
+        else_statement = None
+        if self.current_token is ELSE:
+            self.next_token()
+            else_statement = yield self.statement()
+
+        return SelectionStatement(condition, then_statement, else_statement, token_index)
+
+    # iteration-statement -> while ( expression ) statement
+    @production
+    def iteration_statement(self):
+        token_index = self.token_index
+        self.next_token()
+        condition = self.parenthesized_expression()
+        body = yield self.statement()
+
+        return IterationStatement(condition, body, token_index)
+
+    # return-statement -> return expression ; | return ;
+    @production
+    def return_statement(self):
+        token_index = self.token_index
+        self.next_token()
+
+        expression = None
+        if self.current_token is not SEMICOLON:
+            expression = self.run(self.expression())
+        self.match_token(SEMICOLON)
+
+        return ReturnStatement(expression, token_index)
+
+    # ( expression ), the condition of a selection or iteration statement
+    def parenthesized_expression(self):
+        self.match_token(LEFT_PARENTHESIS)
+        expression = self.run(self.expression())
+        self.match_token(RIGHT_PARENTHESIS)
+
+        return expression
+
+    #
+    #   Expression Productions
+    #   As in the Parser, the expression productions are generators run on an explicit stack, yielding the
+    #   productions they are built from, so expressions may nest far deeper than the Python recursion limit.
+    #
+
+    # expression -> var = expression | simple-expression
+    @production
+    def expression(self):
+        expression = yield self.simple_expression()
+
+        if self.current_token is ASSIGN:
+            if not isinstance(expression, Variable):
+                self.reject("an expression, not an assignment to an expression")
+
+            token_index = self.token_index
+            self.next_token()
+            value = yield self.expression()
+            expression = Assignment(expression, value, token_index)
+
+        return expression
+
+    # simple-expression -> additive-expression relop additive-expression | additive-expression
+    @production
+    def simple_expression(self):
+        expression = yield self.additive_expression()
+
+        while self.current_token is not None and self.current_token.kind == OPERATORS \
+                and self.current_token.value in RELATIONAL_OPERATORS:
+            expression = yield self.binary_operation(expression, self.additive_expression())
+
+        return expression
+
+    # additive-expression -> additive-expression addop term | term
+    @production
+    def additive_expression(self):
+        expression = yield self.term()
+
+        while self.current_token is not None and self.current_token.kind == OPERATORS \
+                and self.current_token.value in ("+", "-"):
+            expression = yield self.binary_operation(expression, self.term())
+
+        return expression
+
+    # term -> term mulop factor | factor
+    @production
+    def term(self):
+        expression = yield self.factor()
+
+        while self.current_token is not None and self.current_token.kind == OPERATORS \
+                and self.current_token.value in ("*", "/"):
+            expression = yield self.binary_operation(expression, self.factor())
+
+        return expression
+
+    # the operator at the current token, applied to the left operand and the right operand production
+    def binary_operation(self, left, right_production):
+        token_index = self.token_index
+        operator = self.current_token.value
+        self.next_token()
+        right = yield right_production
+
+        return BinaryOperation(operator, left, right, token_index)
+
+    # factor -> ( expression ) | var | call | NUM | FLOAT
+    @production
+    def factor(self):
+        token_index = self.token_index
+
+        if self.current_token is LEFT_PARENTHESIS:
+            self.next_token()
+            expression = yield self.expression()
+            self.match_token(RIGHT_PARENTHESIS)
+            return expression
+
+        if self.current_token is not None and self.current_token.kind in (NUMBER, FLOAT):
+            type = "int" if self.current_token.kind == NUMBER else "float"
+            return Number(self.match(self.current_token.kind), type, token_index)
+
+        identifier = self.match(IDENTIFIER)
+
+        if self.current_token is LEFT_PARENTHESIS:
+            # call -> ID ( args )
+            self.next_token()
+            arguments = []
+            if self.current_token is not RIGHT_PARENTHESIS:
+                arguments.append((yield self.expression()))
+                while self.current_token is COMMA:
+                    self.next_token()
+                    arguments.append((yield self.expression()))
+            self.match_token(RIGHT_PARENTHESIS)
+            return Call(identifier, arguments, token_index)
+
+        # var -> ID | ID [ expression ]
+        index = None
+        if self.current_token is LEFT_BRACKET:
+            self.next_token()
+            index = yield self.expression()
+            self.match_token(RIGHT_BRACKET)
+
+        return Variable(identifier, index, token_index)
+
+    # Run an expression production on an explicit stack, returning its result
+    def run(self, steps):
+        return util.run_steps(steps)
+
+    # accept a token of a kind, returning its value
+    def match(self, token_type):
+        if self.current_token is None or self.current_token.kind != token_type:
+            self.reject(KIND_NAMES[token_type])
+
+        value = self.current_token.value
+        self.next_token()
+
+        return value
+
+    # accept one of the shared keyword or operator tokens
+    def match_token(self, token):
+        if self.current_token is not token:
+            self.reject("'" + token.value + "'")
+
+        self.next_token()
+
+    # advance the parser to the next token
+    def next_token(self):
+        self.token_index += 1
+        self.current_token = self.tokens.pop()
+
+    # the input does not match the grammar, reject it
+    def reject(self, expected):
+        found = "end of input" if self.current_token is None else "'" + self.current_token.value + "'"
+        raise SyntaxRejection("expected " + expected + ", found " + found)
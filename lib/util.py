@@ -44,6 +44,91 @@ def load_file(file):
     return list
 
 
+#   Get Option
+#   Pull a --name=value or --name value option out of the command line arguments, so positional arguments
+#   keep their places
+#   A --name with no value after it, or another option after it, ends the program with a usage error.
+#
+#   arguments - argument list, such as sys.argv. The option is removed from it
+#   name - option name, without the leading dashes
+#   default - value used when the option is not given
+def get_option(arguments, name, default=None):
+    flag = "--" + name
+    prefix = flag + "="
+
+    for index, argument in enumerate(arguments):
+        if argument.startswith(prefix):
+            del arguments[index]
+            return argument[len(prefix):]
+        elif argument == flag:
+            if index + 1 >= len(arguments) or arguments[index + 1].startswith("--"):
+                error("Missing value for " + flag + ", expected " + flag + " value or " + flag + "=value", True)
+
+            value = arguments[index + 1]
+            del arguments[index:index + 2]
+            return value
+
+    return default
+
+
+#   Get Flag
+#   Pull a --name flag out of the command line arguments, returning whether it was given
+#
+#   arguments - argument list, such as sys.argv. The flag is removed from it
+#   name - flag name, without the leading dashes
+def get_flag(arguments, name):
+    flag = "--" + name
+    if flag in arguments:
+        arguments.remove(flag)
+        return True
+
+    return False
+
+
+#   Get Level
+#   Pull a -<name><level> option, such as -O2, out of the command line arguments, returning its level
+#   A bare -<name> is level 1.
+#
+#   arguments - argument list, such as sys.argv. The option is removed from it
+#   name - option name, without the leading dash
+#   default - level returned when the option is not given
+def get_level(arguments, name, default=0):
+    flag = "-" + name
+
+    for index, argument in enumerate(arguments):
+        if argument == flag:
+            del arguments[index]
+            return 1
+        elif argument.startswith(flag) and argument[len(flag):].isdigit():
+            del arguments[index]
+            return int(argument[len(flag):])
+
+    return default
+
+
+#   Run Steps
+#   Run a generator on an explicit stack, returning its result
+#   The generator yields the generators it would otherwise call, and is sent back their results, so nesting is
+#   limited by memory rather than the Python recursion limit.
+#
+#   steps - generator to run
+def run_steps(steps):
+    stack = [steps]
+    result = None
+
+    while stack:
+        try:
+            called = stack[-1].send(result)
+        except StopIteration as returned:
+            stack.pop()
+            result = returned.value
+        else:
+            stack.append(called)
+            result = None
+
+    return result
+
+
 def deepcopy(arr):
     return [row[:] for row in arr]
 
@@ -0,0 +1,573 @@
+#
+#
+#   Virtual Machine
+#   This module executes the quadruples generated for a C- program
+#
+#   The quadruples are decoded once into columns of integers: an opcode, two operands and a result for each
+#   instruction. Names are resolved to storage while decoding, so running an instruction never looks at a string.
+#
+#   Memory is one list of words. Globals and the constant pool come first, followed by a stack of activation
+#   records, one per active call. An operand is a slot of the current activation record when it is zero or more,
+#   and otherwise the complement of an address outside the stack, so a global or a constant.
+#
+#   Branch targets are resolved to instruction numbers while decoding. Quadruples which only describe storage,
+#   such as alloc, param and block, are not instructions, and a branch to one goes to the instruction following it.
+#
+#   The temporary a disp leaves is the address of an array element. Reading it reads the element and assigning it
+#   writes the element, so those uses are decoded into a LOAD before the instruction or a STORE in its place. The
+#   address is only checked by the LOAD or STORE, so working out an address which is never used does no harm.
+#
+#
+from __future__ import print_function
+import re
+import sys
+from array import array
+from lib.code_generator import WORD_SIZE
+
+# instruction opcodes
+ASSIGN, ADD, SUB, MULT, DIV, COMP, BR, BRGT, BRGEQ, BRLT, BRLEQ, BREQ, BRNEQ, DISP, DISP_POINTER, LOAD, STORE, \
+    ARG, ARG_ADDRESS, CALL, RETURN, RETURN_VOID, INPUT, OUTPUT = range(24)
+
+# instruction opcodes by quadruple opcode, for those which decode to one instruction of the same form
+ARITHMETIC_INSTRUCTIONS = {
+    "add": ADD,
+    "sub": SUB,
+    "mult": MULT,
+    "div": DIV,
+    "comp": COMP,
+}
+BRANCH_INSTRUCTIONS = {
+    "BR": BR,
+    "BRGT": BRGT,
+    "BRGEQ": BRGEQ,
+    "BRLT": BRLT,
+    "BRLEQ": BRLEQ,
+    "BREQ": BREQ,
+    "BRNEQ": BRNEQ,
+}
+
+# functions provided by the machine, called when a program does not declare its own
+BUILTIN_INSTRUCTIONS = {
+    "input": (INPUT, 0),
+    "output": (OUTPUT, 1),
+}
+
+# words the stack may grow to
+DEFAULT_STACK_SIZE = 1 << 22
+
+# words the stack starts with, doubled as calls need more
+INITIAL_STACK_SIZE = 1 << 12
+
+# temporaries the machine adds to each activation record, for the LOADs of an instruction
+SCRATCH_SLOTS = 2
+
+# a number literal, negative when an optimization has folded one
+NUMBER = re.compile(r"-?[0-9]")
+
+
+#   VM Error
+#   Raised when a program cannot be decoded or fails while it runs
+class VMError(Exception):
+    pass
+
+
+#   Storage
+#   Where the value of a variable or temporary is kept
+class Storage(object):
+
+    __slots__ = ("slot", "is_global", "is_array", "is_parameter")
+
+    # slot - slot of the activation record, or the address of a global
+    def __init__(self, slot, is_global=False, is_array=False, is_parameter=False):
+        self.slot = slot
+        self.is_global = is_global
+        self.is_array = is_array
+        self.is_parameter = is_parameter
+
+    # the operand reading this storage
+    def operand(self):
+        return ~self.slot if self.is_global else self.slot
+
+
+#   Function
+#   What a call needs to know about the function it calls
+class Function(object):
+
+    __slots__ = ("name", "entry", "frame_size", "parameter_count")
+
+    def __init__(self, name, parameter_count):
+        self.name = name
+        self.entry = None  # first instruction
+        self.frame_size = 0  # words of its activation record
+        self.parameter_count = parameter_count  # parameters, kept in the first slots of the activation record
+
+
+class VirtualMachine(object):
+
+    # Decode quadruples for running
+    #
+    # quadruples - quadruples of a whole program, as generated by the CodeGenerator
+    # input - function returning the value of each call to input(), reading integers from stdin by default
+    # output - function called with the value of each call to output(), printing it by default
+    # stack_size - words the stack may grow to before the program is stopped
+    def __init__(self, quadruples, input=None, output=None, stack_size=DEFAULT_STACK_SIZE):
+        self.input = input or read_input
+        self.output = output or print
+        self.stack_size = stack_size
+        self.steps = 0  # instructions executed by the last run
+        self.stack_peak = 0  # words of the stack in use at the deepest point of the last run
+
+        self.opcodes = array("B")
+        self.operands1 = array("l")
+        self.operands2 = array("l")
+        self.results = array("l")
+        self.quadruple_indices = array("l")  # quadruple each instruction was decoded from, for errors
+
+        self.data = []  # initial words of the globals and the constant pool
+        self.globals = {}  # name -> Storage
+        self.constants = {}  # literal -> Storage
+        self.functions = []  # Function by index
+        self.function_indices = {}  # name -> index into functions
+
+        self.decode(quadruples)
+
+    #
+    #   Decoding
+    #
+
+    def decode(self, quadruples):
+        # declare every function first, so calls may be decoded wherever they appear
+        for quadruple in quadruples:
+            if quadruple[1] == "func":
+                self.function_indices[quadruple[2]] = len(self.functions)
+                self.functions.append(Function(quadruple[2], int(quadruple[4] or 0)))
+
+        targets = []  # (instruction, quadruple index) of each branch
+        instruction_indices = {}  # quadruple index -> first instruction at or after it
+
+        position = 0
+        while position < len(quadruples):
+            index, opcode, operand1, operand2, result = quadruples[position]
+
+            if opcode == "func":
+                end = position
+                while end < len(quadruples) and quadruples[end][1:3] != ["end", "func"]:
+                    end += 1
+                if end == len(quadruples):
+                    raise VMError("function " + operand1 + " has no end")
+
+                self.decode_function(quadruples[position:end + 1], targets, instruction_indices)
+                position = end + 1
+            elif opcode == "alloc":
+                instruction_indices[index] = len(self.opcodes)
+                self.globals[result] = self.allocate_data(self.words(operand1), is_array=int(operand1) != WORD_SIZE)
+                position += 1
+            else:
+                raise VMError("quadruple " + str(index) + ", " + opcode + ", is outside a function")
+
+        for instruction, quadruple_index in targets:
+            if quadruple_index not in instruction_indices:
+                raise VMError("quadruple " + str(self.quadruple_indices[instruction]) + " branches to " +
+                              str(quadruple_index) + ", outside its function")
+            self.results[instruction] = instruction_indices[quadruple_index]
+
+    # Decode the quadruples from a func to its end func
+    def decode_function(self, quadruples, targets, instruction_indices):
+        function = self.functions[self.function_indices[quadruples[0][2]]]
+        function.entry = len(self.opcodes)
+
+        # temporaries holding the address of an array element
+        references = set(quadruple[4] for quadruple in quadruples if quadruple[1] == "disp")
+
+        # resolve names in a first pass, as a variable of a word is only known to be an array once it is indexed
+        scopes = [{}]
+        temps = {}
+        frame = [0]  # slots of the activation record allocated so far
+        parameters = []
+        unbound = None  # parameter declared by the quadruple before, whose alloc gives it storage
+        resolved = []
+
+        def allocate(words, is_array=False, is_parameter=False):
+            storage = Storage(frame[0], is_array=is_array, is_parameter=is_parameter)
+            frame[0] += words
+            return storage
+
+        def resolve(name):
+            if isinstance(name, int):
+                return self.constant(str(name))
+            if name == "":
+                return name
+            if NUMBER.match(name):
+                return self.constant(name)
+            if name.startswith("_t"):
+                if name not in temps:
+                    temps[name] = allocate(1)
+                return temps[name]
+
+            for scope in reversed(scopes):
+                if name in scope:
+                    return scope[name]
+            if name in self.globals:
+                return self.globals[name]
+
+            raise VMError("quadruple " + str(index) + " uses " + name + ", which is not declared")
+
+        for index, opcode, operand1, operand2, result in quadruples[1:]:
+            if opcode == "param":
+                parameters.append(result)
+            elif opcode == "alloc":
+                if result == unbound:
+                    # parameters take the first slots, where a call leaves its arguments
+                    if frame[0] != len(parameters) - 1:
+                        raise VMError("quadruple " + str(index) + " allocates parameter " + result +
+                                      " after other storage")
+                    scopes[-1][result] = allocate(1, is_parameter=True)
+                else:
+                    scopes[-1][result] = allocate(self.words(operand1), is_array=int(operand1) != WORD_SIZE)
+            elif opcode == "block":
+                scopes.append({})
+            elif opcode == "end" and operand1 == "block":
+                scopes.pop()
+            unbound = result if opcode == "param" else None
+
+            if opcode == "call":
+                resolved.append((index, opcode, operand1, operand2, resolve(result)))
+            elif opcode in BRANCH_INSTRUCTIONS:
+                resolved.append((index, opcode, resolve(operand1), operand2, result))
+            elif opcode in ("func", "end", "param", "alloc", "block"):
+                resolved.append((index, opcode, operand1, operand2, result))
+            else:
+                resolved.append((index, opcode, resolve(operand1), resolve(operand2), resolve(result)))
+
+            if opcode == "disp":
+                if not isinstance(resolved[-1][2], Storage) or resolved[-1][2] in self.constants.values():
+                    raise VMError("quadruple " + str(index) + " indexes " + str(operand1) + ", which is not an array")
+                if not resolved[-1][2].is_parameter:
+                    resolved[-1][2].is_array = True
+
+        if len(parameters) != function.parameter_count:
+            raise VMError("function " + function.name + " declares " + str(function.parameter_count) +
+                          " parameters, but has " + str(len(parameters)))
+
+        reference_storage = set(id(temps[name]) for name in references if name in temps)
+        scratch = [allocate(1) for number in range(SCRATCH_SLOTS)]
+
+        # read a value, loading it first when it is an element of an array
+        def read(value, instruction_index, scratch_number=0):
+            if value == "":
+                raise VMError("quadruple " + str(instruction_index) + " is missing an operand")
+            if id(value) in reference_storage:
+                self.add_instruction(LOAD, value.operand(), 0, scratch[scratch_number].slot, instruction_index)
+                return scratch[scratch_number].slot
+            return value.operand()
+
+        for index, opcode, operand1, operand2, result in resolved:
+            instruction_indices[index] = len(self.opcodes)
+
+            if opcode in ARITHMETIC_INSTRUCTIONS:
+                operand1 = read(operand1, index, 0)
+                operand2 = read(operand2, index, 1)
+                if id(result) in reference_storage:
+                    self.add_instruction(ARITHMETIC_INSTRUCTIONS[opcode], operand1, operand2, scratch[0].slot, index)
+                    self.add_instruction(STORE, scratch[0].slot, 0, result.operand(), index)
+                else:
+                    self.add_instruction(ARITHMETIC_INSTRUCTIONS[opcode], operand1, operand2, result.operand(), index)
+            elif opcode == "assign":
+                operand1 = read(operand1, index)
+                if id(result) in reference_storage:
+                    self.add_instruction(STORE, operand1, 0, result.operand(), index)
+                else:
+                    self.add_instruction(ASSIGN, operand1, 0, result.operand(), index)
+            elif opcode in BRANCH_INSTRUCTIONS:
+                targets.append((len(self.opcodes), int(result)))
+                comparison = read(operand1, index) if opcode != "BR" else 0
+                self.add_instruction(BRANCH_INSTRUCTIONS[opcode], comparison, 0, 0, index)
+            elif opcode == "disp":
+                offset = read(operand2, index)
+                if operand1.is_parameter:
+                    self.add_instruction(DISP_POINTER, operand1.operand(), offset, result.operand(), index)
+                else:
+                    self.add_instruction(DISP, operand1.operand(), offset, result.operand(), index)
+            elif opcode == "arg":
+                if result.is_array and not result.is_parameter:
+                    self.add_instruction(ARG_ADDRESS, result.operand(), 0, 0, index)
+                else:
+                    self.add_instruction(ARG, read(result, index), 0, 0, index)
+            elif opcode == "call":
+                self.call(operand1, int(operand2), result, index)
+            elif opcode == "return":
+                if result == "":
+                    self.add_instruction(RETURN_VOID, 0, 0, 0, index)
+                else:
+                    self.add_instruction(RETURN, read(result, index), 0, 0, index)
+            elif opcode == "end" and operand1 == "func":
+                self.add_instruction(RETURN_VOID, 0, 0, 0, index)
+            elif opcode not in ("end", "param", "alloc", "block"):
+                raise VMError("quadruple " + str(index) + " has unknown opcode " + str(opcode))
+
+        function.frame_size = frame[0]
+
+    # decode a call, to a function of the program or one provided by the machine
+    def call(self, name, argument_count, result, index):
+        if name in self.function_indices:
+            function_index = self.function_indices[name]
+            if argument_count != self.functions[function_index].parameter_count:
+                raise VMError("quadruple " + str(index) + " calls " + name + " with " + str(argument_count) +
+                              " arguments, expected " + str(self.functions[function_index].parameter_count))
+
+            self.add_instruction(CALL, function_index, argument_count, result.operand(), index)
+        elif name in BUILTIN_INSTRUCTIONS:
+            opcode, parameter_count = BUILTIN_INSTRUCTIONS[name]
+            if argument_count != parameter_count:
+                raise VMError("quadruple " + str(index) + " calls " + name + " with " + str(argument_count) +
+                              " arguments, expected " + str(parameter_count))
+
+            self.add_instruction(opcode, 0, 0, result.operand(), index)
+        else:
+            raise VMError("quadruple " + str(index) + " calls " + name + ", which is not declared")
+
+    def add_instruction(self, opcode, operand1, operand2, result, quadruple_index):
+        self.opcodes.append(opcode)
+        self.operands1.append(operand1)
+        self.operands2.append(operand2)
+        self.results.append(result)
+        self.quadruple_indices.append(quadruple_index)
+
+    # words of storage for an alloc of a size in bytes, at least one
+    def words(self, size):
+        return max(1, int(size) // WORD_SIZE)
+
+    # Storage of the globals and constants
+    def allocate_data(self, words, value=0, is_array=False):
+        storage = Storage(len(self.data), is_global=True, is_array=is_array)
+        self.data.extend([value] * words)
+
+        return storage
+
+    # the constant pool entry of a number
+    def constant(self, literal):
+        if literal not in self.constants:
+            self.constants[literal] = self.allocate_data(1, number_value(literal))
+
+        return self.constants[literal]
+
+    #
+    #   Running
+    #
+
+    # Run the program from its main function, returning what main returns
+    def run(self):
+        if "main" not in self.function_indices:
+            raise VMError("the program has no main function")
+
+        main = self.functions[self.function_indices["main"]]
+        if main.parameter_count:
+            raise VMError("main should take no parameters")
+
+        opcodes = self.opcodes
+        operands1 = self.operands1
+        operands2 = self.operands2
+        results = self.results
+        functions = self.functions
+        frame_zeros = [[0] * function.frame_size for function in functions]
+
+        memory = self.data + [0] * INITIAL_STACK_SIZE
+        memory_limit = len(self.data) + self.stack_size
+        fp = len(self.data)  # first slot of the current activation record
+        sp = fp + main.frame_size  # first slot past it
+        if sp > len(memory):
+            memory.extend([0] * (sp - len(memory)))
+
+        peak = sp  # highest sp so far
+        frames = []  # (call instruction, fp) of each caller
+        arguments = []  # values passed by arg, waiting for their call
+        pc = main.entry
+        steps = 0
+
+        try:
+            while True:
+                opcode = opcodes[pc]
+                steps += 1
+
+                if opcode == ASSIGN:
+                    value = operands1[pc]
+                    value = memory[fp + value] if value >= 0 else memory[~value]
+                    result = results[pc]
+                    if result >= 0:
+                        memory[fp + result] = value
+                    else:
+                        memory[~result] = value
+                    pc += 1
+                elif opcode <= COMP:
+                    left = operands1[pc]
+                    left = memory[fp + left] if left >= 0 else memory[~left]
+                    right = operands2[pc]
+                    right = memory[fp + right] if right >= 0 else memory[~right]
+
+                    if opcode == ADD:
+                        value = left + right
+                    elif opcode == SUB:
+                        value = left - right
+                    elif opcode == MULT:
+                        value = left * right
+                    elif opcode == DIV:
+                        value = divide(left, right)
+                    else:
+                        value = (left > right) - (left < right)
+
+                    result = results[pc]
+                    if result >= 0:
+                        memory[fp + result] = value
+                    else:
+                        memory[~result] = value
+                    pc += 1
+                elif opcode <= BRNEQ:
+                    if opcode != BR:
+                        comparison = operands1[pc]
+                        comparison = memory[fp + comparison] if comparison >= 0 else memory[~comparison]
+
+                        if opcode == BRGT:
+                            taken = comparison > 0
+                        elif opcode == BRGEQ:
+                            taken = comparison >= 0
+                        elif opcode == BRLT:
+                            taken = comparison < 0
+                        elif opcode == BRLEQ:
+                            taken = comparison <= 0
+                        elif opcode == BREQ:
+                            taken = comparison == 0
+                        else:
+                            taken = comparison != 0
+
+                        if not taken:
+                            pc += 1
+                            continue
+
+                    pc = results[pc]
+                elif opcode <= DISP_POINTER:
+                    base = operands1[pc]
+                    if opcode == DISP_POINTER:
+                        base = memory[fp + base]
+                    elif base >= 0:
+                        base += fp
+                    else:
+                        base = ~base
+
+                    offset = operands2[pc]
+                    offset = memory[fp + offset] if offset >= 0 else memory[~offset]
+                    memory[fp + results[pc]] = base + offset // WORD_SIZE
+                    pc += 1
+                elif opcode == LOAD:
+                    address = memory[fp + operands1[pc]]
+                    if not 0 <= address < sp:
+                        raise VMError("array element outside memory")
+
+                    memory[fp + results[pc]] = memory[address]
+                    pc += 1
+                elif opcode == STORE:
+                    address = memory[fp + results[pc]]
+                    if not 0 <= address < sp:
+                        raise VMError("array element outside memory")
+
+                    value = operands1[pc]
+                    memory[address] = memory[fp + value] if value >= 0 else memory[~value]
+                    pc += 1
+                elif opcode == ARG:
+                    value = operands1[pc]
+                    arguments.append(memory[fp + value] if value >= 0 else memory[~value])
+                    pc += 1
+                elif opcode == ARG_ADDRESS:
+                    address = operands1[pc]
+                    arguments.append(fp + address if address >= 0 else ~address)
+                    pc += 1
+                elif opcode == CALL:
+                    index = operands1[pc]
+                    function = functions[index]
+
+                    caller_fp = fp
+                    fp = sp
+                    sp = fp + function.frame_size
+                    if sp > peak:
+                        peak = sp
+                    if sp > len(memory):
+                        if sp > memory_limit:
+                            raise VMError("stack overflow calling " + function.name)
+                        memory.extend([0] * max(len(memory), sp - len(memory)))
+
+                    memory[fp:sp] = frame_zeros[index]
+                    count = operands2[pc]
+                    if count:
+                        memory[fp:fp + count] = arguments[-count:]
+                        del arguments[-count:]
+
+                    frames.append((pc, caller_fp))
+                    pc = function.entry
+                elif opcode == RETURN or opcode == RETURN_VOID:
+                    value = 0
+                    if opcode == RETURN:
+                        value = operands1[pc]
+                        value = memory[fp + value] if value >= 0 else memory[~value]
+
+                    if not frames:
+                        return value if opcode == RETURN else None
+
+                    sp = fp
+                    pc, fp = frames.pop()
+                    result = results[pc]
+                    if result >= 0:
+                        memory[fp + result] = value
+                    else:
+                        memory[~result] = value
+                    pc += 1
+                else:
+                    if opcode == INPUT:
+                        value = self.input()
+                    else:
+                        self.output(arguments.pop())
+                        value = 0
+
+                    result = results[pc]
+                    if result >= 0:
+                        memory[fp + result] = value
+                    else:
+                        memory[~result] = value
+                    pc += 1
+        except VMError as error:
+            raise VMError(str(error) + " at quadruple " + str(self.quadruple_indices[pc]))
+        except ZeroDivisionError:
+            raise VMError("division by zero at quadruple " + str(self.quadruple_indices[pc]))
+        finally:
+            self.steps = steps
+            self.stack_peak = peak - len(self.data)
+
+
+#   Number Value
+#   The int or float a number literal stands for
+def number_value(literal):
+    try:
+        return int(literal)
+    except ValueError:
+        return float(literal)
+
+
+#   Divide
+#   Quotient of two numbers, truncated towards zero when both are integers, as C does
+def divide(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        quotient = abs(left) // abs(right)
+        return quotient if (left < 0) == (right < 0) else -quotient
+
+    return left / right
+
+
+#   Read Input
+#   The next integer on stdin, for input()
+def read_input():
+    line = sys.stdin.readline()
+    if not line:
+        raise VMError("input() found no more input")
+
+    try:
+        return int(line)
+    except ValueError:
+        raise VMError("input() expected an integer, found " + line.strip())
@@ -6,54 +6,216 @@
 #   The goal of this project is to tokenize a potential C- program, and sanitize the tokens for
 #   passing to the parser.
 #
+#   Usage: python main.py filename [filename ...] [--jobs N] [--scanner=...] [--input=...] [--frontend=...]
+#          [--cache=DIR] [--cache-size=MB] [-O[level]] [--dot=DIR] [--run]
+#          python main.py filename --watch [--scanner=...]
+#
 #
 
 from __future__ import print_function
+import os
 import sys
+import time
 from lib import util
+from lib.cache import CompileCache, DEFAULT_CACHE_SIZE
+from lib.driver import compile_files, FRONTENDS
+from lib.flow_graph import program_dot
+from lib.incremental import IncrementalCompiler
 from lib.lexical_analyzer import LexicalAnalyzer
-from lib.parser import Parser
+from lib.optimizer import Optimizer
 from lib.prettytable import PrettyTable
+from lib.virtual_machine import VirtualMachine, VMError
 
 __author__ = 'Nicholas Pickering'
 
-filename = 0
+# seconds between checks of a watched file
+WATCH_INTERVAL = 0.2
+
+
+def main():
+    scanner = util.get_option(sys.argv, "scanner", "character")
+    if scanner not in LexicalAnalyzer.scanners:
+        util.error("Unknown scanner " + scanner + ", expected one of: " + ", ".join(LexicalAnalyzer.scanners), True)
+
+    input_mode = util.get_option(sys.argv, "input", "text")
+    if input_mode not in LexicalAnalyzer.inputs:
+        util.error("Unknown input " + input_mode + ", expected one of: " + ", ".join(LexicalAnalyzer.inputs), True)
+
+    frontend = util.get_option(sys.argv, "frontend", "parser")
+    if frontend not in FRONTENDS:
+        util.error("Unknown frontend " + frontend + ", expected one of: " + ", ".join(FRONTENDS), True)
+
+    jobs = util.get_option(sys.argv, "jobs")
+    if jobs is not None:
+        if not jobs.isdigit() or int(jobs) < 1:
+            util.error("Invalid number of jobs: " + jobs, True)
+        jobs = int(jobs)
+
+    cache_size = util.get_option(sys.argv, "cache-size")
+    if cache_size is not None:
+        if not cache_size.isdigit() or int(cache_size) < 1:
+            util.error("Invalid cache size: " + cache_size, True)
+        cache_size = int(cache_size) << 20
+    else:
+        cache_size = DEFAULT_CACHE_SIZE
+
+    cache = None
+    cache_directory = util.get_option(sys.argv, "cache")
+    if cache_directory is not None:
+        cache = CompileCache(cache_directory, cache_size)
+
+    watch = util.get_flag(sys.argv, "watch")
+    run = util.get_flag(sys.argv, "run")
+    optimization_level = util.get_level(sys.argv, "O")
+    dot_directory = util.get_option(sys.argv, "dot")
+
+    #   Start Main Program
+    # print("Recursive Descent Parser")
+    # print("Written by Nicholas Pickering")
+
+    #   Read in file for processing...
+    if len(sys.argv) > 1:
+        filenames = sys.argv[1:]
+    else:
+        util.error("No filename specified... Exiting...", True)
+
+    if watch:
+        if len(filenames) > 1:
+            util.error("Only one file can be watched", True)
+
+        watch_file(filenames[0], scanner)
+        return
+
+    failed = False
+    for compile_result in compile_files(filenames, jobs, scanner, input_mode, frontend, cache):
+        if len(filenames) > 1:
+            print(compile_result.filename + ": " + (compile_result.result or "ERROR"))
+
+        print(compile_result.diagnostics, end="")
+
+        if compile_result.error:
+            sys.stderr.write(compile_result.error)
+            failed = True
+            continue
+
+        quadruples = compile_result.quadruples
+        optimizer = None
+        if optimization_level and compile_result.result == "ACCEPT":
+            optimizer = Optimizer(optimization_level)
+            quadruples = optimizer.optimize(quadruples)
+
+        print_quadruples(quadruples)
+
+        if optimizer is not None:
+            print_statistics(optimizer.statistics)
 
-#   Start Main Program
-# print("Recursive Descent Parser")
-# print("Written by Nicholas Pickering")
+        if dot_directory is not None and compile_result.result == "ACCEPT":
+            write_dot(dot_directory, compile_result.filename, quadruples)
 
-#   Read in file for processing...
-if len(sys.argv) > 1:
-    filename = sys.argv[1]
-else:
-    util.error("No filename specified... Exiting...", True)
+        if run and compile_result.result == "ACCEPT" and not run_quadruples(quadruples):
+            failed = True
 
-file = open(filename, "r")
-if not file:
-    util.error("File could not be loaded... Exiting...", True)
+    if failed:
+        sys.exit(1)
 
-lexical_analyzer = LexicalAnalyzer()
-tokens = lexical_analyzer.process_file(file)
+    # print("---------------------------------------\n")
+    #
+    # print("End Parsing")
 
-if len(tokens) > 0:
-    tokens.reverse()
 
-parser = Parser(tokens)
-parse_result = parser.parse()
+#   Print Quadruples
+#   Print a table of quadruples
+def print_quadruples(quadruples):
+    table = PrettyTable(["i", "opcode", "operand1", "operand2", "result"])
 
-table = PrettyTable(["i", "opcode", "operand1", "operand2", "result"])
+    table.align["i"] = "r" # Left align city names
+    table.align["opcode"] = "r" # Left align city names
+    table.align["operand1"] = "r" # Left align city names
+    table.align["operand2"] = "r" # Left align city names
+    table.align["result"] = "r" # Left align city names
+    for quadruple in quadruples:
+        table.add_row(quadruple)
 
-table.align["i"] = "r" # Left align city names
-table.align["opcode"] = "r" # Left align city names
-table.align["operand1"] = "r" # Left align city names
-table.align["operand2"] = "r" # Left align city names
-table.align["result"] = "r" # Left align city names
-for quadruple in parser.quadruples:
-    table.add_row(quadruple)
+    print(table)
 
-print(table)
 
-# print("---------------------------------------\n")
+#   Print Statistics
+#   Print a table of what each optimization pass did
+def print_statistics(statistics):
+    table = PrettyTable(["pass", "quadruples before", "quadruples after", "note"])
+    table.align["pass"] = "l"
+    table.align["note"] = "l"
+    for row in statistics:
+        table.add_row(row)
+
+    print(table)
+
+
+#   Write Dot
+#   Write the flow graphs of a program to <directory>/<file name>.dot, for Graphviz
+def write_dot(directory, filename, quadruples):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    name = os.path.basename(filename)
+    with open(os.path.join(directory, name + ".dot"), "w") as dot_file:
+        dot_file.write(program_dot(quadruples, name))
+
+
+#   Run Quadruples
+#   Run a program in the VirtualMachine, reading input() from stdin and printing output(), returning False if it
+#   failed
+def run_quadruples(quadruples):
+    try:
+        machine = VirtualMachine(quadruples)
+        value = machine.run()
+    except VMError as error:
+        print("Runtime Error: " + str(error))
+        return False
+
+    if value is not None:
+        print("main returned " + str(value))
+
+    return True
+
+
+#   Watch File
+#   Recompile a file each time it changes, until interrupted
+#   Only the declarations which changed since the last compile are lexed and parsed again.
 #
-# print("End Parsing")
+#   filename - path to the C- program
+#   scanner - LexicalAnalyzer scanner backend
+def watch_file(filename, scanner):
+    compiler = IncrementalCompiler(scanner)
+    modified = None
+
+    try:
+        while True:
+            try:
+                status = os.stat(filename)
+            except OSError:
+                status = None
+
+            if status is not None and (status.st_mtime, status.st_size) != modified:
+                modified = (status.st_mtime, status.st_size)
+
+                file = open(filename, "r")
+                text = file.read()
+                file.close()
+
+                started = time.time()
+                result, quadruples = compiler.compile(text)
+                elapsed = time.time() - started
+
+                print_quadruples(quadruples)
+                print(filename + ": " + result + " in " + "%.1f" % (elapsed * 1000) + " ms")
+                sys.stdout.flush()
+
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+
+
+# files may be compiled in worker processes, which import this module without running it
+if __name__ == "__main__":
+    main()
@@ -6,75 +6,269 @@
 #   The goal of this project is to tokenize a potential C- program, and sanitize the tokens for
 #   passing to the parser.
 #
+#   Usage: python test.py directory [--jobs N] [--scanner=...] [--input=...] [--frontend=...]
+#          [--cache=DIR] [--cache-size=MB] [--run]
+#
+#   With --run, each accepted program is also run in the VirtualMachine, reading input() from the file of the
+#   same name ending in .in and checked against the file ending in .out, when there is one. A -fail program which
+#   is accepted must stop with a run time error, given as a last line "ERROR message" of its .out file. The
+#   quadruples of each program must come back unchanged from their Bytecode, and the program must print the same
+#   after each optimizer pass on its own and at each optimization level.
+#
+#   With --cache, each file must then be a hit equal to a fresh compile, and a cache too small for its entries must
+#   remove the least recently used.
+#
 #
 
 from __future__ import print_function
 
 import glob
+import marshal
+import os
+import shutil
 import sys
+import tempfile
 from lib import util
+from lib.bytecode import Bytecode
+from lib.cache import CacheEntry, CompileCache, DEFAULT_CACHE_SIZE, ENTRY_SUFFIX
+from lib.driver import compile_file, compile_files, FRONTENDS
 from lib.lexical_analyzer import LexicalAnalyzer
-from lib.parser import Parser
+from lib.optimizer import Optimizer, PASSES
 from lib.prettytable import PrettyTable
+from lib.virtual_machine import VirtualMachine, VMError
 
 __author__ = 'Nicholas Pickering'
 
-filename = 0
+# words the stack of a program run by --run may grow to, few enough that runaway recursion stops quickly
+RUN_STACK_SIZE = 1 << 16
+
+
+def main():
+    scanner = util.get_option(sys.argv, "scanner", "character")
+    if scanner not in LexicalAnalyzer.scanners:
+        util.error("Unknown scanner " + scanner + ", expected one of: " + ", ".join(LexicalAnalyzer.scanners), True)
+
+    input_mode = util.get_option(sys.argv, "input", "text")
+    if input_mode not in LexicalAnalyzer.inputs:
+        util.error("Unknown input " + input_mode + ", expected one of: " + ", ".join(LexicalAnalyzer.inputs), True)
+
+    run = util.get_flag(sys.argv, "run")
+
+    frontend = util.get_option(sys.argv, "frontend", "tree" if run else "parser")
+    if frontend not in FRONTENDS:
+        util.error("Unknown frontend " + frontend + ", expected one of: " + ", ".join(FRONTENDS), True)
+    if run and frontend != "tree":
+        util.error("--run takes the quadruples of --frontend=tree, which the virtual machine is written against", True)
+
+    jobs = util.get_option(sys.argv, "jobs")
+    if jobs is not None:
+        if not jobs.isdigit() or int(jobs) < 1:
+            util.error("Invalid number of jobs: " + jobs, True)
+        jobs = int(jobs)
+
+    cache_size = util.get_option(sys.argv, "cache-size")
+    if cache_size is not None:
+        if not cache_size.isdigit() or int(cache_size) < 1:
+            util.error("Invalid cache size: " + cache_size, True)
+        cache_size = int(cache_size) << 20
+    else:
+        cache_size = DEFAULT_CACHE_SIZE
+
+    cache = None
+    cache_directory = util.get_option(sys.argv, "cache")
+    if cache_directory is not None:
+        cache = CompileCache(cache_directory, cache_size)
+
+    #   Start Main Program
+    # print("Recursive Descent Parser")
+    # print("Written by Nicholas Pickering")
+
+    if len(sys.argv) <= 1:
+        util.error("No test directory specified... Exiting...", True)
+
+    #   Read in file for processing...
+    files = sorted(glob.glob("data/" + str(sys.argv[1]) + "/*.txt"))
+    no_errors = True
+    for compile_result in compile_files(files, jobs, scanner, input_mode, frontend, cache):
+        filename = compile_result.filename
+        parse_result = compile_result.result
+
+        print(compile_result.diagnostics, end="")
+
+        should_fail = "-fail" in filename
+        error = False
+        problems = []
+
+        if compile_result.error:
+            parse_result = "ERROR\n" + compile_result.error
+            error = True
+        elif run and parse_result == "ACCEPT":
+            problems = check_run(filename, compile_result.quadruples, should_fail)
+            error = len(problems) > 0
+        elif should_fail and parse_result == "ACCEPT":
+            error = True
+        elif not should_fail and parse_result == "REJECT":
+            error = True
+
+        if cache is not None and not compile_result.error:
+            problems.extend(check_cache(compile_result, scanner, input_mode, frontend, cache))
+            error = error or len(problems) > 0
+
+        if error:
+            if no_errors:
+                print("Invalid Tests:")
+
+            no_errors = False
+            print(filename + ": " + parse_result + "\n", end="")
+            for problem in problems:
+                print("    " + problem)
 
-#   Start Main Program
-# print("Recursive Descent Parser")
-# print("Written by Nicholas Pickering")
+        table = PrettyTable(["i", "opcode", "operand1", "operand2", "result"])
 
-if len(sys.argv) > 1:
-    filename = sys.argv[1]
-else:
-    util.error("No test directory specified... Exiting...", True)
+        table.align["i"] = "r" # Left align city names
+        table.align["opcode"] = "r" # Left align city names
+        table.align["operand1"] = "r" # Left align city names
+        table.align["operand2"] = "r" # Left align city names
+        table.align["result"] = "r" # Left align city names
+        for quadruple in compile_result.quadruples:
+            table.add_row(quadruple)
 
-#   Read in file for processing...
-files = glob.glob("data/" + str(sys.argv[1]) + "/*.txt")
-no_errors = True
-for filename in files:
+        print(table)
+
+    if cache is not None:
+        problems = check_eviction()
+        if problems:
+            if no_errors:
+                print("Invalid Tests:")
+
+            no_errors = False
+            print("cache eviction:")
+            for problem in problems:
+                print("    " + problem)
+
+    if no_errors:
+        print("All Tests Passed!")
+
+
+#   Check Run
+#   Run the quadruples of an accepted program, returning a description of each way it did not behave as expected
+#
+#   filename - path to the C- program, next to its .in and .out files
+#   quadruples - quadruples of the program
+#   should_fail - True if the program must stop with a run time error
+def check_run(filename, quadruples, should_fail):
+    name = os.path.splitext(filename)[0]
+    inputs = [int(line) for line in read_lines(name + ".in") or []]
+    expected = read_lines(name + ".out")
+    problems = []
+
+    bytecode = Bytecode.from_quadruples(quadruples)
+    if bytecode.quadruples() != quadruples:
+        problems.append("quadruples changed when encoded as bytecode and decoded")
+    elif Bytecode.from_state(marshal.loads(marshal.dumps(bytecode.state()))).quadruples() != quadruples:
+        problems.append("quadruples changed when the state of their bytecode was stored and loaded")
+
+    printed = run_program(quadruples, inputs)
+    if expected is not None and printed != expected:
+        problems.append("printed " + ", ".join(printed) + " but expected " + ", ".join(expected))
+    if should_fail and not (printed and printed[-1].startswith("ERROR ")):
+        problems.append("ran without a run time error")
+
+    # each pass on its own, then every pass of each level in turn
+    optimizations = [(name, lambda function=function: function(quadruples)[0]) for name, function, level in PASSES]
+    optimizations += [("-O" + str(level), lambda level=level: Optimizer(level).optimize(quadruples)) for level in [1, 2]]
+    for name, optimize in optimizations:
+        optimized_printed = run_program(optimize(), inputs)
+        if optimized_printed != printed:
+            problems.append("printed " + ", ".join(optimized_printed) + " after " + name + " but " +
+                            ", ".join(printed) + " without it")
+
+    return problems
+
+
+#   Run Program
+#   Run quadruples in the VirtualMachine, returning what they printed, and "ERROR message" if they failed
+#
+#   inputs - values of the calls to input(), in turn
+def run_program(quadruples, inputs):
+    printed = []
+    values = iter(inputs)
+
+    def read():
+        for value in values:
+            return value
+        raise VMError("input() found no more input")
+
+    try:
+        VirtualMachine(quadruples, read, lambda value: printed.append(str(value)), RUN_STACK_SIZE).run()
+    except VMError as error:
+        # where the program stopped moves with the quadruples, so it is left out
+        printed.append("ERROR " + str(error).split(" at quadruple ")[0])
+
+    return printed
+
+
+#   Check Cache
+#   Compile a file again through the cache and without it, returning a description of each way the hit differs
+#
+#   compile_result - CompileResult of the file, once the batch has been through the cache
+#   scanner, input_mode, frontend, cache - options the batch was compiled with
+def check_cache(compile_result, scanner, input_mode, frontend, cache):
+    filename = compile_result.filename
+    cached = compile_file(filename, scanner, input_mode, frontend, cache)
+    fresh = compile_file(filename, scanner, input_mode, frontend)
 
-    file = open(filename, "r")
-    if not file:
-        util.error("File could not be loaded... Exiting...", True)
+    if not cached.cached:
+        return ["was not found in the cache once compiled"]
+    if cached.result != fresh.result:
+        return ["cached result " + str(cached.result) + " differs from " + str(fresh.result) + " compiled afresh"]
+    if cached.quadruples != fresh.quadruples:
+        return ["cached quadruples differ from those compiled afresh"]
+    if cached.diagnostics != fresh.diagnostics:
+        return ["cached diagnostics differ from those compiled afresh"]
 
-    lexical_analyzer = LexicalAnalyzer()
-    tokens = lexical_analyzer.process_file(file)
+    return []
 
-    if len(tokens) > 0:
-        tokens.reverse()
 
-    parser = Parser(tokens)
-    parse_result = parser.parse()
+#   Check Eviction
+#   Store three entries in a cache with room for two, returning a description of each way eviction went wrong
+#   The oldest entry is used again before evicting, so the entry stored second is the one to go.
+def check_eviction():
+    directory = tempfile.mkdtemp()
+    problems = []
 
-    should_fail = "-fail" in filename
-    error = False
+    try:
+        cache = CompileCache(directory)
+        keys = ["first", "second", "third"]
+        for age, key in enumerate(keys):
+            cache.store(key, CacheEntry("ACCEPT", "", [[1, "func", "main", "void", 0]], [], b""))
+            os.utime(cache.path(key), (age, age))
 
-    if should_fail and parse_result == "ACCEPT":
-        error = True
-    elif not should_fail and parse_result == "REJECT":
-        error = True
+        if cache.load("first") is None:
+            problems.append("an entry just stored was not found")
 
-    if error:
-        if no_errors:
-            print("Invalid Tests:")
+        cache.limit = 2 * os.path.getsize(cache.path("first"))
+        removed = cache.evict()
+        kept = sorted(name[:-len(ENTRY_SUFFIX)] for name in os.listdir(directory) if name.endswith(ENTRY_SUFFIX))
+        if removed != 1 or kept != ["first", "third"]:
+            problems.append("removed " + str(removed) + " entries, keeping " + ", ".join(kept) +
+                            ", rather than the least recently used")
+    finally:
+        shutil.rmtree(directory)
 
-        no_errors = False
-        print(filename + ": " + parse_result + "\n", end="")
+    return problems
 
-    table = PrettyTable(["i", "opcode", "operand1", "operand2", "result"])
 
-    table.align["i"] = "r" # Left align city names
-    table.align["opcode"] = "r" # Left align city names
-    table.align["operand1"] = "r" # Left align city names
-    table.align["operand2"] = "r" # Left align city names
-    table.align["result"] = "r" # Left align city names
-    for quadruple in parser.quadruples:
-        table.add_row(quadruple)
+#   Read Lines
+#   The lines of a file, without blank lines, or None if there is no such file
+def read_lines(filename):
+    if not os.path.exists(filename):
+        return None
 
-    print(table)
+    with open(filename) as file:
+        return [line.strip() for line in file if line.strip()]
 
-if no_errors:
-    print("All Tests Passed!")
 
+# files may be compiled in worker processes, which import this module without running it
+if __name__ == "__main__":
+    main()